@@ -0,0 +1,815 @@
+"""Assignment 2: Tests for Treemap
+
+=== Module description ===
+This module contains pytest tests for the tree classes in tm_trees.
+"""
+import os
+
+import pytest
+
+from tm_duplicates import find_duplicates
+from tm_layout import SquarifiedLayout
+from tm_shards import scan_sharded
+from tm_snapshot import get_snapshot_root, load_snapshot, save_snapshot
+from tm_store import CompactTree
+from tm_trees import TMTree, FileSystemTree, LazyFileSystemTree, \
+    iter_scan, scan_file_system
+
+DEEP = 100000            # The depth of the trees used for stress tests.
+
+
+class _Tree(TMTree):
+    """A concrete TMTree that is not backed by the file system."""
+
+    def get_separator(self) -> str:
+        """Returns the separator used between names in a path string."""
+        return '/'
+
+    def get_suffix(self) -> str:
+        """Returns the final descriptor of this tree."""
+        return ''
+
+
+def _make_chain(depth: int) -> TMTree:
+    """Returns a tree with a single leaf of size 10 at the given depth."""
+    tree = _Tree('leaf', [], 10)
+    for i in range(depth):
+        tree = _Tree(str(i), [tree])
+    return tree
+
+
+def _make_files(root: str) -> None:
+    """Create a small folder structure with files of different sizes."""
+    os.makedirs(os.path.join(root, 'a', 'b', 'c'))
+    os.makedirs(os.path.join(root, 'empty'))
+    for i, folder in enumerate(['', 'a', 'a/b', 'a/b/c']):
+        for j in range(3):
+            path = os.path.join(root, folder, f'f{j}.txt')
+            with open(path, 'w') as file:
+                file.write('x' * (i * 10 + j))
+
+
+def _assert_same_tree(tree1: FileSystemTree, tree2: FileSystemTree) -> None:
+    """Assert that both trees have the same names, paths, sizes, extension
+    counts and shape.
+    """
+    assert tree1._name == tree2._name
+    assert tree1._path == tree2._path
+    assert tree1.data_size == tree2.data_size
+    assert tree1._extensions == tree2._extensions
+    assert tree1._stamp == tree2._stamp
+    assert len(tree1._subtrees) == len(tree2._subtrees)
+    for sub1, sub2 in zip(tree1._subtrees, tree2._subtrees):
+        assert sub1._parent_tree is tree1
+        assert sub2._parent_tree is tree2
+        _assert_same_tree(sub1, sub2)
+
+
+def test_scan_file_system(tmp_path) -> None:
+    """scan_file_system builds the same tree as the constructor."""
+    _make_files(str(tmp_path))
+    for workers in [1, 4]:
+        _assert_same_tree(FileSystemTree(str(tmp_path)),
+                          scan_file_system(str(tmp_path), workers))
+    leaf = os.path.join(str(tmp_path), 'f2.txt')
+    _assert_same_tree(FileSystemTree(leaf), scan_file_system(leaf))
+
+
+def test_scan_sharded(tmp_path) -> None:
+    """A scan sharded across processes builds the same tree as the
+    constructor.
+    """
+    _make_files(str(tmp_path))
+    tree = scan_sharded(str(tmp_path), processes=2)
+    _assert_same_tree(tree, FileSystemTree(str(tmp_path)))
+    leaf = os.path.join(str(tmp_path), 'f2.txt')
+    _assert_same_tree(scan_sharded(leaf), FileSystemTree(leaf))
+
+
+def test_iter_scan(tmp_path) -> None:
+    """Every partial tree of a streaming scan keeps its sizes consistent, and
+    the final tree matches the constructor.
+    """
+    _make_files(str(tmp_path))
+    done = []
+    for progress in iter_scan(str(tmp_path), batch_size=1):
+        tree = progress.tree
+        assert progress.data_size == tree.data_size
+        assert tree.data_size == sum(sub.data_size for sub in tree._subtrees)
+        done.append(progress.done)
+    assert done == [False] * (len(done) - 1) + [True]
+    assert progress.entries == 17
+    _assert_same_tree(tree, FileSystemTree(str(tmp_path)))
+
+
+def test_snapshot_round_trip(tmp_path) -> None:
+    """A loaded snapshot matches the tree it was saved from."""
+    root = os.path.join(str(tmp_path), 'root')
+    os.mkdir(root)
+    _make_files(root)
+    snapshot = os.path.join(str(tmp_path), 'tree.snap')
+    save_snapshot(FileSystemTree(root), snapshot)
+    _assert_same_tree(FileSystemTree(root), load_snapshot(snapshot))
+
+
+def test_load_snapshot_rejects_other_files(tmp_path) -> None:
+    """load_snapshot raises ValueError for a file that is not a snapshot, or
+    a snapshot that was cut short.
+    """
+    path = os.path.join(str(tmp_path), 'not-a-snapshot')
+    with open(path, 'wb') as file:
+        file.write(b'x' * 100)
+    with pytest.raises(ValueError):
+        load_snapshot(path)
+
+    root = os.path.join(str(tmp_path), 'root')
+    os.mkdir(root)
+    _make_files(root)
+    save_snapshot(FileSystemTree(root), path)
+    assert get_snapshot_root(path) == root
+    with open(path, 'rb') as file:
+        data = file.read()
+    for cut in [1, 200, len(data) // 2]:
+        with open(path, 'wb') as file:
+            file.write(data[:-cut])
+        with pytest.raises(ValueError):
+            load_snapshot(path)
+
+
+def _touch_folder(path: str) -> None:
+    """Give the folder at <path> a modification time one second later, so the
+    change is seen even on file systems with coarse timestamps.
+    """
+    mtime = os.stat(path).st_mtime_ns + 10 ** 9
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_refresh(tmp_path) -> None:
+    """refresh rescans changed folders only and matches a fresh scan."""
+    root = str(tmp_path)
+    _make_files(root)
+    tree = FileSystemTree(root)
+    folder_b = _child(_child(tree, 'a'), 'b')
+    dropped = _child(_child(folder_b, 'c'), 'f1.txt')
+
+    with open(os.path.join(root, 'a', 'b', 'new.txt'), 'w') as file:
+        file.write('x' * 100)
+    os.remove(os.path.join(root, 'a', 'b', 'c', 'f1.txt'))
+    os.makedirs(os.path.join(root, 'empty', 'd'))
+    with open(os.path.join(root, 'empty', 'd', 'g.txt'), 'w') as file:
+        file.write('x' * 7)
+    for folder in ['a/b', 'a/b/c', 'empty']:
+        _touch_folder(os.path.join(root, folder))
+
+    assert tree.refresh() == 3
+    _assert_same_tree(tree, FileSystemTree(root))
+    assert tree.refresh() == 0
+
+    # A tree dropped by the rescan cannot be edited back into the tree
+    assert not dropped.delete_self()
+    dropped.move(folder_b)
+    dropped.change_size(1.0)
+    _assert_same_tree(tree, FileSystemTree(root))
+
+
+def test_lazy_file_system_tree(tmp_path) -> None:
+    """A lazy tree knows folder sizes up front and reads entries on expand."""
+    root = str(tmp_path)
+    _make_files(root)
+    tree = LazyFileSystemTree(root)
+    assert tree._subtrees == []
+    assert tree.data_size == FileSystemTree(root).data_size
+
+    tree.expand()
+    assert len(tree._subtrees) == 5
+    assert all(subtree._subtrees == [] for subtree in tree._subtrees)
+
+    tree.expand_all()
+    _assert_same_tree(tree, FileSystemTree(root))
+
+
+def test_deep_tree_without_recursion() -> None:
+    """Tree operations work on a tree deeper than the recursion limit."""
+    tree = _make_chain(DEEP)
+    tree.update_rectangles((0, 0, 100, 50))
+    tree.expand_all()
+    leaf = tree.get_tree_at_position((1, 1))
+    assert leaf._name == 'leaf'
+    assert tree.get_rectangles() == [((0, 0, 100, 50), leaf._colour)]
+
+    leaf.data_size = 30
+    assert tree.update_data_sizes() == 30
+    tree.update_depths()
+    assert leaf._depth == DEEP
+    assert len(tree.tree_traversal()) == DEEP
+    assert leaf.get_path_string().count('/') == DEEP
+
+    tree.collapse_all()
+    assert tree.get_tree_at_position((1, 1)) is tree
+
+
+def test_compact_tree_matches_tree(tmp_path) -> None:
+    """A CompactTree lays out, hit-tests and edits like the tree it copies."""
+    _make_files(str(tmp_path))
+    tree = FileSystemTree(str(tmp_path))
+    root = CompactTree.from_tree(tree).root()
+    for node in (tree, root):
+        node.update_rectangles((0, 0, 200, 100))
+        node.expand_all()
+    assert [rect for rect, _ in tree.get_rectangles()] == \
+        [rect for rect, _ in root.get_rectangles()]
+
+    leaf = tree.get_tree_at_position((150, 50))
+    handle = root.get_tree_at_position((150, 50))
+    assert handle is root.get_tree_at_position((150, 50))
+    assert handle.get_path_string() == leaf.get_path_string()
+    assert handle.get_full_path() == leaf.get_full_path()
+    assert handle.get_suffix() == leaf.get_suffix()
+
+    handle.change_size(0.5)
+    leaf.change_size(0.5)
+    assert root.data_size == tree.data_size
+    assert handle.get_parent().delete_self()
+    assert root.data_size == tree.data_size - leaf.get_parent().data_size
+
+
+def _assert_sizes_add_up(tree: TMTree) -> None:
+    """Asserts that the data_size of every folder in <tree> is the sum of
+    the sizes of its subtrees.
+    """
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node._subtrees:
+            assert node.data_size == sum(s.data_size for s in node._subtrees)
+        stack.extend(node._subtrees)
+
+
+def test_edits_keep_sizes_up_to_date(tmp_path) -> None:
+    """Edits update the sizes of all ancestors without update_data_sizes.
+    """
+    _make_files(str(tmp_path))
+    tree = FileSystemTree(str(tmp_path))
+    folder_c = tree._subtrees[[s._name for s in tree._subtrees].index('a')]
+    while folder_c._name != 'c':
+        folder_c = [s for s in folder_c._subtrees if s._subtrees][0]
+    leaf = folder_c._subtrees[0]
+    total = tree.data_size
+    size = leaf.data_size
+
+    leaf.change_size(1.0)
+    total += leaf.data_size - size
+    assert tree.data_size == total
+    _assert_sizes_add_up(tree)
+    leaf.move(tree)
+    assert leaf.get_parent() is tree
+    _assert_sizes_add_up(tree)
+    leaf.copy_paste(folder_c)
+    leaf.duplicate()
+    _assert_sizes_add_up(tree)
+    assert tree.data_size == total + 2 * leaf.data_size
+
+    for subtree in list(tree._subtrees):
+        assert subtree.delete_self()
+    assert tree._subtrees == [] and tree.data_size == 0
+
+
+def _child(tree: TMTree, name: str) -> TMTree:
+    """Returns the subtree of <tree> with the given name."""
+    tree._ensure_subtrees()
+    return [subtree for subtree in tree._subtrees if subtree._name == name][0]
+
+
+def _shape(tree: TMTree) -> tuple:
+    """Returns the names and sizes of <tree> and all trees under it, in
+    order, getting the subtrees of clones as they are needed.
+    """
+    tree._ensure_subtrees()
+    return (tree._name, tree.data_size,
+            sorted(_shape(subtree) for subtree in tree._subtrees))
+
+
+def test_clone_copies_on_write(tmp_path) -> None:
+    """A clone shares the subtrees of its source until either changes, and
+    never reads the file system.
+    """
+    _make_files(str(tmp_path))
+    tree = FileSystemTree(str(tmp_path))
+    folder_a = _child(tree, 'a')
+    shape = _shape(folder_a)
+    twin = folder_a.clone()
+    assert twin._subtrees == [] and twin in folder_a._clones
+    assert twin.get_parent() is None and twin._colour == folder_a._colour
+
+    # Edits under the source are not seen by the clone
+    folder_b = _child(folder_a, 'b')
+    _child(folder_b, 'f0.txt').delete_self()
+    _child(folder_b, 'f1.txt').change_size(1.0)
+    _assert_sizes_add_up(tree)
+    assert _shape(twin) == shape
+
+    # Edits under a clone are not seen by its source or its own clones
+    twin_b = _child(twin, 'b')
+    b_shape = _shape(twin_b)
+    copy_b = twin_b.clone()
+    _child(twin_b, 'c').delete_self()
+    assert _shape(copy_b) == b_shape
+    assert _child(folder_b, 'c').data_size == 30 + 31 + 32
+    _assert_sizes_add_up(twin)
+
+    # Copies are made in memory, even once the files are gone
+    for root, _, files in os.walk(str(tmp_path)):
+        for name in files:
+            os.remove(os.path.join(root, name))
+    tree._attach(twin)
+    leaf = _child(tree, 'f2.txt')
+    assert leaf.duplicate().data_size == leaf.data_size
+    leaf.copy_paste(twin)
+    assert twin._subtrees[-1]._name == 'f2.txt'
+    _assert_sizes_add_up(tree)
+
+
+def test_traversals_see_clone_contents(tmp_path) -> None:
+    """Traversals of a whole tree do not take a clone that still shares its
+    subtrees for a leaf.
+    """
+    root = os.path.join(str(tmp_path), 'root')
+    os.mkdir(root)
+    _make_files(root)
+    tree = FileSystemTree(root)
+    tree.update_colours_and_depths()
+    metrics = tree.get_metrics()
+
+    twin_metrics = tree.clone().get_metrics()
+    assert twin_metrics.node_count == metrics.node_count
+    assert twin_metrics.leaf_count == metrics.leaf_count
+    assert twin_metrics.depth_counts == metrics.depth_counts
+
+    twin = tree.clone()
+    twin.update_colours_and_depths()
+    assert twin.tree_traversal() == tree.tree_traversal()
+
+    snapshot = os.path.join(str(tmp_path), 'tree.snap')
+    save_snapshot(tree.clone(), snapshot)
+    _assert_same_tree(load_snapshot(snapshot), tree)
+
+    compact = CompactTree.from_tree(tree.clone()).root()
+    assert compact.data_size == tree.data_size
+    assert len(compact.find_leaves('*')) == metrics.leaf_count
+
+
+def test_edit_many_matches_single_edits(tmp_path) -> None:
+    """A batch of edits leaves the same tree as making them one by one, and
+    CompactNode deletes the same files.
+    """
+    _make_files(str(tmp_path))
+    trees = [FileSystemTree(str(tmp_path)) for _ in range(2)]
+    store = CompactTree.from_tree(trees[0]).root()
+    edits = []
+    for tree in trees:
+        folder_b = _child(_child(tree, 'a'), 'b')
+        edits.append(([_child(folder_b, 'f0.txt')],
+                      [(_child(tree, 'f0.txt'), folder_b)],
+                      [(_child(tree, 'f1.txt'), 0.5)]))
+
+    deletes, moves, resizes = edits[0]
+    assert trees[0].edit_many(deletes + trees[0].find_leaves('*2.txt'),
+                              moves, resizes) == 7
+    deletes, moves, resizes = edits[1]
+    for tree, factor in resizes:
+        tree.change_size(factor)
+    for tree, destination in moves:
+        tree.move(destination)
+    for tree in deletes + trees[1].find_leaves('*2.txt'):
+        tree.delete_self()
+    assert _shape(trees[0]) == _shape(trees[1])
+    _assert_sizes_add_up(trees[0])
+    assert trees[0].find_leaves('*2.txt') == []
+
+    assert store.edit_many(store.find_leaves('*2.txt')) == 4
+    assert store.data_size == FileSystemTree(str(tmp_path)).data_size \
+        - (2 + 12 + 22 + 32)
+
+
+def test_edit_many_moves_a_tree_once(tmp_path) -> None:
+    """A tree moved twice in one batch ends up under the last destination
+    only, and undoing the batch puts it back.
+    """
+    _make_files(str(tmp_path))
+    tree = FileSystemTree(str(tmp_path))
+    journal = tree.start_journal(1 << 20)
+    folder_a = _child(tree, 'a')
+    folder_b = _child(folder_a, 'b')
+    leaf = _child(tree, 'f2.txt')
+    shape = _shape(tree)
+    size = folder_a.data_size
+    assert tree.edit_many(delete=[_child(tree, 'f0.txt')] * 2,
+                          move=[(leaf, folder_a), (leaf, folder_b)]) == 2
+    assert leaf.get_parent() is folder_b
+    assert leaf not in folder_a._subtrees
+    assert folder_b._subtrees.count(leaf) == 1
+    assert folder_a.data_size == size + leaf.data_size
+    _assert_sizes_add_up(tree)
+    assert journal.undo()
+    assert leaf.get_parent() is tree
+    assert _shape(tree) == shape
+    _assert_sizes_add_up(tree)
+
+
+def test_journal_undoes_and_redoes_edits(tmp_path) -> None:
+    """Every kind of edit can be undone and redone in memory, the oldest
+    edits are dropped past the budget, and a rescan clears the journal.
+    """
+    root = str(tmp_path)
+    _make_files(root)
+    tree = FileSystemTree(root)
+    folder_a = _child(tree, 'a')
+    folder_b = _child(folder_a, 'b')
+    folder_c = _child(folder_b, 'c')
+    _child(folder_c, 'f1.txt').delete_self()
+    journal = tree.start_journal(1 << 20)
+    # Deleting the last files of c deletes c too, in the same edit
+    edits = [lambda: _child(folder_c, 'f0.txt').change_size(1.0),
+             lambda: _child(folder_c, 'f2.txt').delete_self(),
+             lambda: _child(folder_c, 'f0.txt').delete_self(),
+             lambda: _child(tree, 'f0.txt').move(folder_b),
+             lambda: _child(folder_a, 'f1.txt').duplicate(),
+             lambda: _child(folder_a, 'f2.txt').copy_paste(folder_b),
+             lambda: tree.edit_many(delete=tree.find_leaves('*2.txt'),
+                                    move=[(_child(tree, 'f1.txt'), folder_a)])]
+    shapes = [_shape(tree)]
+    for edit in edits:
+        edit()
+        shapes.append(_shape(tree))
+    _assert_sizes_add_up(tree)
+
+    assert folder_c not in folder_b._subtrees
+    for shape in reversed(shapes[:-1]):
+        assert journal.undo()
+        assert _shape(tree) == shape
+    assert not journal.undo()
+    _assert_sizes_add_up(tree)
+    while journal.redo():
+        pass
+    assert _shape(tree) == shapes[-1]
+
+    journal.budget = 0
+    _child(folder_a, 'f0.txt').change_size(1.0)
+    assert not journal.undo()
+
+    journal.budget = 1 << 20
+    _child(folder_a, 'f0.txt').change_size(1.0)
+    with open(os.path.join(root, 'new.txt'), 'w') as file:
+        file.write('x')
+    _touch_folder(root)
+    assert tree.refresh() == 1
+    assert not journal.undo()
+
+    store = CompactTree.from_tree(FileSystemTree(root)).root()
+    journal = store.start_journal(1 << 20)
+    size = store.data_size
+    store.edit_many(delete=store.find_leaves('*.txt'))
+    assert store.data_size == 0
+    assert journal.undo() and store.data_size == size
+
+
+def test_removed_trees_are_not_resized(tmp_path) -> None:
+    """Resizing a tree that was deleted, or a tree under one, leaves the
+    sizes of the tree it was removed from alone, in a CompactTree as well.
+    """
+    _make_files(str(tmp_path))
+    tree = FileSystemTree(str(tmp_path))
+    size = tree.data_size
+    leaf = _child(tree, 'f2.txt')
+    folder_b = _child(_child(tree, 'a'), 'b')
+    inner = _child(folder_b, 'f1.txt')
+    assert leaf.delete_self() and folder_b.delete_self()
+    size -= leaf.data_size + folder_b.data_size
+    leaf.change_size(1.0)
+    inner.change_size(1.0)
+    assert tree.data_size == size
+    _assert_sizes_add_up(tree)
+
+    root = CompactTree.from_tree(
+        _Tree('root', [_Tree('a', [], 3), _Tree('b', [], 5)])).root()
+    first, second = root.find_leaves('*')
+    assert first.delete_self() and not first.delete_self()
+    first.change_size(1.0)
+    assert root.data_size == 5
+    assert second.delete_self()
+    root.change_size(1.0)
+    assert root.data_size == 0
+
+
+def test_journal_counts_removed_trees() -> None:
+    """The nodes of the trees an edit removes count towards the budget, so
+    an edit that removes more than the budget allows cannot be undone.
+    """
+    big = _Tree('big', [_Tree(f'f{i}', [], 1) for i in range(1000)])
+    small = _Tree('small', [], 5)
+    tree = _Tree('root', [big, small])
+    journal = tree.start_journal(1 << 16)
+    small.delete_self()
+    assert journal.undo() and journal.redo()
+    big.delete_self()
+    assert journal._bytes <= journal.budget
+    assert not journal.undo()
+    assert tree._subtrees == [] and tree.data_size == 0
+
+
+def test_largest_follows_edits(tmp_path) -> None:
+    """The largest leaves and folders stay right after edits and undos, and
+    match those of a CompactTree.
+    """
+    _make_files(str(tmp_path))
+    tree = FileSystemTree(str(tmp_path))
+    journal = tree.start_journal(1 << 20)
+    folder_a = _child(tree, 'a')
+    folder_b = _child(folder_a, 'b')
+    folder_c = _child(folder_b, 'c')
+    assert [leaf.data_size for leaf in tree.largest(4)] == [32, 31, 30, 22]
+    assert tree.largest(3, folders=True) == [folder_a, folder_b, folder_c]
+    assert folder_a.largest(1, folders=True) == [folder_b]
+    assert [leaf.data_size for leaf in folder_c.largest(5)] == [32, 31, 30]
+
+    _child(folder_a, 'f0.txt').change_size(3.0)
+    folder_c.delete_self()
+    _child(folder_b, 'f2.txt').move(tree)
+    assert [leaf.data_size for leaf in tree.largest(3)] == [40, 22, 21]
+    assert [leaf.data_size for leaf in folder_b.largest(3)] == [21, 20]
+    assert folder_b.largest(1, folders=True) == []
+    assert journal.undo() and journal.undo()
+    assert [leaf.data_size for leaf in tree.largest(3)] == [40, 32, 31]
+    assert folder_b.largest(1, folders=True) == [folder_c]
+
+    store = CompactTree.from_tree(FileSystemTree(str(tmp_path))).root()
+    assert [leaf.data_size for leaf in store.largest(4)] == [32, 31, 30, 22]
+    store.largest(1)[0].delete_self()
+    assert [leaf.data_size for leaf in store.largest(2)] == [31, 30]
+
+
+def test_largest_under_small_and_large_folders() -> None:
+    """The largest leaves and folders under any folder match sorting them,
+    whether the folder holds few of the trees or most of them, and whether
+    its trees are the largest or the smallest ones.
+    """
+    folders = [_Tree(f'd{i}', [_Tree(f'f{j}', [], i * 20 + j + 1)
+                               for j in range(20)])
+               for i in range(100)]
+    low = _Tree('low', folders[:50])
+    high = _Tree('high', folders[50:])
+    tree = _Tree('root', [low, high])
+    tree.start_journal(1 << 20)
+    _child(folders[7], 'f3').change_size(1000.0)
+    _child(folders[60], 'f0').delete_self()
+    for folder in [tree, low, high, folders[7], folders[60]]:
+        sizes = sorted((leaf.data_size for leaf in folder.find_leaves('*')),
+                       reverse=True)
+        assert [leaf.data_size for leaf in folder.largest(3)] == sizes[:3]
+    assert low.largest(2, folders=True) == [folders[7], folders[49]]
+    assert folders[7].largest(1, folders=True) == []
+
+
+def test_extension_totals_follow_edits(tmp_path) -> None:
+    """The extension totals of every folder stay right after edits, undos
+    and copies.
+    """
+    root = str(tmp_path)
+    os.makedirs(os.path.join(root, 'src', 'lib'))
+    for path, size in [('README', 5), ('src/main.py', 10), ('src/notes.txt', 7),
+                       ('src/lib/util.PY', 20), ('src/lib/data.txt', 3)]:
+        with open(os.path.join(root, path), 'w') as file:
+            file.write('x' * size)
+    tree = FileSystemTree(root)
+    journal = tree.start_journal(1 << 20)
+    src = _child(tree, 'src')
+    lib = _child(src, 'lib')
+    assert tree.get_extension_totals('.py') == (30, 2)
+    assert tree.get_extension_totals('') == (5, 1)
+    assert lib.get_extensions() == {'.py': (20, 1), '.txt': (3, 1)}
+    assert _child(lib, 'util.PY').get_extension_totals('.Py') == (20, 1)
+
+    _child(lib, 'util.PY').change_size(1.0)
+    _child(src, 'notes.txt').move(lib)
+    _child(tree, 'README').delete_self()
+    assert tree.get_extensions() == {'.py': (50, 2), '.txt': (10, 2)}
+    assert src.get_extension_totals('.txt') == (10, 2)
+    assert lib.get_extension_totals('.txt') == (10, 2)
+
+    assert lib.clone().get_extensions() == lib.get_extensions()
+    _child(src, 'main.py').copy_paste(lib)
+    tree.edit_many(delete=[_child(lib, 'data.txt')])
+    assert src.get_extensions() == {'.py': (60, 3), '.txt': (7, 1)}
+    while journal.undo():
+        pass
+    _assert_same_tree(tree, FileSystemTree(root))
+
+
+def test_find_duplicates_reads_only_colliding_files(tmp_path) -> None:
+    """Files are duplicates only if their contents match, only the files
+    whose sizes and ends collide are read in full, and the reclaimable bytes
+    add up over the folders.
+    """
+    root = str(tmp_path)
+    os.makedirs(os.path.join(root, 'a', 'b'))
+    big = b'x' * 10000
+    files = [('a/big', big), ('a/b/big', big), ('big', big),
+             ('middle', big[:5000] + b'y' + big[5001:]),
+             ('a/small', b'small'), ('a/b/small', b'small'),
+             ('other', b'other'), ('empty1', b''), ('empty2', b'')]
+    for path, data in files:
+        with open(os.path.join(root, path), 'wb') as file:
+            file.write(data)
+    tree = FileSystemTree(root)
+    folder_a = _child(tree, 'a')
+    folder_b = _child(folder_a, 'b')
+
+    report = find_duplicates(tree, workers=2)
+    assert [[leaf.get_full_path()[len(root) + 1:] for leaf in group]
+            for group in report.groups] == \
+        [['big', 'a/big', 'a/b/big'], ['a/small', 'a/b/small']]
+    # Every file but the empty and unique-sized ones is read at its ends,
+    # and only the big ones in full
+    assert report.bytes_read == 4 * 8192 + 3 * 5 + 4 * 10000
+    assert report.get_reclaimable(tree) == 20005
+    assert report.get_reclaimable(folder_a) == 20005
+    assert report.get_reclaimable(folder_b) == 10005
+    assert report.get_reclaimable(_child(tree, 'big')) == 0
+    assert report.get_heat(folder_b) == 1.0
+
+    # Copies made in memory are the same file on disk
+    _child(folder_a, 'small').duplicate()
+    _child(tree, 'other').duplicate()
+    report = find_duplicates(tree, workers=2)
+    assert [len(group) for group in report.groups] == [3, 2]
+    assert report.get_reclaimable(tree) == 20005
+
+
+def test_path_strings_follow_moves() -> None:
+    """Cached path strings are built again for the trees that move, and
+    for trees that become subtrees of a new tree.
+    """
+    leaf = _Tree('leaf', [], 10)
+    assert leaf.get_path_string() == 'leaf'
+    a = _Tree('a', [leaf, _Tree('other', [], 5)])
+    b = _Tree('b', [_Tree('x', [], 1)])
+    root = _Tree('root', [a, b])
+    assert leaf.get_path_string() == 'root/a/leaf'
+    assert b._subtrees[0].get_path_string() == 'root/b/x'
+
+    leaf.move(b)
+    assert leaf.get_path_string() == 'root/b/leaf'
+    assert a.get_path_string() == 'root/a'
+    _Tree('top', [root])
+    assert leaf.get_path_string() == 'top/root/b/leaf'
+
+
+def test_metrics_and_colours() -> None:
+    """Metrics are gathered once, dropped on edits, and used to colour the
+    tree even when the root has a single subtree.
+    """
+    leaves = [_Tree('leaf1', [], 3), _Tree('leaf2', [], 4)]
+    tree = _Tree('root', [_Tree('a', [_Tree('b', leaves)])])
+    metrics = tree.get_metrics()
+    assert (metrics.max_depth, metrics.node_count, metrics.leaf_count) \
+        == (3, 5, 2)
+    assert metrics.depth_counts == [1, 1, 1, 2] and metrics.data_size == 7
+    assert tree.get_metrics() is metrics
+
+    tree.update_colours_and_depths()
+    assert tree.tree_traversal() == [('root', 0, (0, 0, 0)),
+                                     ('a', 1, (100, 100, 100)),
+                                     ('b', 2, (200, 200, 200))]
+
+    leaves[0].delete_self()
+    assert tree.get_metrics() is not metrics
+    assert tree.get_metrics().depth_counts == [1, 1, 1, 1]
+    assert tree.get_metrics().data_size == 4
+
+
+def test_squarified_layout_tiles_parent() -> None:
+    """The squarified layout exactly tiles every folder with its children,
+    with rectangles closer to squares than slice-and-dice gives.
+    """
+    sizes = [500, 433, 301, 250, 120, 61, 60, 0, 7, 1]
+    tree = _Tree('root', [_Tree(str(size), [], size) for size in sizes])
+    tree.update_rectangles((10, 20, 300, 170), SquarifiedLayout())
+    tree.expand_all()
+    rects = [subtree.rect for subtree in tree._subtrees]
+    assert rects.pop(sizes.index(0)) == (0, 0, 0, 0)
+    assert sum(width * height for _, _, width, height in rects) == 300 * 170
+    for i, (x, y, width, height) in enumerate(rects):
+        assert 10 <= x <= x + width <= 310 and 20 <= y <= y + height <= 190
+        for x2, y2, width2, height2 in rects[i + 1:]:
+            assert min(x + width, x2 + width2) <= max(x, x2) \
+                or min(y + height, y2 + height2) <= max(y, y2)
+    assert max(max(w, h) / min(w, h) for _, _, w, h in rects[:3]) < 2
+    x, y, width, height = rects[0]
+    assert tree.get_tree_at_position((x + width // 2, y + height // 2)) \
+        is tree._subtrees[0]
+
+
+def test_hit_index_keeps_shared_edge_rules() -> None:
+    """Indexed hit-testing returns the leftmost and topmost leaf on shared
+    edges, and nothing over the space left by subtrees with no size.
+    """
+    sizes = [3, 1, 0, 2, 5, 2, 0]
+    tree = _Tree('root', [_Tree(str(i), [], size)
+                          for i, size in enumerate(sizes)])
+    tree.expand()
+    for layout in (None, SquarifiedLayout()):
+        tree.update_rectangles((0, 0, 101, 7), layout)
+        for x in range(-1, 103):
+            for y in range(-1, 9):
+                expected = None
+                for subtree in tree._subtrees:
+                    left, top, width, height = subtree.rect
+                    if left < x <= left + width and top < y <= top + height:
+                        expected = subtree
+                        break
+                assert tree.get_tree_at_position((x, y)) is expected
+    assert tree._hit_index is not None
+
+
+def test_level_of_detail_culls_small_subtrees() -> None:
+    """Expanded subtrees below the minimum area are returned, drawn and
+    hit-tested as one rectangle, which still tiles the parent.
+    """
+    folders = [_Tree(str(i), [_Tree(f'{i}.{j}', [], 1) for j in range(100)])
+               for i in range(10)]
+    tree = _Tree('root', [_Tree('big', [], 10000)] + folders)
+    tree.update_rectangles((0, 0, 40, 30), SquarifiedLayout())
+    tree.expand_all()
+    root = CompactTree.from_tree(tree).root()
+    root.update_rectangles((0, 0, 40, 30), SquarifiedLayout())
+    root.expand_all()
+
+    rects = tree.get_rectangles(16)
+    assert rects == [(subtree.rect, subtree._colour)
+                     for subtree in tree._subtrees]
+    assert sum(w * h for (_, _, w, h), _ in rects) == 40 * 30
+    assert [rect for rect, _ in root.get_rectangles(16)] == \
+        [rect for rect, _ in rects]
+    buffers = tree.get_rectangle_buffers(None, 16)
+    assert list(buffers[0]) == [n for rect, _ in rects for n in rect]
+
+    x, y, width, height = folders[0].rect
+    centre = (x + width // 2 + 1, y + height // 2 + 1)
+    assert tree.get_tree_at_position(centre, 16) is folders[0]
+    assert folders[0].is_culled(16) and not folders[0].is_culled(0)
+    assert tree.get_tree_at_position(centre) in folders[0]._subtrees
+    handle = root.get_tree_at_position(centre, 16)
+    assert handle.get_path_string() == folders[0].get_path_string()
+    assert handle.is_culled(16)
+
+
+def test_rectangle_arrays_render_like_draw_rect() -> None:
+    """The rectangle arrays match get_rectangles, and the image rendered
+    from them fills each rectangle the way pygame.draw.rect does.
+    """
+    np = pytest.importorskip('numpy')
+    from tm_raster import get_rectangle_arrays, render_rectangles
+
+    tree = _Tree('root', [_make_chain(3), _Tree('b', [], 2),
+                          _Tree('c', [], 0)])
+    tree.update_rectangles((1, 2, 40, 30), SquarifiedLayout())
+    tree.expand_all()
+    rects, colours = get_rectangle_arrays(tree)
+    assert rects.dtype == np.int32 and colours.dtype == np.uint8
+    assert [(tuple(rect), tuple(colour)) for rect, colour
+            in zip(rects.tolist(), colours.tolist())] == tree.get_rectangles()
+
+    image = render_rectangles(rects, colours, 45, 35)
+    expected = np.zeros((35, 45, 3), dtype=np.uint8)
+    for (x, y, width, height), colour in tree.get_rectangles():
+        expected[y:y + height, x:x + width] = colour
+    assert (image == expected).all()
+
+
+def test_export_treemaps(tmp_path) -> None:
+    """Batch export writes one image of the requested size for every tree,
+    without opening a window.
+    """
+    pygame = pytest.importorskip('pygame')
+    from treemap_visualiser import export_treemaps
+
+    roots = []
+    for name in ['one', 'two']:
+        roots.append(os.path.join(str(tmp_path), name))
+        _make_files(roots[-1])
+    images = os.path.join(str(tmp_path), 'images')
+    os.mkdir(images)
+
+    for image_path in export_treemaps(roots, images, 'ppm', (40, 30),
+                                      workers=2):
+        with open(image_path, 'rb') as file:
+            data = file.read()
+        assert data.startswith(b'P6\n40 30\n255\n')
+        assert len(data) == len(b'P6\n40 30\n255\n') + 40 * 30 * 3
+    for image_path in export_treemaps(roots, images, 'png', (40, 30),
+                                      squarified=True, workers=2):
+        assert pygame.image.load(image_path).get_size() == (40, 30)
+
+
+if __name__ == '__main__':
+    pytest.main(['test_tm_trees.py'])
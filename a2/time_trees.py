@@ -0,0 +1,394 @@
+"""Assignment 2: Timing experiments for Treemap
+
+=== Module Description ===
+This module runs timing experiments comparing the ways a FileSystemTree can
+be built and laid out. Every experiment runs on a synthetic folder structure
+or tree, so the results do not depend on the machine's own files.
+"""
+import os
+import tempfile
+from array import array
+from timeit import timeit
+
+import pygame
+
+from tm_duplicates import _hash_file, find_duplicates
+from tm_layout import LayoutEngine, SliceAndDiceLayout, SquarifiedLayout
+from tm_raster import get_rectangle_arrays, render_rectangles
+from tm_shards import scan_sharded
+from tm_snapshot import load_snapshot, save_snapshot
+from tm_store import CompactTree
+from tm_trees import TMTree, FileSystemTree, scan_file_system
+from treemap_visualiser import export_treemaps
+
+FOLDER_FANOUT = 10                   # Sub-folders in every non-bottom folder.
+FILES_PER_FOLDER = 20                # Files in every folder.
+DEPTHS = [1, 2, 3]                   # Folder depths of the synthetic trees.
+WORKER_COUNTS = [1, 4, 16]           # Thread pool sizes to try.
+NODE_COUNTS = [10000, 100000, 1000000]  # Node counts of in-memory trees.
+LEAF_FANOUT = 100                    # Children of every folder in layouts.
+LEAF_COUNTS = [10000, 1000000]       # Leaf counts of the layout trees.
+SCREEN = (0, 0, 1200, 670)           # The treemap area of the visualiser.
+EDIT_COUNT = 20                      # Edits timed on every tree.
+VISIBLE_LEAVES = 500000              # Displayed leaves in render timings.
+FRAMES = 20                          # Frames timed for every renderer.
+MIN_AREAS = [0, 64, 256]             # Culling areas in render timings.
+EXPORT_ROOTS = 16                    # Folders exported in export timings.
+EXPORT_WORKERS = [1, 4]              # Process pool sizes to try.
+BATCH_PATTERN = 'file*7'             # Leaves deleted in batch edit timings.
+WIDE_FANOUT = 10000                  # Children of every folder in batch edits.
+UNDO_EDITS = 10000                   # Edits undone and redone in undo timings.
+TOP_COUNT = 10                       # Largest leaves found in query timings.
+HASH_WORKERS = [1, 4]                # Process pool sizes in duplicate timings.
+HASHED_FILES = 2000                  # Files of one size in duplicate timings.
+HASHED_SIZE = 1 << 16                # Bytes in every file in duplicate timings.
+COPY_EVERY = 10                      # One in this many files is a copy.
+SHARD_DEPTH = 4                      # Folder depth of the sharded scan tree.
+SHARD_FILES = 100                    # Files in every folder of that tree.
+PROCESS_COUNTS = [1, 4, 16]          # Process pool sizes in sharded scans.
+
+
+def make_directory(root: str, depth: int,
+                   files_per_folder: int = FILES_PER_FOLDER) -> int:
+    """Create a synthetic folder structure of the given depth inside <root>,
+    with <files_per_folder> files in every folder, and return the number of
+    files created.
+    """
+    count = 0
+    for i in range(files_per_folder):
+        with open(os.path.join(root, f'file{i}.txt'), 'w') as file:
+            file.write('x' * i)
+        count += 1
+    if depth > 0:
+        for i in range(FOLDER_FANOUT):
+            folder = os.path.join(root, f'folder{i}')
+            os.mkdir(folder)
+            count += make_directory(folder, depth - 1, files_per_folder)
+    return count
+
+
+def time_scan() -> None:
+    """Compare the FileSystemTree constructor against scan_file_system."""
+    for depth in DEPTHS:
+        with tempfile.TemporaryDirectory() as root:
+            files = make_directory(root, depth)
+            time = timeit(lambda: FileSystemTree(root), number=1)
+            print(f'constructor: {files:>7} files, time {time:.3f}')
+            for workers in WORKER_COUNTS:
+                time = timeit(lambda: scan_file_system(root, workers),
+                              number=1)
+                print(f'scandir ({workers:>2} threads): {files:>7} files, '
+                      f'time {time:.3f}')
+
+
+def time_sharded_scan() -> None:
+    """Compare scan_file_system against scanning every top-level folder in
+    a separate process, on a folder with over a million files.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        files = make_directory(root, SHARD_DEPTH, SHARD_FILES)
+        time = timeit(lambda: scan_file_system(root), number=1)
+        print(f'scandir: {files:>7} files, time {time:.3f}')
+        for processes in PROCESS_COUNTS:
+            time = timeit(lambda: scan_sharded(root, processes), number=1)
+            print(f'sharded ({processes:>2} processes): {files:>7} files, '
+                  f'time {time:.3f}')
+
+
+def time_snapshot() -> None:
+    """Compare scanning a folder against loading a snapshot of it."""
+    for depth in DEPTHS:
+        with tempfile.TemporaryDirectory() as root:
+            files = make_directory(root, depth)
+            snapshot = os.path.join(root, 'tree.snap')
+            save_snapshot(scan_file_system(root), snapshot)
+            time = timeit(lambda: scan_file_system(root), number=1)
+            print(f'scan: {files:>7} files, time {time:.3f}')
+            time = timeit(lambda: load_snapshot(snapshot), number=1)
+            print(f'load snapshot: {files:>7} files, time {time:.3f}')
+
+
+def make_flat_tree(node_count: int) -> tuple[str, array, array]:
+    """Return the NUL-separated names, breadth-first parent indices and leaf
+    sizes of a synthetic tree with <node_count> nodes, where every folder
+    has FILES_PER_FOLDER children.
+    """
+    names = ['root']
+    parents = array('i', [-1])
+    sizes = array('q', [0])
+    for i in range(1, node_count):
+        names.append(f'file{i}.txt')
+        parents.append((i - 1) // FILES_PER_FOLDER)
+        sizes.append(i % 1000 + 1)
+    for parent in set(parents[1:]):
+        sizes[parent] = 0
+    return '\0'.join(names), parents, sizes
+
+
+def time_compact_store() -> None:
+    """Report the build time and memory per node of a CompactTree."""
+    for count in NODE_COUNTS:
+        names, parents, sizes = make_flat_tree(count)
+        time = timeit(lambda: CompactTree(names, parents, sizes), number=1)
+        store = CompactTree(names, parents, sizes)
+        print(f'compact store: {count:>8} nodes, build time {time:.3f}, '
+              f'{store.bytes_per_node():.1f} bytes per node')
+
+
+def make_leaf_tree(leaf_count: int, fanout: int = LEAF_FANOUT) -> TMTree:
+    """Return an in-memory tree with <leaf_count> leaves of uneven sizes,
+    where every folder has <fanout> children.
+    """
+    level = [TMTree(f'file{i}', [], i * i % 9973 + 1)
+             for i in range(leaf_count)]
+    while len(level) > 1:
+        level = [TMTree('folder', level[i:i + fanout])
+                 for i in range(0, len(level), fanout)]
+    return level[0]
+
+
+def average_aspect_ratio(tree: TMTree) -> float:
+    """Return the average ratio of the longer to the shorter side of the
+    leaves of <tree> that take up at least one pixel.
+    """
+    total = 0.0
+    count = 0
+    for leaf in tree.get_rectangles():
+        _, _, width, height = leaf[0]
+        if width > 0 and height > 0:
+            total += max(width, height) / min(width, height)
+            count += 1
+    return total / count if count else 0.0
+
+
+def time_layout() -> None:
+    """Compare the layout time and the average aspect ratio of the leaves
+    for the slice-and-dice and squarified layouts.
+    """
+    layouts: list[LayoutEngine] = [SliceAndDiceLayout(), SquarifiedLayout()]
+    for count in LEAF_COUNTS:
+        tree = make_leaf_tree(count)
+        tree.expand_all()
+        for layout in layouts:
+            time = timeit(lambda: tree.update_rectangles(SCREEN, layout),
+                          number=1)
+            print(f'{type(layout).__name__}: {count:>8} leaves, '
+                  f'time {time:.3f}, '
+                  f'average aspect ratio {average_aspect_ratio(tree):.1f}')
+
+
+def time_edit() -> None:
+    """Compare the time from an edit to the rectangles of the next frame
+    when the whole tree is laid out again and when only dirty subtrees are.
+    """
+    tree = make_leaf_tree(LEAF_COUNTS[-1])
+    tree.expand_all()
+    tree.update_rectangles(SCREEN)
+    _, _, width, height = SCREEN
+    leaves = [tree.get_tree_at_position((width * i // EDIT_COUNT + 1,
+                                         height // 2))
+              for i in range(EDIT_COUNT)]
+    for name in ['update_rectangles', 'update_dirty_rectangles']:
+        def edit() -> None:
+            for leaf in leaves:
+                leaf.change_size(0.01)
+                getattr(tree, name)(SCREEN)
+                tree.get_rectangles()
+        time = timeit(edit, number=1) / len(leaves)
+        print(f'{name}: {LEAF_COUNTS[-1]:>8} leaves, '
+              f'edit to frame {time * 1000:.1f} ms')
+
+
+def time_edit_many() -> None:
+    """Compare deleting the leaves matching BATCH_PATTERN one at a time
+    against deleting them in one batch, each followed by one layout.
+    """
+    for name in ['delete_self', 'edit_many']:
+        tree = make_leaf_tree(LEAF_COUNTS[-1], WIDE_FANOUT)
+        tree.expand_all()
+        tree.update_rectangles(SCREEN)
+        leaves = tree.find_leaves(BATCH_PATTERN)
+
+        def edit() -> None:
+            if name == 'edit_many':
+                tree.edit_many(delete=leaves)
+            else:
+                for leaf in leaves:
+                    leaf.delete_self()
+            tree.update_dirty_rectangles(SCREEN)
+        time = timeit(edit, number=1)
+        print(f'{name}: {len(leaves):>8} deletes, time {time:.3f}')
+
+
+def time_undo() -> None:
+    """Report the time to undo and redo single edits, and the memory the
+    journal takes up per edit.
+    """
+    tree = make_leaf_tree(LEAF_COUNTS[-1])
+    journal = tree.start_journal(1 << 30)
+    leaves = tree.find_leaves('file*3')[:UNDO_EDITS]
+    for i, leaf in enumerate(leaves):
+        if i % 2:
+            leaf.delete_self()
+        else:
+            leaf.change_size(0.5)
+    for name in ['undo', 'redo']:
+        time = timeit(getattr(journal, name), number=len(leaves)) / len(leaves)
+        print(f'{name}: {LEAF_COUNTS[-1]:>8} leaves, '
+              f'time {time * 1000000:.1f} us per edit')
+    print(f'journal: {journal._bytes / len(leaves):.0f} bytes per edit')
+
+
+def time_largest() -> None:
+    """Compare finding the largest leaves by sorting all of them against
+    the size index, before and after edits.
+    """
+    tree = make_leaf_tree(LEAF_COUNTS[-1])
+    time = timeit(lambda: sorted(tree.find_leaves('*'),
+                                 key=lambda leaf: leaf.data_size)[-TOP_COUNT:],
+                  number=1)
+    print(f'sort leaves: {LEAF_COUNTS[-1]:>8} leaves, '
+          f'time {time * 1000:.1f} ms')
+    time = timeit(lambda: tree.largest(TOP_COUNT), number=1)
+    print(f'build size index: {LEAF_COUNTS[-1]:>8} leaves, '
+          f'time {time * 1000:.1f} ms')
+    for leaf in tree.find_leaves('file*3')[:UNDO_EDITS]:
+        leaf.change_size(0.5)
+    time = timeit(lambda: tree.largest(TOP_COUNT), number=FRAMES) / FRAMES
+    print(f'largest {TOP_COUNT} after {UNDO_EDITS} edits: '
+          f'{LEAF_COUNTS[-1]:>8} leaves, time {time * 1000:.3f} ms')
+    folder = tree
+    while folder._subtrees[0]._subtrees:
+        folder = folder._subtrees[0]
+        count = len(folder.find_leaves('*'))
+        time = timeit(lambda: folder.largest(TOP_COUNT),
+                      number=FRAMES) / FRAMES
+        print(f'largest {TOP_COUNT} in a folder: {count:>8} leaves, '
+              f'time {time * 1000:.3f} ms')
+
+
+def time_extension_totals() -> None:
+    """Compare summing the sizes of the .txt files under a scanned folder by
+    visiting its leaves against the extension totals kept by the scan.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        count = make_directory(root, DEPTHS[-1])
+        tree = scan_file_system(root)
+        time = timeit(lambda: sum(leaf.data_size
+                                  for leaf in tree.find_leaves('*.txt')),
+                      number=1)
+        print(f'sum .txt leaves: {count:>8} files, time {time * 1000:.1f} ms')
+        time = timeit(lambda: tree.get_extension_totals('.txt'),
+                      number=FRAMES) / FRAMES
+        print(f'.txt extension totals: {count:>8} files, '
+              f'time {time * 1000:.4f} ms')
+
+
+def time_duplicates() -> None:
+    """Compare hashing every file of a folder of same-sized files in full
+    against find_duplicates, which only reads the files whose first and last
+    bytes collide in full.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        for i in range(HASHED_FILES):
+            if i % COPY_EVERY != 1:
+                data = os.urandom(HASHED_SIZE)
+            with open(os.path.join(root, f'file{i}'), 'wb') as file:
+                file.write(data)
+        tree = scan_file_system(root)
+        paths = [leaf.get_full_path() for leaf in tree.find_leaves('*')]
+        time = timeit(lambda: [_hash_file(path) for path in paths], number=1)
+        print(f'hash every file: {HASHED_FILES:>8} files, '
+              f'{tree.data_size:>10} bytes read, time {time * 1000:.1f} ms')
+        for workers in HASH_WORKERS:
+            report = find_duplicates(tree, workers)
+            time = timeit(lambda: find_duplicates(tree, workers), number=1)
+            print(f'find duplicates ({workers:>2} processes): '
+                  f'{HASHED_FILES:>8} files, {report.bytes_read:>10} bytes '
+                  f'read, time {time * 1000:.1f} ms')
+
+
+def time_clone() -> None:
+    """Report the time to clone a whole tree, and to make the first edit
+    under it, which copies only the folders on the way to the edited leaf.
+    """
+    tree = make_leaf_tree(LEAF_COUNTS[-1])
+    twin = tree.clone()
+    time = timeit(tree.clone, number=1)
+    print(f'clone: {LEAF_COUNTS[-1]:>8} leaves, time {time * 1000:.3f} ms')
+    leaf = tree
+    while leaf._subtrees:
+        leaf = leaf._subtrees[0]
+    time = timeit(lambda: leaf.change_size(0.01), number=1)
+    print(f'first edit after clone: {LEAF_COUNTS[-1]:>8} leaves, '
+          f'time {time * 1000:.3f} ms, '
+          f'{len(twin._subtrees)} subtrees copied at the top')
+
+
+def time_render() -> None:
+    """Compare drawing every leaf with pygame.draw.rect against filling the
+    image from the rectangle arrays in bulk.
+    """
+    tree = make_leaf_tree(VISIBLE_LEAVES)
+    tree.expand_all()
+    tree.update_rectangles(SCREEN)
+    _, _, width, height = SCREEN
+    surface = pygame.Surface((width, height))
+
+    def draw() -> None:
+        for rect, colour in tree.get_rectangles():
+            pygame.draw.rect(surface, colour, rect)
+    time = timeit(draw, number=1)
+    print(f'draw.rect: {VISIBLE_LEAVES:>8} leaves, frame {time * 1000:.1f} ms')
+
+    time = timeit(lambda: get_rectangle_arrays(tree), number=1)
+    print(f'rectangle arrays: {VISIBLE_LEAVES:>8} leaves, '
+          f'time {time * 1000:.1f} ms')
+    rects, colours = get_rectangle_arrays(tree)
+    time = timeit(lambda: pygame.surfarray.blit_array(
+        surface, render_rectangles(rects, colours, width, height)
+        .transpose(1, 0, 2)), number=FRAMES) / FRAMES
+    print(f'render arrays: {VISIBLE_LEAVES:>8} leaves, '
+          f'frame {time * 1000:.1f} ms, {1 / time:.0f} fps')
+
+    for min_area in MIN_AREAS:
+        def draw_culled() -> None:
+            rects, colours = get_rectangle_arrays(tree, None, min_area)
+            pygame.surfarray.blit_array(surface, render_rectangles(
+                rects, colours, width, height).transpose(1, 0, 2))
+        time = timeit(draw_culled, number=1)
+        count = len(tree.get_rectangle_buffers(None, min_area)[1]) // 3
+        print(f'culled below {min_area:>2} pixels: {count:>8} rectangles, '
+              f'frame {time * 1000:.1f} ms')
+
+
+def time_export() -> None:
+    """Report the throughput of batch export with each process pool size."""
+    with tempfile.TemporaryDirectory() as root:
+        roots = []
+        for i in range(EXPORT_ROOTS):
+            roots.append(os.path.join(root, f'root{i}'))
+            os.mkdir(roots[-1])
+            make_directory(roots[-1], DEPTHS[1])
+        images = os.path.join(root, 'images')
+        os.mkdir(images)
+        for workers in EXPORT_WORKERS:
+            print(f'export ({workers:>2} processes): ', end='')
+            export_treemaps(roots, images, workers=workers)
+
+
+if __name__ == '__main__':
+    time_scan()
+    time_sharded_scan()
+    time_snapshot()
+    time_compact_store()
+    time_layout()
+    time_edit()
+    time_edit_many()
+    time_undo()
+    time_largest()
+    time_extension_totals()
+    time_duplicates()
+    time_clone()
+    time_render()
+    time_export()
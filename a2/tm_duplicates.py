@@ -0,0 +1,219 @@
+"""Assignment 2: Duplicate Files
+
+=== Module Description ===
+This module finds the files under a FileSystemTree that have the same
+contents, and how many bytes deleting the extra copies would free in every
+folder.
+
+Files are compared in rounds that each read more of them, and every round
+only reads the files that are still alike after the one before:
+    - files are grouped by the data_size stored in the tree, without reading
+      anything, and files of a size no other file has are dropped,
+    - the first and last _PARTIAL_SIZE bytes of the remaining files are
+      hashed, which is the whole file for files up to twice that long,
+    - the longer files whose ends still match are hashed in full.
+The hashing runs in a pool of processes, reading every file in chunks of
+_CHUNK_SIZE bytes, so that any file size takes the same memory.
+
+Leaves with the same path, such as copies made by TMTree.duplicate, stand for
+the same file: it is read once, and only the first of those leaves is put in
+a group, since deleting a copy made in memory frees nothing on disk. Hard
+links to one file are reported as copies of each other, since only the
+contents are compared.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from tm_trees import FileSystemTree, TMTree
+
+# The bytes hashed at each end of a file by the partial hash
+_PARTIAL_SIZE = 4096
+# The bytes read at a time by the full hash
+_CHUNK_SIZE = 1 << 20
+# The bytes in every digest
+_DIGEST_SIZE = 16
+# The paths sent to a worker at a time for partial hashing
+_PATHS_PER_TASK = 64
+
+
+class DuplicateReport:
+    """The files with the same contents found under a tree by
+    find_duplicates.
+
+    The report is not updated when the tree is edited afterwards.
+
+    === Public Attributes ===
+    groups: every group of two or more leaves, each with a different path,
+    with the same contents. The copy to keep is first in each group, and the
+    groups that free the most bytes come first.
+    bytes_read: the number of bytes read from disk to find the groups.
+
+    === Private Attributes ===
+    _reclaimable: the number of bytes freed under each tree by deleting every
+    copy but the first of each group, for the trees under which it is not 0.
+    """
+    groups: List[List[FileSystemTree]]
+    bytes_read: int
+    _reclaimable: Dict[TMTree, int]
+
+    def __init__(self, groups: List[List[FileSystemTree]],
+                 bytes_read: int) -> None:
+        """Initializes a report of the duplicate <groups>, each listing the
+        copy to keep first, found by reading <bytes_read> bytes.
+        """
+        groups.sort(key=lambda group: group[0].data_size * (len(group) - 1),
+                    reverse=True)
+        self.groups = groups
+        self.bytes_read = bytes_read
+        self._reclaimable = {}
+        for group in groups:
+            for leaf in group[1:]:
+                tree = leaf
+                while tree is not None:
+                    self._reclaimable[tree] = \
+                        self._reclaimable.get(tree, 0) + leaf.data_size
+                    tree = tree.get_parent()
+
+    def get_reclaimable(self, tree: TMTree) -> int:
+        """Returns the number of bytes freed under <tree> by deleting every
+        copy but the first of each group.
+        """
+        return self._reclaimable.get(tree, 0)
+
+    def get_heat(self, tree: TMTree) -> float:
+        """Returns the fraction of the data_size of <tree> that deleting the
+        extra copies would free, from 0.0 to 1.0.
+        """
+        if tree.data_size <= 0:
+            return 0.0
+        return min(self.get_reclaimable(tree) / tree.data_size, 1.0)
+
+
+def find_duplicates(tree: FileSystemTree,
+                    workers: Optional[int] = None) -> DuplicateReport:
+    """Returns the report of the files under <tree> that have the same
+    contents, hashed by a pool of <workers> processes (the
+    ProcessPoolExecutor default if None).
+
+    Empty files are never duplicates, since deleting them frees nothing.
+    Folders of a LazyFileSystemTree that have not been read yet are read,
+    and files that cannot be read are left out.
+    """
+    # The first leaf with each path, and the paths of each size
+    leaves: Dict[str, FileSystemTree] = {}
+    sizes: Dict[int, List[str]] = {}
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        node._ensure_subtrees()
+        if node._subtrees:
+            stack.extend(reversed(node._subtrees))
+        elif node._stamp is None and node.data_size > 0:
+            path = node.get_full_path()
+            if path not in leaves:
+                leaves[path] = node
+                sizes.setdefault(node.data_size, []).append(path)
+
+    classes = list(sizes.items())
+    bytes_read = 0
+    if any(len(paths) > 1 for _, paths in classes):
+        with ProcessPoolExecutor(workers) as pool:
+            classes, read = _refine(classes, pool, _hash_ends,
+                                    _PATHS_PER_TASK, 0)
+            bytes_read += read
+            # The partial digests of shorter files are already full digests
+            classes, read = _refine(classes, pool, _hash_file, 1,
+                                    2 * _PARTIAL_SIZE)
+            bytes_read += read
+
+    groups = []
+    for _, paths in classes:
+        if len(paths) > 1:
+            paths.sort(key=lambda p: (len(p), p))
+            groups.append([leaves[path] for path in paths])
+    return DuplicateReport(groups, bytes_read)
+
+
+def _refine(classes: List[Tuple[int, List[str]]], pool: ProcessPoolExecutor,
+            function: Callable[[str], Tuple[Optional[bytes], int]],
+            chunksize: int, min_size: int) \
+        -> Tuple[List[Tuple[int, List[str]]], int]:
+    """Splits every (size, paths) class of files of one size that has more
+    than one path, and a size over <min_size>, by the digest <function>
+    returns for each file, computed in <pool> with <chunksize> paths per
+    task. Returns the new classes and the number of bytes read.
+
+    Other classes are kept as they are. Files that cannot be read, for which
+    <function> returns no digest, are dropped.
+    """
+    work = [(size, path) for size, paths in classes
+            if len(paths) > 1 and size > min_size for path in paths]
+    # The largest files first, so that no worker is left with one at the end
+    work.sort(reverse=True)
+    paths = [path for _, path in work]
+    digests = {}
+    read = 0
+    for path, (digest, count) in zip(
+            paths, pool.map(function, paths, chunksize=chunksize)):
+        digests[path] = digest
+        read += count
+
+    refined = []
+    for size, paths in classes:
+        if len(paths) == 1 or size <= min_size:
+            refined.append((size, paths))
+            continue
+        split: Dict[bytes, List[str]] = {}
+        for path in paths:
+            digest = digests[path]
+            if digest is not None:
+                split.setdefault(digest, []).append(path)
+        refined.extend((size, paths) for paths in split.values())
+    return refined, read
+
+
+def _hash_ends(path: str) -> Tuple[Optional[bytes], int]:
+    """Returns the digest of the first and last _PARTIAL_SIZE bytes of the
+    file at <path>, or None if it cannot be read, and the number of bytes
+    read.
+
+    A file of up to 2 * _PARTIAL_SIZE bytes is read once from start to end,
+    so its digest is the one _hash_file returns.
+    """
+    try:
+        with open(path, 'rb') as file:
+            data = file.read(_PARTIAL_SIZE)
+            size = os.fstat(file.fileno()).st_size
+            if size > _PARTIAL_SIZE:
+                file.seek(max(size - _PARTIAL_SIZE, _PARTIAL_SIZE))
+                data += file.read(_PARTIAL_SIZE)
+    except OSError:
+        return None, 0
+    return hashlib.blake2b(data, digest_size=_DIGEST_SIZE).digest(), len(data)
+
+
+def _hash_file(path: str) -> Tuple[Optional[bytes], int]:
+    """Returns the digest of the whole file at <path>, read in chunks of up
+    to _CHUNK_SIZE bytes into one buffer, or None if it cannot be read, and
+    the number of bytes read.
+    """
+    digest = hashlib.blake2b(digest_size=_DIGEST_SIZE)
+    read = 0
+    try:
+        with open(path, 'rb', buffering=0) as file:
+            size = os.fstat(file.fileno()).st_size
+            buffer = bytearray(min(max(size, 1), _CHUNK_SIZE))
+            view = memoryview(buffer)
+            while True:
+                count = file.readinto(buffer)
+                if not count:
+                    break
+                digest.update(view[:count])
+                read += count
+    except OSError:
+        return None, read
+    return digest.digest(), read
@@ -0,0 +1,343 @@
+"""Assignment 2: Treemap Layouts
+
+=== Module Description ===
+This module contains the layout engines that decide how the rectangle of a
+tree is divided among its subtrees.
+
+Every engine keeps the same contract: each subtree gets an integer
+(x, y, width, height) rectangle with an area roughly proportional to its
+data_size, and the rectangles of the subtrees exactly tile the rectangle of
+their parent, without gaps or overlaps.
+"""
+from __future__ import annotations
+
+import math
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+
+class LayoutEngine:
+    """A way of dividing the rectangle of a tree among its subtrees.
+
+    This is an abstract class that should not be instantiated directly.
+    """
+
+    def split(self, rect: Tuple[int, int, int, int], sizes: List[int],
+              total: int) -> List[Tuple[int, int, int, int]]:
+        """Returns one rectangle inside <rect> for each of the <sizes>, in the
+        same order, where <total> is the sum of <sizes>.
+
+        Precondition: total > 0
+        """
+        raise NotImplementedError
+
+
+class SliceAndDiceLayout(LayoutEngine):
+    """The original treemap layout, which slices the rectangle of a tree
+    along its longer side into one strip per subtree.
+    """
+
+    def split(self, rect: Tuple[int, int, int, int], sizes: List[int],
+              total: int) -> List[Tuple[int, int, int, int]]:
+        """Returns one strip of <rect> for each of the <sizes>. Every strip but
+        the last has a length rounded down, and the last one takes what is
+        left.
+
+        Precondition: total > 0
+        """
+        x, y, width, height = rect
+        rects = []
+        if width > height:
+            curr_width = x
+            for i, size in enumerate(sizes):
+                if i != len(sizes) - 1:
+                    new_width = math.floor(size / total * width)
+                else:
+                    new_width = width + x - curr_width
+                rects.append((curr_width, y, new_width, height))
+                curr_width += new_width
+        else:
+            curr_height = y
+            for i, size in enumerate(sizes):
+                if i != len(sizes) - 1:
+                    new_height = math.floor(size / total * height)
+                else:
+                    new_height = height + y - curr_height
+                rects.append((x, curr_height, width, new_height))
+                curr_height += new_height
+        return rects
+
+
+class SquarifiedLayout(LayoutEngine):
+    """The squarified treemap layout of Bruls, Huizing and van Wijk, which
+    places the subtrees, largest first, in rows along the shorter side of the
+    remaining space, starting a new row whenever adding a subtree would make
+    the worst aspect ratio in the row worse.
+
+    The rows are computed with floating point edges, and every edge is then
+    rounded to the nearest pixel. Neighbouring rectangles round the same
+    shared edge, so the rectangles still exactly tile the parent.
+    """
+
+    def split(self, rect: Tuple[int, int, int, int], sizes: List[int],
+              total: int) -> List[Tuple[int, int, int, int]]:
+        """Returns the squarified rectangle inside <rect> for each of the
+        <sizes>. Subtrees with a size of 0 get an empty rectangle.
+
+        Precondition: total > 0
+        """
+        x, y, width, height = rect
+        rects = [(x, y, 0, 0)] * len(sizes)
+        order = sorted((i for i in range(len(sizes)) if sizes[i] > 0),
+                       key=lambda i: -sizes[i])
+        scale = width * height / total
+        areas = [sizes[i] * scale for i in order]
+
+        left, top = float(x), float(y)
+        right, bottom = float(x + width), float(y + height)
+        start = 0
+        while start < len(order):
+            end = self._row_end(areas, start, min(right - left, bottom - top))
+            row_area = sum(areas[start:end])
+            if right - left >= bottom - top:
+                # A column at the left of the remaining space.
+                edge = right if end == len(order) \
+                    else left + row_area / (bottom - top)
+                edges = self._edges(areas, start, end, top, bottom, row_area)
+                for k in range(start, end):
+                    rects[order[k]] = _snap(left, edges[k - start], edge,
+                                            edges[k - start + 1])
+                left = edge
+            else:
+                # A row at the top of the remaining space.
+                edge = bottom if end == len(order) \
+                    else top + row_area / (right - left)
+                edges = self._edges(areas, start, end, left, right, row_area)
+                for k in range(start, end):
+                    rects[order[k]] = _snap(edges[k - start], top,
+                                            edges[k - start + 1], edge)
+                top = edge
+            start = end
+        return rects
+
+    def _row_end(self, areas: List[float], start: int, side: float) -> int:
+        """Returns the index one past the last area of the row that starts at
+        <start> and is laid along a side of length <side>.
+        """
+        if side <= 0:
+            return len(areas)
+        row_area = low = high = areas[start]
+        worst = _worst_ratio(row_area, low, high, side)
+        end = start + 1
+        while end < len(areas):
+            area = areas[end]
+            new_worst = _worst_ratio(row_area + area, min(low, area),
+                                     max(high, area), side)
+            if new_worst > worst:
+                break
+            row_area += area
+            low = min(low, area)
+            high = max(high, area)
+            worst = new_worst
+            end += 1
+        return end
+
+    def _edges(self, areas: List[float], start: int, end: int, low: float,
+               high: float, row_area: float) -> List[float]:
+        """Returns the edges between the rectangles of areas[start:end] along
+        the side of a row that runs from <low> to <high>.
+        """
+        edges = [low]
+        curr = low
+        for k in range(start, end - 1):
+            curr += areas[k] / row_area * (high - low) if row_area else 0
+            edges.append(curr)
+        edges.append(high)
+        return edges
+
+
+def _worst_ratio(row_area: float, low: float, high: float,
+                 side: float) -> float:
+    """Returns the worst aspect ratio of a row with a total area <row_area>
+    laid along a side of length <side>, whose smallest and largest areas are
+    <low> and <high>.
+    """
+    side_squared = side * side
+    area_squared = row_area * row_area
+    return max(side_squared * high / area_squared,
+               area_squared / (side_squared * low))
+
+
+def _snap(left: float, top: float, right: float,
+          bottom: float) -> Tuple[int, int, int, int]:
+    """Returns the pixel rectangle with the given edges rounded to the
+    nearest integer.
+    """
+    x, y = round(left), round(top)
+    return x, y, round(right) - x, round(bottom) - y
+
+
+class HitIndex:
+    """An index of rectangles that tile a box, which finds the rectangle
+    containing a point in O(log n) time.
+
+    The box is split into strips: every strip is a column on the left or a
+    row at the top of what is left of the box, and is divided into
+    rectangles along its length. The parts of the box left before each strip
+    are nested, so the strip containing a point is found with a binary
+    search, and the rectangle inside the strip with another. The last strip
+    may stop short of the end of the box, and may be followed by an empty
+    part of the box, as slice-and-dice leaves behind subtrees with a size
+    of 0.
+
+    A rectangle contains a point (x, y) if left < x <= left + width and
+    top < y <= top + height, as in TMTree.get_tree_at_position, so a point
+    on the edge shared by two rectangles is in the leftmost or topmost one.
+
+    === Public Attributes ===
+    box: the box tiled by the rectangles.
+    count: the number of rectangles the index was built from, including
+    those with no area.
+
+    === Private Attributes ===
+    _lefts: the left edge of what is left of the box before each strip.
+    _tops: the top edge of what is left of the box before each strip.
+    _columns: whether each strip is a column rather than a row.
+    _starts: the coordinate where each rectangle in each strip starts along
+    the strip.
+    _ends: the coordinate where each strip ends along its length.
+    _items: the positions of the rectangles in each strip, in the list the
+    index was built from. The strip of an empty part of the box has none.
+    """
+    box: Tuple[int, int, int, int]
+    count: int
+    _lefts: List[int]
+    _tops: List[int]
+    _columns: List[bool]
+    _starts: List[List[int]]
+    _ends: List[int]
+    _items: List[List[int]]
+
+    def __init__(self, box: Tuple[int, int, int, int], count: int) -> None:
+        """Initializes an index of <count> rectangles tiling <box> with no
+        strips yet.
+        """
+        self.box = box
+        self.count = count
+        self._lefts = []
+        self._tops = []
+        self._columns = []
+        self._starts = []
+        self._ends = []
+        self._items = []
+
+    def find(self, pos: Tuple[int, int]) -> Optional[int]:
+        """Returns the position of the rectangle containing <pos>, or None if
+        no rectangle contains it.
+        """
+        x, y = pos
+        left, top, width, height = self.box
+        if not (left < x <= left + width and top < y <= top + height) \
+                or not self._items:
+            return None
+        # The last strip whose remaining box still contains <pos>.
+        low, high = 0, len(self._items) - 1
+        while low < high:
+            mid = (low + high + 1) // 2
+            if x > self._lefts[mid] and y > self._tops[mid]:
+                low = mid
+            else:
+                high = mid - 1
+        along = y if self._columns[low] else x
+        if not self._items[low] or along > self._ends[low]:
+            return None
+        return self._items[low][bisect_left(self._starts[low], along) - 1]
+
+    def _add_strip(self, left: int, top: int, is_column: bool,
+                   rects: List[Tuple[int, int, int, int]],
+                   strip: List[int], end: int) -> None:
+        """Adds the strip of the rectangles at positions <strip> in <rects>,
+        which ends at <end>, and starts at <left> and <top>.
+        """
+        self._lefts.append(left)
+        self._tops.append(top)
+        self._columns.append(is_column)
+        self._starts.append([rects[i][1 if is_column else 0] for i in strip])
+        self._ends.append(end)
+        self._items.append(strip)
+
+
+def make_hit_index(box: Tuple[int, int, int, int],
+                   rects: List[Tuple[int, int, int, int]]) \
+        -> Optional[HitIndex]:
+    """Returns a HitIndex of <rects> inside <box>, or None if the rectangles
+    with an area do not tile <box> in columns and rows, as the rectangles
+    laid out by SliceAndDiceLayout and SquarifiedLayout do.
+    """
+    corners: Dict[Tuple[int, int], int] = {}
+    for i, (x, y, width, height) in enumerate(rects):
+        if width > 0 and height > 0:
+            if (x, y) in corners:
+                return None
+            corners[x, y] = i
+
+    index = HitIndex(box, len(rects))
+    left, top, width, height = box
+    right, bottom = left + width, top + height
+    while corners:
+        # A strip that does not reach the end of the box must be the last.
+        is_column = True
+        walk = _walk(rects, corners, left, top, True)
+        if walk is None or walk[1] != bottom:
+            row = _walk(rects, corners, top, left, False)
+            if row is not None and (row[1] == right or walk is None
+                                    or len(row[0]) == len(corners)):
+                is_column = False
+                walk = row
+        if walk is None or walk[1] != (bottom if is_column else right) \
+                and len(walk[0]) != len(corners):
+            return None
+        strip, end = walk
+        index._add_strip(left, top, is_column, rects, strip, end)
+        for i in strip:
+            del corners[rects[i][0], rects[i][1]]
+        first = rects[strip[0]]
+        if is_column:
+            left = first[0] + first[2]
+        else:
+            top = first[1] + first[3]
+    if left < right and top < bottom:
+        index._add_strip(left, top, True, rects, [], top)
+    return index
+
+
+def _walk(rects: List[Tuple[int, int, int, int]],
+          corners: Dict[Tuple[int, int], int], edge: int, start: int,
+          is_column: bool) -> Optional[Tuple[List[int], int]]:
+    """Returns the positions of the rectangles that form a strip along
+    <edge> from <start>, and the coordinate where the strip ends, or None if
+    no rectangle starts there.
+
+    The strip is a column along the left edge at x = <edge> if <is_column>,
+    and a row along the top edge at y = <edge> otherwise. It stops before the
+    first rectangle that does not share the opposite edge of the first one.
+    """
+    strip = []
+    far_edge = None
+    curr = start
+    i = corners.get((edge, curr) if is_column else (curr, edge))
+    while i is not None:
+        x, y, width, height = rects[i]
+        rect_far_edge = x + width if is_column else y + height
+        if far_edge is None:
+            far_edge = rect_far_edge
+        elif rect_far_edge != far_edge:
+            break
+        strip.append(i)
+        curr += height if is_column else width
+        i = corners.get((edge, curr) if is_column else (curr, edge))
+    return (strip, curr) if strip else None
+
+
+# The layout used when no other layout is given.
+DEFAULT_LAYOUT = SliceAndDiceLayout()
@@ -0,0 +1,79 @@
+"""Assignment 2: Treemap Rasteriser
+
+=== Module Description ===
+This module turns the displayed leaves of a tree into NumPy arrays, and
+fills a whole image from those arrays at once instead of drawing one
+rectangle at a time.
+
+NumPy is only needed by this module; the visualiser falls back to drawing
+each rectangle with pygame when it cannot be imported.
+"""
+from __future__ import annotations
+
+from typing import Callable, Optional, Tuple, Union
+
+import numpy as np
+
+from tm_store import CompactNode
+from tm_trees import TMTree
+
+
+def get_rectangle_arrays(tree: Union[TMTree, CompactNode],
+                         area: Optional[Tuple[int, int, int, int]] = None,
+                         min_area: int = 0,
+                         colour_of: Optional[Callable] = None) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the leaves that tree.get_rectangles(<min_area>) would return,
+    in the same order, as an N x 4 int32 array of (x, y, width, height)
+    rectangles and an N x 3 uint8 array of colours. If <area> is given, only
+    the leaves that overlap it are returned, and if <colour_of> is given,
+    each leaf is coloured with colour_of(leaf).
+    """
+    rects, colours = tree.get_rectangle_buffers(area, min_area, colour_of)
+    return (np.frombuffer(rects, dtype=np.intc).astype(np.int32, copy=False)
+            .reshape(-1, 4),
+            np.frombuffer(colours, dtype=np.uint8).reshape(-1, 3))
+
+
+def render_rectangles(rects: np.ndarray, colours: np.ndarray, width: int,
+                      height: int) -> np.ndarray:
+    """Returns a height x width x 3 uint8 image of the <rects> filled with
+    their <colours> on black, as pygame.draw.rect would fill them.
+
+    Every colour is packed into one integer and spread over its rectangle
+    with a 2D difference array: each rectangle adds its colour at two
+    corners and subtracts it at the other two, and cumulative sums along
+    both axes fill in the area between them. The sums wrap around in int32,
+    which does not change the final colours.
+
+    Precondition: the rectangles do not overlap, as the displayed leaves of a
+    laid out tree do not.
+    """
+    x0 = rects[:, 0].clip(0, width)
+    y0 = rects[:, 1].clip(0, height)
+    x1 = (rects[:, 0] + rects[:, 2]).clip(0, width)
+    y1 = (rects[:, 1] + rects[:, 3]).clip(0, height)
+    # Rectangles with an area have distinct corners of each kind, so their
+    # colours can be added at each kind of corner with a single assignment.
+    visible = (x0 < x1) & (y0 < y1)
+    x0, y0, x1, y1 = x0[visible], y0[visible], x1[visible], y1[visible]
+    packed = np.zeros((len(x0), 4), dtype=np.uint8)
+    packed[:, :3] = colours[visible]
+    packed = packed.view('<i4').ravel()
+
+    # One spare row and column hold the corners on the far edges.
+    stride = width + 1
+    y0 *= stride
+    y1 *= stride
+    diff = np.zeros((height + 1) * stride, dtype='<i4')
+    diff[y0 + x0] += packed
+    diff[y0 + x1] -= packed
+    diff[y1 + x0] -= packed
+    diff[y1 + x1] += packed
+    image = diff.reshape(height + 1, stride)
+    np.cumsum(image, axis=0, out=image)
+    np.cumsum(image, axis=1, out=image)
+
+    # Each packed colour is laid out in memory as red, green, blue, 0.
+    pixels = image[:height, :width].view(np.uint8)
+    return pixels.reshape(height, width, 4)[:, :, :3]
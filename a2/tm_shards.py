@@ -0,0 +1,92 @@
+"""Assignment 2: Sharded Scans
+
+=== Module Description ===
+This module scans a folder with a pool of processes, one top-level folder
+per process. The threads of scan_file_system read folders in parallel, but
+the Python code that lists the entries of every folder runs in one thread at
+a time; separate processes run it in parallel.
+
+Every process scans one top-level folder as _scan_flat does and sends back
+its entries in the layout of a snapshot file instead of a pickled tree:
+    - the names of all entries as one string, separated by NUL characters,
+    - flat arrays with the index of every entry's parent (-1 for the shard's
+      folder), the size of every file (0 for folders), and the inode and
+      modification time of every folder (0 for files),
+    - one byte per entry that is 1 for folders and 0 for files.
+The parent process builds each shard's nodes while the other shards are
+still being scanned, and links them under the root.
+"""
+from __future__ import annotations
+
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import List, Optional, Tuple
+
+from tm_trees import FileSystemTree, _add_counts, _build_tree, _get_stamp, \
+    _read_directory, _scan_flat, scan_file_system
+
+# The entries of a scanned shard: names, parents, sizes, inodes,
+# modification times and folder flags
+_Shard = Tuple[str, array, array, array, array, bytes]
+
+
+def scan_sharded(my_path: str, processes: Optional[int] = None,
+                 workers: Optional[int] = None) -> FileSystemTree:
+    """Returns the same tree as scan_file_system(<my_path>), with every
+    folder directly in <my_path> scanned by one of a pool of <processes>
+    processes (the ProcessPoolExecutor default if None), each reading
+    folders with <workers> threads.
+
+    The shards are as large as the top-level folders, so a folder holding
+    most of the files under <my_path> is still scanned by one process.
+
+    Precondition: <my_path> is a valid path for this computer.
+    """
+    if not os.path.isdir(my_path):
+        return scan_file_system(my_path, workers)
+
+    root = FileSystemTree._make_node(my_path, os.path.basename(my_path), 0,
+                                     _get_stamp(os.stat(my_path)))
+    listing = _read_directory(my_path)
+    folders = [os.path.join(my_path, name)
+               for name, _, stamp in listing if stamp is not None]
+    with ProcessPoolExecutor(processes) as pool:
+        # Shards come back in the order of the listing
+        shards = pool.map(_scan_shard, folders, repeat(workers))
+        for name, size, stamp in listing:
+            path = os.path.join(my_path, name)
+            if stamp is None:
+                subtree = FileSystemTree._make_node(path, name, size, None)
+            else:
+                subtree = _build_tree(path, *_unpack_shard(next(shards)))
+            subtree._parent_tree = root
+            root._subtrees.append(subtree)
+            root.data_size += subtree.data_size
+            _add_counts(root._extensions, subtree._get_extension_counts(), 1)
+    return root
+
+
+def _scan_shard(my_path: str, workers: Optional[int]) -> _Shard:
+    """Scans the folder at <my_path> with <workers> threads as _scan_flat
+    does, and returns its entries packed into a _Shard.
+    """
+    names, parents, sizes, stamps = _scan_flat(my_path, workers)
+    return ('\0'.join(names), array('q', parents), array('q', sizes),
+            array('Q', [0 if stamp is None else stamp[0]
+                        for stamp in stamps]),
+            array('q', [0 if stamp is None else stamp[1]
+                        for stamp in stamps]),
+            bytes([stamp is not None for stamp in stamps]))
+
+
+def _unpack_shard(shard: _Shard) \
+        -> Tuple[List[str], array, array, List[Optional[Tuple[int, int]]]]:
+    """Returns the names, parent indices, sizes and folder stamps packed
+    into <shard>, as _scan_flat returns them.
+    """
+    names, parents, sizes, inodes, mtimes, folders = shard
+    stamps = [(inodes[i], mtimes[i]) if folders[i] else None
+              for i in range(len(folders))]
+    return names.split('\0'), parents, sizes, stamps
@@ -0,0 +1,171 @@
+"""Assignment 2: Treemap Snapshots
+
+=== Module Description ===
+This module saves a FileSystemTree to a compact binary snapshot file and
+loads it back without scanning the file system again.
+
+A snapshot stores the tree in breadth-first order as:
+    - a fixed-size header (see _HEADER),
+    - the full path of the root, encoded as UTF-8,
+    - a string table holding every node's name, separated by NUL bytes,
+    - a flat array with the index of every node's parent (-1 for the root),
+    - a flat array with the size of every leaf (0 for folders),
+    - flat arrays with the inode and modification time of every folder,
+    - one byte per node that is 1 for folders and 0 for files.
+Integers are stored as little-endian 64-bit values. The folder stamps let
+FileSystemTree.refresh bring a loaded snapshot up to date.
+"""
+from __future__ import annotations
+
+import mmap
+import struct
+import sys
+from array import array
+from typing import List, Optional, Tuple
+
+from tm_trees import FileSystemTree, _build_tree
+
+# magic, format version, node count, root path length, string table length
+_HEADER = struct.Struct('<8sIQQQ')
+_MAGIC = b'TMSNAP\r\n'
+_VERSION = 2
+_ENCODING = 'utf-8'
+_ERRORS = 'surrogateescape'
+
+
+def _flatten(tree: FileSystemTree) \
+        -> Tuple[List[str], array, array, List[Optional[Tuple[int, int]]]]:
+    """Returns the names, parent indices, leaf sizes and folder stamps of
+    every node in <tree>, in breadth-first order.
+    """
+    # Clones that still share their subtrees are copied, so that they are
+    # not taken for leaves
+    tree._ensure_copied()
+    names = [tree._name]
+    parents = array('q', [-1])
+    sizes = array('q', [0 if tree._subtrees else tree.data_size])
+    stamps = [tree._stamp]
+    nodes = [tree]
+    i = 0
+    while i < len(nodes):
+        for subtree in nodes[i]._subtrees:
+            subtree._ensure_copied()
+            names.append(subtree._name)
+            parents.append(i)
+            sizes.append(0 if subtree._subtrees else subtree.data_size)
+            stamps.append(subtree._stamp)
+            nodes.append(subtree)
+        i += 1
+    return names, parents, sizes, stamps
+
+
+def save_snapshot(tree: FileSystemTree, snapshot_path: str) -> None:
+    """Writes <tree> to a snapshot file at <snapshot_path>.
+    """
+    names, parents, sizes, stamps = _flatten(tree)
+    inodes = array('Q', [0 if stamp is None else stamp[0]
+                         for stamp in stamps])
+    mtimes = array('q', [0 if stamp is None else stamp[1]
+                         for stamp in stamps])
+    folders = bytes([stamp is not None for stamp in stamps])
+    root_path = tree.get_full_path().encode(_ENCODING, _ERRORS)
+    table = '\0'.join(names).encode(_ENCODING, _ERRORS)
+    if sys.byteorder == 'big':
+        for values in (parents, sizes, inodes, mtimes):
+            values.byteswap()
+
+    with open(snapshot_path, 'wb') as file:
+        file.write(_HEADER.pack(_MAGIC, _VERSION, len(names),
+                                len(root_path), len(table)))
+        file.write(root_path)
+        file.write(table)
+        for values in (parents, sizes, inodes, mtimes):
+            values.tofile(file)
+        file.write(folders)
+
+
+def get_snapshot_root(snapshot_path: str) -> str:
+    """Returns the full path of the root of the tree stored in the snapshot
+    file at <snapshot_path>, without reading the rest of the snapshot.
+
+    Raises ValueError if the file is not a snapshot in this format.
+    """
+    with open(snapshot_path, 'rb') as file:
+        header = file.read(_HEADER.size)
+        _, _, _, path_length, _ = _unpack_header(header, snapshot_path)
+        root_path = file.read(path_length)
+    if len(root_path) < path_length:
+        raise ValueError(f'{snapshot_path} is a truncated treemap snapshot')
+    return root_path.decode(_ENCODING, _ERRORS)
+
+
+def _unpack_header(data: bytes, snapshot_path: str) \
+        -> Tuple[bytes, int, int, int, int]:
+    """Returns the fields of the header at the start of <data>, read from the
+    file at <snapshot_path>.
+
+    Raises ValueError if <data> does not start with the header of a snapshot
+    in this format.
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError(f'{snapshot_path} is not a treemap snapshot')
+    fields = _HEADER.unpack_from(data)
+    if fields[0] != _MAGIC or fields[1] != _VERSION:
+        raise ValueError(f'{snapshot_path} is not a version {_VERSION} '
+                         f'treemap snapshot')
+    return fields
+
+
+def _read_snapshot(snapshot_path: str) \
+        -> Tuple[str, str, array, array, array, array, bytes]:
+    """Returns the root path, the NUL-separated names, and the parent, size,
+    inode, modification time and folder flag arrays stored in the snapshot
+    file at <snapshot_path>.
+
+    Raises ValueError if the file is not a snapshot in this format, or is
+    shorter than its header says.
+    """
+    with open(snapshot_path, 'rb') as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        _, _, count, path_length, table_length = \
+            _unpack_header(data, snapshot_path)
+        # Four arrays of 8-byte values and one byte of flags per node
+        if len(data) < _HEADER.size + path_length + table_length + 33 * count:
+            raise ValueError(
+                f'{snapshot_path} is a truncated treemap snapshot')
+
+        start = _HEADER.size
+        root_path = data[start:start + path_length].decode(_ENCODING, _ERRORS)
+        start += path_length
+        names = data[start:start + table_length].decode(_ENCODING, _ERRORS)
+        start += table_length
+
+        # The view is released before the mmap is closed, even on errors
+        with memoryview(data) as view:
+            arrays = []
+            for typecode in 'qqQq':
+                values = array(typecode)
+                values.frombytes(view[start:start + 8 * count])
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                arrays.append(values)
+                start += 8 * count
+            folders = bytes(view[start:start + count])
+
+    if names.count('\0') != count - 1:
+        raise ValueError(f'{snapshot_path} is a damaged treemap snapshot')
+    parents, sizes, inodes, mtimes = arrays
+    return root_path, names, parents, sizes, inodes, mtimes, folders
+
+
+def load_snapshot(snapshot_path: str) -> FileSystemTree:
+    """Returns the FileSystemTree stored in the snapshot file at
+    <snapshot_path>. Only the snapshot is read, never the scanned folders.
+
+    Raises ValueError if the file is not a snapshot in this format.
+    """
+    root_path, names, parents, sizes, inodes, mtimes, folders = \
+        _read_snapshot(snapshot_path)
+    stamps = [(inodes[i], mtimes[i]) if folders[i] else None
+              for i in range(len(folders))]
+    return _build_tree(root_path, names.split('\0'), parents, sizes, stamps)
@@ -0,0 +1,823 @@
+"""Assignment 2: Compact Tree Store
+
+=== Module Description ===
+This module contains a struct-of-arrays representation of a treemap tree for
+scans with millions of nodes, where one Python object per node costs too much
+memory.
+
+A CompactTree keeps every node's size, depth, parent, children, rectangle,
+colour and flags in typed arrays, and every name in one shared string. Nodes
+are stored in breadth-first order, so the children of a node are always a
+contiguous range of indices. CompactNode objects are thin handles on top of
+the store that provide the TMTree interface used by the visualiser; a handle
+is only created for a node when client code asks for it.
+
+The shape of a CompactTree is fixed when it is built: leaves can be resized
+and nodes deleted, but move, copy_paste and duplicate do nothing.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+import os
+from array import array
+from fnmatch import fnmatch
+from itertools import accumulate
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from tm_layout import DEFAULT_LAYOUT, HitIndex, LayoutEngine, \
+    make_hit_index
+from tm_snapshot import _read_snapshot
+from tm_trees import EditJournal, TMTree, _describe, _heap_order, \
+    _scan_flat
+
+
+def _random_colours(count: int) -> bytearray:
+    """Returns <count> random RGB colours as consecutive bytes, shifting any
+    colour that is close to the grey scale in the same way as get_colour.
+    """
+    colours = bytearray(os.urandom(3 * count))
+    for i in range(0, 3 * count, 3):
+        r, g, b = colours[i], colours[i + 1], colours[i + 2]
+        avg = (r + g + b) // 3
+        if abs(r - avg) < 20 and abs(g - avg) < 20 and abs(b - avg) < 20:
+            colours[i + 2] = (b + 150) % 255
+    return colours
+
+
+class CompactTree:
+    """An array-backed tree store.
+
+    === Private Attributes ===
+    _names: the names of all nodes, each followed by a NUL character.
+    _name_starts: the index in _names where the name of each node starts, and
+    one more entry for the end of _names.
+    _sizes: the data_size of each node.
+    _depths: the depth of each node, where the root has depth 0.
+    _parents: the index of the parent of each node, or -1 for the root.
+    _first_child: the index of the first child of each node.
+    _child_count: the number of children each node was built with.
+    _live_count: the number of children of each node that are not deleted.
+    _rects: the x, y, width and height of the rectangle of each node.
+    _colours: the red, green and blue values of the colour of each node.
+    _expanded: 1 for each node that is expanded, 0 otherwise.
+    _deleted: 1 for each node that was deleted, 0 otherwise.
+    _separator: the separator used between names in a path string.
+    _root_path: the full path of the root, or None if the tree is not backed
+    by the file system.
+    _handles: the handles created so far, keyed by node index.
+    _hit_indexes: the live children of each node and the HitIndex of their
+    rectangles, for the nodes hit-tested since they were last laid out.
+    _journal: the journal that edits to the store are recorded in, or None if
+    they are not recorded.
+    _size_heaps: the heaps of (-size, index) entries of the leaves and of the
+    folders, or None if they were not built. Sizes that change get new
+    entries, and the old ones are skipped.
+
+    === Representation Invariants ===
+    - Every array has one entry per node (three or four for _colours and
+      _rects), and the root is at index 0.
+    - The children of node i are the nodes with indices in
+      range(_first_child[i], _first_child[i] + _child_count[i]).
+    - If node i has live children, then _sizes[i] is the sum of their sizes.
+    """
+    _names: str
+    _name_starts: array
+    _sizes: array
+    _depths: array
+    _parents: array
+    _first_child: array
+    _child_count: array
+    _live_count: array
+    _rects: array
+    _colours: bytearray
+    _expanded: bytearray
+    _deleted: bytearray
+    _separator: str
+    _root_path: Optional[str]
+    _handles: Dict[int, CompactNode]
+    _hit_indexes: Dict[int, Tuple[List[int], Optional[HitIndex]]]
+    _journal: Optional[EditJournal]
+    _size_heaps: Optional[Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]]
+
+    def __init__(self, names: str, parents: array, sizes: array,
+                 separator: str = os.sep,
+                 root_path: Optional[str] = None) -> None:
+        """Initializes a store from the breadth-first <parents> and leaf
+        <sizes> of its nodes and their NUL-separated <names>, in the format
+        used by snapshot files. Folder sizes are computed from their leaves.
+
+        Precondition: the children of every node are contiguous in <parents>.
+        """
+        count = len(parents)
+        self._names = names + '\0'
+        self._name_starts = array('Q', [0])
+        self._name_starts.extend(
+            accumulate(len(name) + 1 for name in names.split('\0')))
+        self._parents = array('i', parents)
+        self._sizes = array('q', sizes)
+        self._depths = array('I', bytes(4 * count))
+        self._first_child = array('i', bytes(4 * count))
+        self._child_count = array('i', bytes(4 * count))
+        for i in range(1, count):
+            parent = self._parents[i]
+            if self._child_count[parent] == 0:
+                self._first_child[parent] = i
+            self._child_count[parent] += 1
+            self._depths[i] = self._depths[parent] + 1
+        for i in range(count - 1, 0, -1):
+            self._sizes[self._parents[i]] += self._sizes[i]
+
+        self._live_count = array('i', self._child_count)
+        self._rects = array('i', bytes(16 * count))
+        self._colours = _random_colours(count)
+        self._expanded = bytearray(count)
+        self._deleted = bytearray(count)
+        self._separator = separator
+        self._root_path = root_path
+        self._handles = {}
+        self._hit_indexes = {}
+        self._journal = None
+        self._size_heaps = None
+
+    @classmethod
+    def from_tree(cls, tree: TMTree) -> CompactTree:
+        """Returns a store holding a copy of <tree>.
+        """
+        tree._ensure_copied()
+        names = [tree._name]
+        parents = array('i', [-1])
+        sizes = array('q', [0 if tree._subtrees else tree.data_size])
+        nodes = [tree]
+        i = 0
+        while i < len(nodes):
+            for subtree in nodes[i]._subtrees:
+                subtree._ensure_copied()
+                names.append(subtree._name)
+                parents.append(i)
+                sizes.append(0 if subtree._subtrees else subtree.data_size)
+                nodes.append(subtree)
+            i += 1
+        try:
+            root_path = tree.get_full_path()
+        except NotImplementedError:
+            root_path = None
+        return cls('\0'.join(names), parents, sizes, tree.get_separator(),
+                   root_path)
+
+    @classmethod
+    def from_snapshot(cls, snapshot_path: str) -> CompactTree:
+        """Returns a store holding the tree in the snapshot file at
+        <snapshot_path>, without creating a Python object per node.
+        """
+        root_path, names, parents, sizes = _read_snapshot(snapshot_path)[:4]
+        return cls(names, parents, sizes, os.sep, root_path)
+
+    @classmethod
+    def from_scan(cls, my_path: str,
+                  workers: Optional[int] = None) -> CompactTree:
+        """Returns a store holding the file or folder at <my_path>, scanned
+        in the same way as scan_file_system.
+        """
+        names, parents, sizes, _ = _scan_flat(my_path, workers)
+        return cls('\0'.join(names), array('i', parents), array('q', sizes),
+                   os.sep, my_path)
+
+    def __len__(self) -> int:
+        """Returns the number of nodes in this store, including deleted ones.
+        """
+        return len(self._parents)
+
+    def bytes_per_node(self) -> float:
+        """Returns the memory used by the arrays and name table of this store,
+        divided by the number of nodes.
+        """
+        total = len(self._names.encode('utf-8', 'surrogateescape'))
+        for values in (self._name_starts, self._sizes, self._depths,
+                       self._parents, self._first_child, self._child_count,
+                       self._live_count, self._rects):
+            total += values.itemsize * len(values)
+        total += len(self._colours) + len(self._expanded) + len(self._deleted)
+        return total / len(self)
+
+    def root(self) -> CompactNode:
+        """Returns the handle of the root of this store.
+        """
+        return self._handle(0)
+
+    # **************************************************************************
+    # ******************** NODE OPERATIONS BY INDEX ****************************
+    # **************************************************************************
+    def _handle(self, i: int) -> CompactNode:
+        """Returns the handle of node <i>, creating it the first time.
+        """
+        handle = self._handles.get(i)
+        if handle is None:
+            handle = CompactNode(self, i)
+            self._handles[i] = handle
+        return handle
+
+    def _children(self, i: int) -> List[int]:
+        """Returns the indices of the children of node <i> that are not
+        deleted.
+        """
+        first = self._first_child[i]
+        return [child for child in range(first, first + self._child_count[i])
+                if not self._deleted[child]]
+
+    def _name(self, i: int) -> str:
+        """Returns the name of node <i>.
+        """
+        return self._names[self._name_starts[i]:self._name_starts[i + 1] - 1]
+
+    def _rect(self, i: int) -> Tuple[int, int, int, int]:
+        """Returns the rectangle of node <i>.
+        """
+        return tuple(self._rects[4 * i:4 * i + 4])
+
+    def _colour(self, i: int) -> Tuple[int, int, int]:
+        """Returns the colour of node <i>.
+        """
+        return tuple(self._colours[3 * i:3 * i + 3])
+
+    def _update_rectangles(self, i: int, rect: Tuple[int, int, int, int],
+                           layout: Optional[LayoutEngine] = None) -> None:
+        """Lays out node <i> and its descendants to fill <rect>, in the same
+        way as TMTree.update_rectangles.
+        """
+        if layout is None:
+            layout = DEFAULT_LAYOUT
+        rects = self._rects
+        sizes = self._sizes
+        stack = [(i, rect)]
+        while stack:
+            i, rect = stack.pop()
+            self._hit_indexes.pop(i, None)
+            if sizes[i] == 0:
+                rects[4 * i:4 * i + 4] = array('i', (0, 0, 0, 0))
+                continue
+            rects[4 * i:4 * i + 4] = array('i', rect)
+            children = self._children(i)
+            if children:
+                stack.extend(zip(children, layout.split(
+                    rect, [sizes[child] for child in children], sizes[i])))
+
+    def _get_rectangles(self, i: int, min_area: int = 0) \
+            -> List[Tuple[Tuple[int, int, int, int], Tuple[int, int, int]]]:
+        """Returns the rectangle and colour of every leaf in the displayed
+        tree rooted at node <i>, as TMTree.get_rectangles does.
+        """
+        return [(self._rect(j), self._colour(j))
+                for j in self._leaves(i, None, min_area)]
+
+    def _get_rectangle_buffers(
+            self, i: int, area: Optional[Tuple[int, int, int, int]],
+            min_area: int = 0,
+            colour_of: Optional[Callable[[CompactNode], Tuple[int, int, int]]]
+            = None) -> Tuple[array, bytearray]:
+        """Returns the rectangles and colours of the leaves that
+        _get_rectangles returns, flattened into an array of four ints and a
+        bytearray of three bytes per leaf. If <area> is given, only the
+        leaves overlapping it are returned, and if <colour_of> is given,
+        each leaf is coloured with colour_of(leaf).
+        """
+        rects = array('i')
+        colours = bytearray()
+        for j in self._leaves(i, area, min_area):
+            rects.extend(self._rects[4 * j:4 * j + 4])
+            if colour_of is None:
+                colours.extend(self._colours[3 * j:3 * j + 3])
+            else:
+                colours.extend(colour_of(self._handle(j)))
+        return rects, colours
+
+    def _leaves(self, i: int,
+                area: Optional[Tuple[int, int, int, int]] = None,
+                min_area: int = 0) -> List[int]:
+        """Returns the indices of the leaves in the displayed tree rooted at
+        node <i>, in the order TMTree.get_rectangles lists them. If <area>
+        is given, only the leaves overlapping it are returned. Nodes culled
+        with <min_area> count as leaves.
+        """
+        leaves = []
+        stack = [i]
+        while stack:
+            i = stack.pop()
+            if self._sizes[i] == 0:
+                continue
+            if area is not None:
+                x, y, width, height = self._rects[4 * i:4 * i + 4]
+                if not (x < area[0] + area[2] and area[0] < x + width
+                        and y < area[1] + area[3] and area[1] < y + height):
+                    continue
+            if not self._expanded[i] or self._is_culled(i, min_area):
+                leaves.append(i)
+            else:
+                stack.extend(reversed(self._children(i)))
+        return leaves
+
+    def _get_tree_at_position(self, i: int, pos: Tuple[int, int],
+                              min_area: int = 0) -> Optional[int]:
+        """Returns the index of the displayed leaf under node <i> containing
+        <pos>, using the same edge rules as TMTree.get_tree_at_position.
+        """
+        if not self._contains(i, pos):
+            return None
+        while self._expanded[i] and self._live_count[i] \
+                and not self._is_culled(i, min_area):
+            i = self._get_child_at_position(i, pos)
+            if i is None:
+                return None
+        return i
+
+    def _get_child_at_position(self, i: int,
+                               pos: Tuple[int, int]) -> Optional[int]:
+        """Returns the index of the first live child of node <i> whose
+        rectangle contains <pos>, or None if there is no such child, using a
+        HitIndex as TMTree does.
+        """
+        rect = self._rect(i)
+        children, index = self._hit_indexes.get(i, ([], None))
+        if index is None or index.box != rect \
+                or index.count != self._live_count[i]:
+            children = self._children(i)
+            index = make_hit_index(rect, [self._rect(c) for c in children])
+            self._hit_indexes[i] = (children, index)
+        if index is not None:
+            k = index.find(pos)
+            if k is None:
+                return None
+            if self._contains(children[k], pos):
+                return children[k]
+
+        for child in self._children(i):
+            if self._contains(child, pos):
+                return child
+        return None
+
+    def _is_culled(self, i: int, min_area: int) -> bool:
+        """Returns whether node <i> is expanded but covers fewer than
+        <min_area> pixels, as TMTree.is_culled does.
+        """
+        return bool(self._expanded[i]) and self._live_count[i] > 0 \
+            and self._rects[4 * i + 2] * self._rects[4 * i + 3] < min_area
+
+    def _contains(self, i: int, pos: Tuple[int, int]) -> bool:
+        """Returns whether the rectangle of node <i> contains <pos>."""
+        x, y = pos
+        left, top, width, height = self._rects[4 * i:4 * i + 4]
+        return left < x <= left + width and top < y <= top + height
+
+    def _update_ancestors(self, i: int, delta: int) -> None:
+        """Adds <delta> to the size of node <i> and all its ancestors, and
+        pushes their new sizes onto the size heaps, if they were built.
+        """
+        heaps = self._size_heaps if delta else None
+        while i != -1:
+            self._sizes[i] += delta
+            if heaps is not None:
+                heapq.heappush(heaps[self._child_count[i] > 0],
+                               (-self._sizes[i], i))
+            i = self._parents[i]
+        # Most entries are out of date once there are twice as many as nodes
+        if heaps is not None \
+                and len(heaps[0]) + len(heaps[1]) > 2 * len(self) + 64:
+            self._build_size_heaps()
+
+    def _build_size_heaps(self) -> None:
+        """Builds the size heaps from the current sizes of all nodes.
+        """
+        heaps = ([], [])
+        for i, size in enumerate(self._sizes):
+            heaps[self._child_count[i] > 0].append((-size, i))
+        for heap in heaps:
+            heapq.heapify(heap)
+        self._size_heaps = heaps
+
+    def _largest(self, i: int, n: int, folders: bool) -> List[int]:
+        """Returns the <n> largest live leaves, or folders if <folders> is
+        True, under node <i>, largest first.
+        """
+        if self._size_heaps is None:
+            self._build_size_heaps()
+        found = []
+        for size, j in _heap_order(self._size_heaps[folders]):
+            if len(found) == n:
+                break
+            if -size == self._sizes[j] and j != i and j not in found \
+                    and self._is_under(j, i):
+                found.append(j)
+        return found
+
+    def _is_under(self, j: int, i: int) -> bool:
+        """Returns whether node <j> is under node <i>, with neither it nor any
+        node in between deleted.
+        """
+        while j != i:
+            if j == -1 or self._deleted[j]:
+                return False
+            j = self._parents[j]
+        return True
+
+    def _update_data_sizes(self, i: int) -> int:
+        """Recomputes the size of node <i> and its descendants from their
+        leaves, and returns the new size of node <i>.
+        """
+        nodes = [i]
+        j = 0
+        while j < len(nodes):
+            nodes.extend(self._children(nodes[j]))
+            j += 1
+        for node in reversed(nodes):
+            if self._live_count[node]:
+                self._sizes[node] = sum(self._sizes[child]
+                                        for child in self._children(node))
+        return self._sizes[i]
+
+    def _change_size(self, i: int, factor: float) -> Optional[tuple]:
+        """Resizes leaf <i> by <factor> as TMTree.change_size does, updates
+        the sizes of its ancestors, and returns the step that undoes this, or
+        None if nothing changed. Does nothing for folders, even once all
+        their children are deleted, or for deleted nodes.
+        """
+        if self._child_count[i] or not self._is_live(i):
+            return None
+        data_size = self._sizes[i]
+        change = 0
+        if factor > 0:
+            change = math.ceil(data_size * factor)
+        elif factor < 0:
+            change = math.floor(data_size * factor)
+        delta = max(data_size + change, 1) - data_size
+        return self._shift_size(i, delta) if delta else None
+
+    def _shift_size(self, i: int, delta: int) -> tuple:
+        """Adds <delta> to the size of node <i> and all its ancestors, and
+        returns the step that subtracts it again, as TMTree steps do.
+        """
+        self._update_ancestors(i, delta)
+        return CompactTree._shift_size, self, i, -delta
+
+    def _delete(self, i: int) -> bool:
+        """Deletes node <i>, and any ancestors left without children, and
+        returns whether anything was deleted. The root cannot be deleted.
+        """
+        if self._parents[i] == -1:
+            return False
+        while self._parents[i] != -1:
+            parent = self._parents[i]
+            self._deleted[i] = 1
+            self._live_count[parent] -= 1
+            self._update_ancestors(parent, -self._sizes[i])
+            if self._live_count[parent]:
+                break
+            i = parent
+        return True
+
+    def _undelete(self, i: int) -> tuple:
+        """Restores node <i>, which was deleted by _delete(i), and the
+        ancestors deleted with it, and returns the step that deletes them
+        again.
+        """
+        # The ancestors were deleted once empty, so they are restored first
+        chain = []
+        while self._deleted[i]:
+            chain.append(i)
+            i = self._parents[i]
+        for j in reversed(chain):
+            parent = self._parents[j]
+            self._deleted[j] = 0
+            self._live_count[parent] += 1
+            self._update_ancestors(parent, self._sizes[j])
+        return CompactTree._redelete, self, chain[0]
+
+    def _redelete(self, i: int) -> tuple:
+        """Deletes node <i> again after _undelete(i), and returns the step
+        that restores it.
+        """
+        self._delete(i)
+        return CompactTree._undelete, self, i
+
+    def _is_live(self, i: int) -> bool:
+        """Returns whether neither node <i> nor any of its ancestors is
+        deleted.
+        """
+        while i != -1:
+            if self._deleted[i]:
+                return False
+            i = self._parents[i]
+        return True
+
+    def _record(self, steps: List[tuple]) -> None:
+        """Records the <steps> that undo an edit in the journal of this store,
+        if it has one.
+        """
+        if self._journal is not None:
+            self._journal.record(steps)
+
+    def _expand(self, i: int) -> None:
+        """Expands node <i> and its ancestors, unless node <i> is a leaf.
+        """
+        if not self._live_count[i]:
+            self._expanded[i] = 0
+            return
+        while i != -1:
+            self._expanded[i] = 1
+            i = self._parents[i]
+
+    def _set_expanded(self, i: int, value: int) -> None:
+        """Sets the expanded flag of node <i> and all its descendants that are
+        not leaves to <value>.
+        """
+        stack = [i]
+        while stack:
+            i = stack.pop()
+            self._expanded[i] = value if self._live_count[i] else 0
+            stack.extend(self._children(i))
+
+    def _update_colours_and_depths(self, i: int) -> None:
+        """Colours the folders under node <i> in shades of grey by depth,
+        as TMTree.update_colours_and_depths does.
+        """
+        base = self._depths[i]
+        nodes = [i]
+        max_depth = 0
+        j = 0
+        while j < len(nodes):
+            max_depth = max(max_depth, self._depths[nodes[j]] - base)
+            nodes.extend(self._children(nodes[j]))
+            j += 1
+        step = 200 // max(max_depth - 1, 1)
+        for node in nodes:
+            if self._live_count[node]:
+                colour = (self._depths[node] - base) * step
+                self._colours[3 * node:3 * node + 3] = \
+                    bytes((colour, colour, colour))
+
+    def _get_path_string(self, i: int) -> str:
+        """Returns the names from the root to node <i>, joined by the
+        separator.
+        """
+        names = []
+        while i != -1:
+            names.append(self._name(i))
+            i = self._parents[i]
+        names.reverse()
+        return self._separator.join(names)
+
+
+class CompactNode:
+    """A handle to one node of a CompactTree, with the methods of TMTree that
+    the visualiser uses.
+
+    === Private Attributes ===
+    _store: the store holding this node.
+    _index: the index of this node in the store.
+    """
+    __slots__ = ('_store', '_index')
+    _store: CompactTree
+    _index: int
+
+    def __init__(self, store: CompactTree, index: int) -> None:
+        """Initializes a handle to node <index> of <store>. Use
+        CompactTree.root and the methods of other handles to get handles, so
+        that each node has only one.
+        """
+        self._store = store
+        self._index = index
+
+    @property
+    def rect(self) -> Tuple[int, int, int, int]:
+        """The rectangle of this node in the visualization.
+        """
+        return self._store._rect(self._index)
+
+    @property
+    def data_size(self) -> int:
+        """The size of the data represented by this node.
+        """
+        return self._store._sizes[self._index]
+
+    def is_empty(self) -> bool:
+        """Returns False, since a store never holds an empty tree.
+        """
+        return False
+
+    def get_parent(self) -> Optional[CompactNode]:
+        """Returns the parent of this node.
+        """
+        parent = self._store._parents[self._index]
+        return None if parent == -1 else self._store._handle(parent)
+
+    def update_rectangles(self, rect: Tuple[int, int, int, int],
+                          layout: Optional[LayoutEngine] = None) -> None:
+        """Updates the rectangles of this node and its descendants to fill
+        <rect>, divided among subtrees by <layout>.
+        """
+        self._store._update_rectangles(self._index, rect, layout)
+
+    def update_dirty_rectangles(self, rect: Tuple[int, int, int, int],
+                                layout: Optional[LayoutEngine] = None) \
+            -> List[Tuple[int, int, int, int]]:
+        """Updates the rectangles of this node and its descendants as
+        update_rectangles does. The store does not track which nodes changed,
+        so everything is laid out again and all of <rect> is returned as
+        changed.
+        """
+        self._store._update_rectangles(self._index, rect, layout)
+        return [rect]
+
+    def get_rectangles(self, min_area: int = 0) \
+            -> List[Tuple[Tuple[int, int, int, int], Tuple[int, int, int]]]:
+        """Returns the rectangle and colour of every leaf in the displayed
+        tree rooted at this node, treating nodes culled with <min_area> as
+        leaves.
+        """
+        return self._store._get_rectangles(self._index, min_area)
+
+    def get_rectangle_buffers(
+            self, area: Optional[Tuple[int, int, int, int]] = None,
+            min_area: int = 0,
+            colour_of: Optional[Callable[[CompactNode], Tuple[int, int, int]]]
+            = None) -> Tuple[array, bytearray]:
+        """Returns the rectangles and colours of the leaves that
+        get_rectangles returns, as TMTree.get_rectangle_buffers does.
+        """
+        return self._store._get_rectangle_buffers(self._index, area,
+                                                  min_area, colour_of)
+
+    def get_tree_at_position(self, pos: Tuple[int, int],
+                             min_area: int = 0) -> Optional[CompactNode]:
+        """Returns the displayed leaf under this node whose rectangle contains
+        <pos>, or None if <pos> is outside of this node's rectangle. Nodes
+        culled with <min_area> count as leaves.
+        """
+        i = self._store._get_tree_at_position(self._index, pos, min_area)
+        return None if i is None else self._store._handle(i)
+
+    def is_culled(self, min_area: int) -> bool:
+        """Returns whether this node is expanded but covers fewer than
+        <min_area> pixels, so that it is displayed as a single rectangle.
+        """
+        return self._store._is_culled(self._index, min_area)
+
+    def update_data_sizes(self) -> int:
+        """Updates the sizes of this node and its descendants from their
+        leaves, and returns the new size of this node.
+        """
+        return self._store._update_data_sizes(self._index)
+
+    def change_size(self, factor: float) -> None:
+        """Changes the size of this node by <factor> if it is a leaf.
+        """
+        step = self._store._change_size(self._index, factor)
+        if step is not None:
+            self._store._record([step])
+
+    def delete_self(self) -> bool:
+        """Removes this node from the visualization and returns whether the
+        deletion was successful. A node that is already deleted, or under a
+        deleted node, is not deleted again.
+        """
+        store = self._store
+        if store._is_live(self._index) and store._delete(self._index):
+            store._record([(CompactTree._undelete, store, self._index)])
+            return True
+        return False
+
+    def start_journal(self, budget: int) -> EditJournal:
+        """Starts recording the edits made to the store in a new journal
+        that keeps at most <budget> bytes of edits, and returns it.
+        """
+        self._store._journal = EditJournal(budget)
+        return self._store._journal
+
+    def update_colours_and_depths(self) -> None:
+        """Updates the colours of the folders under this node.
+        """
+        self._store._update_colours_and_depths(self._index)
+
+    def expand(self) -> None:
+        """Sets this node to be expanded, unless it is a leaf.
+        """
+        self._store._expand(self._index)
+
+    def expand_all(self) -> None:
+        """Sets this node and all its descendants that are not leaves to be
+        expanded.
+        """
+        self._store._expand(self._index)
+        self._store._set_expanded(self._index, 1)
+
+    def collapse(self) -> None:
+        """Collapses the parent of this node and all of its descendants.
+        """
+        parent = self._store._parents[self._index]
+        if parent != -1:
+            self._store._set_expanded(parent, 0)
+
+    def collapse_all(self) -> None:
+        """Collapses all nodes in the tree.
+        """
+        self._store._set_expanded(0, 0)
+
+    def move(self, destination: CompactNode) -> None:
+        """Does nothing, since the shape of a store is fixed.
+        """
+
+    def duplicate(self) -> Optional[CompactNode]:
+        """Does nothing and returns None, since the shape of a store is fixed.
+        """
+        return None
+
+    def copy_paste(self, destination: CompactNode) -> None:
+        """Does nothing, since the shape of a store is fixed.
+        """
+
+    def find_leaves(self, pattern: str) -> List[CompactNode]:
+        """Returns the leaves under this node whose names match the
+        shell-style <pattern>, such as '*.log'.
+        """
+        store = self._store
+        leaves = []
+        stack = [self._index]
+        while stack:
+            i = stack.pop()
+            if store._live_count[i]:
+                stack.extend(reversed(store._children(i)))
+            elif fnmatch(store._name(i), pattern):
+                leaves.append(store._handle(i))
+        return leaves
+
+    def largest(self, n: int, folders: bool = False) -> List[CompactNode]:
+        """Returns the <n> largest leaves under this node, largest first, or
+        the <n> largest folders under it if <folders> is True.
+
+        The store keeps heaps of the sizes of its nodes, built on the first
+        call, and edits push the sizes they change onto them.
+        """
+        store = self._store
+        return [store._handle(i)
+                for i in store._largest(self._index, n, folders)]
+
+    def edit_many(self, delete: Iterable[CompactNode] = (),
+                  move: Iterable[Tuple[CompactNode, CompactNode]] = (),
+                  resize: Iterable[Tuple[CompactNode, float]] = ()) -> int:
+        """Changes the sizes of the leaves in <resize> and then deletes the
+        nodes in <delete>, as change_size and delete_self do, and returns the
+        number of edits made. The moves are skipped, since the shape of a
+        store is fixed.
+
+        A deletion only clears a flag in the store, so the edits are simply
+        made one by one, and recorded as one edit. Nodes under a node that
+        is already deleted are skipped.
+        """
+        store = self._store
+        steps = []
+        count = 0
+        for node, factor in resize:
+            i = node._index
+            if not store._child_count[i] and store._is_live(i):
+                step = store._change_size(i, factor)
+                if step is not None:
+                    steps.append(step)
+                count += 1
+        for node in delete:
+            if store._is_live(node._index) and store._delete(node._index):
+                steps.append((CompactTree._undelete, store, node._index))
+                count += 1
+        if steps:
+            store._record(steps)
+        return count
+
+    def get_path_string(self) -> str:
+        """Returns the names from the root to this node, joined by the
+        separator.
+        """
+        return self._store._get_path_string(self._index)
+
+    def get_separator(self) -> str:
+        """Returns the separator used between names in a path string.
+        """
+        return self._store._separator
+
+    def get_suffix(self) -> str:
+        """Returns the final descriptor of this node.
+        """
+        return _describe(self._store._live_count[self._index], self.data_size)
+
+    def get_full_path(self) -> str:
+        """Returns the path of this node on the file system.
+        """
+        store = self._store
+        if store._root_path is None:
+            raise NotImplementedError
+        if self._index == 0:
+            return store._root_path
+        names = []
+        i = self._index
+        while i != 0:
+            names.append(store._name(i))
+            i = store._parents[i]
+        names.reverse()
+        return os.path.join(store._root_path, *names)
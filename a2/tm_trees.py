@@ -21,10 +21,22 @@ computer's file system.
 """
 from __future__ import annotations
 
+import copy
+import heapq
 import math
 import os
+import sys
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from random import randint
-from typing import List, Tuple, Optional
+from fnmatch import fnmatch
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, \
+    Mapping, Set, Tuple, Optional
+
+from tm_layout import DEFAULT_LAYOUT, HitIndex, LayoutEngine, \
+    make_hit_index
 
 
 def get_colour() -> Tuple[int, int, int]:
@@ -60,6 +72,11 @@ class TMTree:
     the client code.
     You can, however, freely add private methods as needed.
 
+    The private attributes listed after _depth are an exception to the rule
+    above, made for performance and undo: they are indexes, caches, the
+    links between clones that share subtrees, and the edit journal. None of
+    them changes what the tree represents.
+
     === Public Attributes ===
     rect: The pygame rectangle representing this node in the visualization.
     data_size: The size of the data represented by this tree.
@@ -72,6 +89,26 @@ class TMTree:
     this tree as a subtree, or None if this tree is not part of a larger tree.
     _expanded: Whether this tree is considered expanded for visualization.
     _depth: The depth of this tree node in relation to the root.
+    _hit_index: The index used to find the subtree at a position, or None if
+    it has not been built since this tree was last laid out.
+    _dirty: Whether the size or subtrees of this tree or one of its
+    descendants changed since this tree was last laid out.
+    _metrics: The metrics of this tree, or None if they have not been
+    gathered since this tree or one of its descendants last changed.
+    _path_string: The path string of this tree and the _path_generation it
+    was built in, or None if it has not been built.
+    _path_generation: The number of times any tree was given a new parent,
+    which makes every path string built before it out of date.
+    _clone_source: The tree whose subtrees this clone still shares, or None
+    if this tree has subtrees of its own.
+    _clones: The clones that still share the subtrees of this tree, or None
+    if it was never cloned.
+    _journal: The journal that edits to this tree and the trees under it are
+    recorded in, or None if they are recorded by an ancestor or not at all.
+    _size_index: The index of the sizes of the trees under this tree, or None
+    if this tree is not a root or no index was built for it.
+    _size_entry: The entry of this tree in the size index of its root, or
+    None if it has none.
 
     === Representation Invariants ===
     - data_size >= 0
@@ -94,6 +131,16 @@ class TMTree:
     _parent_tree: Optional[TMTree]
     _expanded: bool
     _depth: int
+    _hit_index: Optional[HitIndex]
+    _dirty: bool
+    _metrics: Optional[TreeMetrics]
+    _path_string: Optional[Tuple[int, str]]
+    _path_generation: int = 0
+    _clone_source: Optional[TMTree]
+    _clones: Optional[List[TMTree]]
+    _journal: Optional[EditJournal]
+    _size_index: Optional[SizeIndex]
+    _size_entry: Optional[list]
 
     def __init__(self, name: str, subtrees: List[TMTree],
                  data_size: int = 0) -> None:
@@ -110,9 +157,20 @@ class TMTree:
         self._colour = get_colour()
         self._subtrees = subtrees
         self._expanded = False
+        self._hit_index = None
+        self._dirty = False
+        self._metrics = None
+        self._path_string = None
+        self._clone_source = None
+        self._clones = None
+        self._journal = None
+        self._size_index = None
+        self._size_entry = None
 
         for subtree in subtrees:
             subtree._parent_tree = self
+        if subtrees:
+            TMTree._path_generation += 1
 
         if not self._subtrees:
             self.data_size = data_size
@@ -131,88 +189,445 @@ class TMTree:
         """
         return self._parent_tree
 
+    def _ensure_subtrees(self) -> None:
+        """Makes sure that all subtrees of this tree are in _subtrees.
+
+        A clone that still shares the subtrees of another tree gets copies of
+        them here. Subclasses that create their subtrees on demand override
+        this; it must be called before deciding whether such a tree is a leaf.
+        """
+        self._ensure_copied()
+
+    def _ensure_copied(self) -> None:
+        """Gives this tree copies of the subtrees it still shares with the
+        tree it was cloned from, if any.
+
+        Unlike _ensure_subtrees, this never creates subtrees on demand, so
+        traversals of the whole tree call it to tell a clone from a leaf
+        without reading the folders of a LazyFileSystemTree.
+        """
+        if self._clone_source is not None:
+            self._clone_source._clones.remove(self)
+            self._copy_shared_subtrees()
+
+    def _copy_shared_subtrees(self) -> None:
+        """Gives this clone clones of the subtrees it shares, which are in
+        turn shared until they are needed.
+
+        Precondition: this tree has a _clone_source, which no longer lists
+        it among its _clones.
+        """
+        source = self._clone_source
+        self._clone_source = None
+        source._ensure_subtrees()
+        for subtree in source._subtrees:
+            twin = subtree.clone()
+            twin._parent_tree = self
+            twin._depth = self._depth + 1
+            self._subtrees.append(twin)
+        # The new subtrees are laid out by the next relayout
+        root = self._update_ancestors(0)
+        if root._size_index is not None:
+            for twin in self._subtrees:
+                root._size_index.add(twin)
+
+    def _unshare(self) -> None:
+        """Gives every clone that still shares the subtrees of this tree or
+        of one of its ancestors copies of its own, before they are changed.
+
+        Copying the subtrees of a clone of an ancestor makes the clones of
+        the next tree down share its subtrees, so the ancestors are visited
+        from the root down.
+        """
+        trees = []
+        tree = self
+        while tree is not None:
+            trees.append(tree)
+            tree = tree._parent_tree
+        for tree in reversed(trees):
+            tree._unshare_subtrees()
+
+    def _unshare_subtrees(self) -> None:
+        """Gives every clone that still shares the subtrees of this tree
+        copies of its own.
+        """
+        if self._clones:
+            clones = self._clones
+            self._clones = None
+            for clone in clones:
+                clone._copy_shared_subtrees()
+
+    def clone(self) -> TMTree:
+        """Returns a collapsed copy of this tree with no parent, with the
+        same names, sizes and colours, made without reading the file system.
+
+        The copy shares the subtrees of this tree until either tree, or one
+        of the trees under them, is changed or expanded, and only then gets
+        its own copies of them, one level at a time. Copying a folder costs
+        O(1) however many trees are under it.
+        """
+        twin = copy.copy(self)
+        twin._parent_tree = None
+        twin._subtrees = []
+        twin._expanded = False
+        twin._hit_index = None
+        twin._dirty = False
+        twin._metrics = None
+        twin._path_string = None
+        twin._clone_source = None
+        twin._clones = None
+        twin._journal = None
+        twin._size_index = None
+        twin._size_entry = None
+        if self._subtrees or self._clone_source is not None:
+            twin._clone_source = self
+            if self._clones is None:
+                self._clones = []
+            self._clones.append(twin)
+        return twin
+
+    def _update_ancestors(self, delta: int) -> TMTree:
+        """Adds <delta> to the data_size of this tree and all its ancestors,
+        marks them all as dirty, drops their metrics, updates their entries in
+        the size index of the root, if any, and returns the root.
+
+        Every change to the size or subtrees of a tree goes through here, even
+        when <delta> is 0, so that update_dirty_rectangles lays it out again.
+        """
+        tree = self
+        while True:
+            tree.data_size += delta
+            tree._dirty = True
+            tree._metrics = None
+            if tree._parent_tree is None:
+                break
+            tree = tree._parent_tree
+        if delta and tree._size_index is not None:
+            tree._size_index.update(self)
+        return tree
+
+    def _attach(self, subtree: TMTree) -> tuple:
+        """Adds <subtree> as the last subtree of this tree, adds its size
+        to this tree and all its ancestors, and returns the step that
+        undoes this.
+
+        Precondition: <subtree> is not in the subtrees of any tree.
+        """
+        return self._insert_subtree(subtree, len(self._subtrees))
+
+    def _detach(self) -> tuple:
+        """Removes this tree from the subtrees of its parent, subtracts its
+        size from all its ancestors, and returns the step that undoes this.
+        Its parent tree is kept, so that it can still be used to go back to
+        the parent folder.
+
+        A parent left without subtrees ends up with a data_size of 0.
+
+        Precondition: this tree has a parent tree.
+        """
+        parent = self._parent_tree
+        return parent._remove_subtree(parent._subtrees.index(self), parent)
+
+    def _is_attached(self) -> bool:
+        """Returns whether this tree and each of its ancestors is in the
+        subtrees of its parent tree. A tree that was deleted, or dropped by
+        a rescan, keeps its parent tree but is not attached to it.
+        """
+        tree = self
+        while tree._parent_tree is not None:
+            if tree not in tree._parent_tree._subtrees:
+                return False
+            tree = tree._parent_tree
+        return True
+
+    # A step is a tuple of a function and its arguments. Calling the function
+    # with the arguments makes a change and returns the step that undoes it,
+    # so the same steps serve to undo and to redo an edit.
+
+    def _insert_subtree(self, subtree: TMTree, index: int) -> tuple:
+        """Inserts <subtree> into the subtrees of this tree at <index>, adds
+        its size to this tree and all its ancestors, and returns the step
+        that removes it again.
+        """
+        self._unshare()
+        owner = subtree._parent_tree
+        subtree._parent_tree = self
+        self._subtrees.insert(index, subtree)
+        root = self._update_ancestors(subtree.data_size)
+        self._count_extensions(subtree._get_extension_counts(), 1)
+        if root._size_index is not None:
+            root._size_index.add(subtree)
+            root._size_index.update_one(self)
+        if owner is not self:
+            TMTree._path_generation += 1
+        return TMTree._remove_subtree, self, index, owner
+
+    def _remove_subtree(self, index: int, owner: Optional[TMTree]) -> tuple:
+        """Removes the subtree at <index> from the subtrees of this tree,
+        makes <owner> its parent tree, subtracts its size from this tree and
+        all its ancestors, and returns the step that inserts it again.
+        """
+        self._unshare()
+        subtree = self._subtrees.pop(index)
+        subtree._parent_tree = owner
+        root = self._update_ancestors(-subtree.data_size)
+        self._count_extensions(subtree._get_extension_counts(), -1)
+        if root._size_index is not None:
+            root._size_index.remove(subtree)
+            root._size_index.update_one(self)
+        if owner is not self:
+            TMTree._path_generation += 1
+        return TMTree._insert_subtree, self, subtree, index
+
+    def _shift_size(self, delta: int) -> tuple:
+        """Adds <delta> to the data_size of this leaf and all its ancestors,
+        and returns the step that subtracts it again.
+        """
+        self._unshare()
+        parent = self._parent_tree
+        if parent is not None:
+            parent._count_extensions(self._get_extension_counts(), -1)
+        self._update_ancestors(delta)
+        if parent is not None:
+            parent._count_extensions(self._get_extension_counts(), 1)
+        return TMTree._shift_size, self, -delta
+
+    def _get_extension_counts(self) -> Mapping[str, Tuple[int, int]]:
+        """Returns the total size and number of the files under this tree
+        with each extension, keyed by extension. Only FileSystemTree counts
+        extensions, so this is empty here.
+        """
+        return {}
+
+    def _count_extensions(self, counts: Mapping[str, Tuple[int, int]],
+                          sign: int) -> None:
+        """Adds <sign> times the <counts> of a subtree, as returned by
+        _get_extension_counts, to the extension counts of this tree and all
+        its ancestors. Only FileSystemTree counts extensions.
+        """
+
+    def _recount_extensions(self) -> None:
+        """Counts the extensions of the files under this tree again from
+        the counts of its subtrees. Only FileSystemTree counts extensions.
+        """
+
+    def _find_journal(self) -> Optional[EditJournal]:
+        """Returns the journal kept by this tree or its nearest ancestor that
+        keeps one, or None if there is none.
+        """
+        tree = self
+        while tree is not None:
+            if tree._journal is not None:
+                return tree._journal
+            tree = tree._parent_tree
+        return None
+
+    def _record(self, steps: List[tuple]) -> None:
+        """Records the <steps> that undo an edit under this tree, which are
+        taken in reverse order, in the journal of this tree if it has one.
+        """
+        journal = self._find_journal()
+        if journal is not None:
+            journal.record(steps)
+
+    def start_journal(self, budget: int) -> EditJournal:
+        """Starts recording the edits made to this tree and the trees under
+        it in a new journal that keeps at most <budget> bytes of edits, and
+        returns the journal. Undo and redo the edits through the journal.
+        """
+        self._journal = EditJournal(budget)
+        return self._journal
+
     # **************************************************************************
     # ************* TASK 2: UPDATE AND GET RECTANGLES **************************
     # **************************************************************************
 
-    def update_rectangles(self, rect: Tuple[int, int, int, int]) -> None:
+    def update_rectangles(self, rect: Tuple[int, int, int, int],
+                          layout: Optional[LayoutEngine] = None) -> None:
         """Updates the rectangles in this tree and its descendants using the
         treemap algorithm to fill the area defined by the <rect> parameter.
+
+        The rectangle of each tree is divided among its subtrees by <layout>,
+        which is the original slice-and-dice layout if it is not given.
         """
-        x, y, width, height = rect
-
-        if self.data_size == 0:
-            self.rect = (0, 0, 0, 0)
-        elif width > height:
-            self.rect = rect
-            curr_width = x
-            for i in range(len(self._subtrees)):
-                if i != len(self._subtrees) - 1:
-                    percent = self._subtrees[i].data_size / self.data_size
-                    new_width = math.floor(percent * width)
-                else:
-                    new_width = width + x - curr_width
-                self._subtrees[i].update_rectangles((
-                    curr_width, y, new_width, height))
-                curr_width += new_width
-        else:
-            self.rect = rect
-            curr_height = y
-            for i in range(len(self._subtrees)):
-                if i != len(self._subtrees) - 1:
-                    percent = self._subtrees[i].data_size / self.data_size
-                    new_height = math.floor(percent * height)
-                else:
-                    new_height = height + y - curr_height
-                self._subtrees[i].update_rectangles((
-                    x, curr_height, width, new_height))
-                curr_height += new_height
+        self._lay_out(rect, layout, False)
+
+    def update_dirty_rectangles(self, rect: Tuple[int, int, int, int],
+                                layout: Optional[LayoutEngine] = None) \
+            -> List[Tuple[int, int, int, int]]:
+        """Updates the rectangles in this tree and its descendants as
+        update_rectangles does, but skips every subtree that keeps its
+        rectangle and has not been changed since it was last laid out.
+
+        Returns the areas whose treemap drawing may have changed: the old and
+        new rectangles of every tree that moved or was resized, but none of
+        its descendants, since they lie inside those rectangles.
 
-    def get_rectangles(self) -> List[Tuple[Tuple[int, int, int, int],
-                                           Tuple[int, int, int]]]:
+        <layout> must be the layout this tree was last laid out with.
+        """
+        return self._lay_out(rect, layout, True)
+
+    def _lay_out(self, rect: Tuple[int, int, int, int],
+                 layout: Optional[LayoutEngine], dirty_only: bool) \
+            -> List[Tuple[int, int, int, int]]:
+        """Lays out this tree and its descendants to fill <rect> with
+        <layout>, and returns the areas that changed, as
+        update_dirty_rectangles does.
+
+        If <dirty_only> is True, subtrees that are not dirty and whose
+        rectangle stays the same are skipped, since none of their rectangles
+        can change.
+        """
+        if layout is None:
+            layout = DEFAULT_LAYOUT
+        damage = []
+        stack = [(self, rect, False)]
+        while stack:
+            tree, rect, damaged = stack.pop()
+            if dirty_only and not tree._dirty and tree.rect == rect:
+                continue
+            tree._dirty = False
+            tree._hit_index = None
+            if tree.data_size == 0:
+                rect = (0, 0, 0, 0)
+            if not damaged and tree.rect != rect:
+                damage.extend(area for area in (tree.rect, rect)
+                              if area[2] > 0 and area[3] > 0)
+                damaged = True
+            tree.rect = rect
+            if tree.data_size != 0 and tree._subtrees:
+                sizes = [subtree.data_size for subtree in tree._subtrees]
+                for subtree, subtree_rect in zip(
+                        tree._subtrees,
+                        layout.split(rect, sizes, tree.data_size)):
+                    stack.append((subtree, subtree_rect, damaged))
+        return damage
+
+    def get_rectangles(self, min_area: int = 0) \
+            -> List[Tuple[Tuple[int, int, int, int], Tuple[int, int, int]]]:
         """Returns a list with tuples for every leaf in the displayed-tree
         rooted at this tree. Each tuple consists of a tuple that defines the
         appropriate pygame rectangle to display for a leaf, and the colour
         to fill it with.
-        """
 
-        if self.data_size == 0 or self.is_empty():
-            return []
-        elif self._expanded is False:
-            return [(self.rect, self._colour)]
-        else:
-            rects_list = []
-            for subtree in self._subtrees:
-                rects_list.extend(subtree.get_rectangles())
-            return rects_list
+        Expanded subtrees whose rectangles cover fewer than <min_area> pixels
+        are treated as leaves: their own rectangle and colour stand for all
+        of the small leaves inside them, which are not visited.
+        """
+        rects_list = []
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            if tree.data_size == 0 or tree.is_empty():
+                continue
+            elif tree._expanded is False or tree.is_culled(min_area):
+                rects_list.append((tree.rect, tree._colour))
+            else:
+                stack.extend(reversed(tree._subtrees))
+        return rects_list
+
+    def get_rectangle_buffers(
+            self, area: Optional[Tuple[int, int, int, int]] = None,
+            min_area: int = 0,
+            colour_of: Optional[Callable[[TMTree], Tuple[int, int, int]]]
+            = None) -> Tuple[array, bytearray]:
+        """Returns the rectangles and colours of the leaves that
+        get_rectangles(<min_area>) returns, flattened into an array of four
+        ints and a bytearray of three bytes per leaf, without a tuple for each
+        leaf.
+
+        If <area> is given, only the leaves whose rectangles overlap it are
+        returned, and subtrees outside of it are not visited. If <colour_of>
+        is given, each leaf is coloured with colour_of(leaf) instead of its
+        own colour.
+        """
+        rects = []
+        colours = []
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            if tree.data_size == 0 or tree.is_empty():
+                continue
+            if area is not None:
+                x, y, width, height = tree.rect
+                if not (x < area[0] + area[2] and area[0] < x + width
+                        and y < area[1] + area[3] and area[1] < y + height):
+                    continue
+            if tree._expanded is False or tree.is_culled(min_area):
+                rects += tree.rect
+                colours += tree._colour if colour_of is None \
+                    else colour_of(tree)
+            else:
+                stack += reversed(tree._subtrees)
+        return array('i', rects), bytearray(colours)
 
     # **************************************************************************
     # **************** TASK 3: GET_TREE_AT_POSITION ****************************
     # **************************************************************************
 
-    def get_tree_at_position(self, pos: Tuple[int, int]) -> Optional[TMTree]:
+    def get_tree_at_position(self, pos: Tuple[int, int],
+                             min_area: int = 0) -> Optional[TMTree]:
         """Returns the leaf in the displayed-tree rooted at this tree whose
         rectangle contains position <pos>, or None if <pos> is outside of this
         tree's rectangle.
 
         If <pos> is on the shared edge between two or more rectangles,
         always return the leftmost and topmost rectangle (wherever applicable).
+
+        Subtrees culled with <min_area> are leaves, as in get_rectangles.
         """
         x, y = pos
-
-        left = self.rect[0]
-        right = left + self.rect[2]
-        top = self.rect[1]
-        bottom = top + self.rect[3]
-
-        if not (left < x <= right and top < y <= bottom):
+        left, top, width, height = self.rect
+        if not (left < x <= left + width and top < y <= top + height):
             return None
-        elif self._expanded is False or not self._subtrees:
-            return self
-        elif self._subtrees:
-            for subtree in self._subtrees:
-                if subtree.get_tree_at_position(pos) is not None:
-                    return subtree.get_tree_at_position(pos)
+        tree = self
+        while tree._expanded is not False and tree._subtrees \
+                and not tree.is_culled(min_area):
+            tree = tree._get_subtree_at_position(pos)
+            if tree is None:
+                return None
+        return tree
+
+    def is_culled(self, min_area: int) -> bool:
+        """Returns whether this tree is expanded but its rectangle covers
+        fewer than <min_area> pixels, so that it is displayed as a single
+        rectangle standing for all of its small leaves.
+        """
+        _, _, width, height = self.rect
+        return self._expanded is not False and bool(self._subtrees) \
+            and width * height < min_area
+
+    def _get_subtree_at_position(self, pos: Tuple[int, int]) \
+            -> Optional[TMTree]:
+        """Returns the first subtree of this tree whose rectangle contains
+        <pos>, or None if there is no such subtree.
+
+        The subtrees are found through a HitIndex of their rectangles, which
+        is built the first time it is needed after the tree is laid out.
+        Subtrees whose rectangles do not tile this tree's rectangle, such as
+        ones that were edited since, are searched one by one instead.
+        """
+        index = self._hit_index
+        if index is None or index.box != self.rect \
+                or index.count != len(self._subtrees):
+            index = make_hit_index(self.rect,
+                                   [subtree.rect for subtree in self._subtrees])
+            self._hit_index = index
+        if index is not None:
+            i = index.find(pos)
+            if i is None:
+                return None
+            subtree = self._subtrees[i]
+            left, top, width, height = subtree.rect
+            if left < pos[0] <= left + width and top < pos[1] <= top + height:
+                return subtree
+
+        x, y = pos
+        for subtree in self._subtrees:
+            left, top, width, height = subtree.rect
+            if left < x <= left + width and top < y <= top + height:
+                return subtree
+        return None
 
     # **************************************************************************
     # ********* TASK 4: MOVE, CHANGE SIZE, DELETE, UPDATE SIZES ****************
@@ -225,23 +640,35 @@ class TMTree:
 
         If this tree is a leaf, return its size unchanged.
         """
-        if self._subtrees:
-            data_size = 0
-            for subtree in self._subtrees:
-                data_size += subtree.update_data_sizes()
-            self.data_size = data_size
-        if self.data_size < 0:
-            self.data_size = 0
+        nodes = [self]
+        i = 0
+        while i < len(nodes):
+            nodes[i]._ensure_copied()
+            nodes.extend(nodes[i]._subtrees)
+            i += 1
+
+        # Every subtree comes after its parent, so walking backwards updates
+        # all subtrees of a tree before the tree itself.
+        for tree in reversed(nodes):
+            if tree._subtrees:
+                data_size = 0
+                for subtree in tree._subtrees:
+                    data_size += subtree.data_size
+                tree.data_size = data_size
+                tree._recount_extensions()
+            if tree.data_size < 0:
+                tree.data_size = 0
 
         return self.data_size
 
     def change_size(self, factor: float) -> None:
         """Changes the value of this tree's data_size attribute by <factor>.
         Always rounds up the amount to change, so that it's an int, and
-        some change is made. If the tree is not a leaf, this method does
-        nothing.
+        some change is made. If the tree is not a leaf, or was removed from
+        the tree, this method does nothing.
         """
-        if not self._subtrees:
+        self._ensure_subtrees()
+        if not self._subtrees and self._is_attached():
             data_size = self.data_size
             change = 0
 
@@ -250,13 +677,11 @@ class TMTree:
             elif factor < 0:
                 change = math.floor(data_size * factor)
 
-            if self.data_size + change < 1:
-                self.data_size = 1
+            delta = max(data_size + change, 1) - data_size
+            if delta:
+                self._record([self._shift_size(delta)])
             else:
-                self.data_size = data_size + change
-
-        if self.get_parent():
-            self._parent_tree.update_data_sizes()
+                self._update_ancestors(0)
 
     def delete_self(self) -> bool:
         """Removes the current node from the visualization and
@@ -266,12 +691,19 @@ class TMTree:
         Do not set self._parent_tree to None, because it might be used
         by the visualizer to go back to the parent folder.
         """
-        if self.get_parent():
-            self._parent_tree._subtrees.remove(self)
-            if not self._parent_tree._subtrees:
-                self._parent_tree.delete_self()
-            return True
-        return False
+        if not self.get_parent() or not self._is_attached():
+            return False
+        # A parent left without subtrees is deleted too, as one edit
+        steps = []
+        tree = self
+        while True:
+            parent = tree._parent_tree
+            steps.append(tree._detach())
+            if parent._subtrees or parent._parent_tree is None:
+                break
+            tree = parent
+        self._record(steps)
+        return True
 
     # **************************************************************************
     # ************* TASK 5: UPDATE_COLOURS_AND_DEPTHS **************************
@@ -281,20 +713,45 @@ class TMTree:
         """Updates the depths of the nodes, starting with a depth of 0 at this
         tree node.
         """
-        self._depth = depth
-        if self._subtrees:
-            for subtree in self._subtrees:
-                subtree.update_depths(depth + 1)
-
-    def max_depth(self, max_depth: int = 0) -> int:
+        stack = [(self, depth)]
+        while stack:
+            tree, depth = stack.pop()
+            tree._depth = depth
+            tree._ensure_copied()
+            for subtree in tree._subtrees:
+                stack.append((subtree, depth + 1))
+
+    def max_depth(self) -> int:
         """Returns the maximum depth of the tree, which is the maximum length
         between a leaf node and the root node.
         """
-        if self._subtrees:
-            for subtree in self._subtrees:
-                max_depth += 1
-                subtree.max_depth()
-        return max_depth
+        return self.get_metrics().max_depth
+
+    def get_metrics(self) -> TreeMetrics:
+        """Returns the metrics of the tree rooted at this tree node.
+
+        The metrics are gathered in a single traversal and kept until this
+        tree or one of its descendants changes.
+        """
+        if self._metrics is None:
+            metrics = TreeMetrics()
+            stack = [(self, 0)]
+            while stack:
+                tree, depth = stack.pop()
+                if depth == len(metrics.depth_counts):
+                    metrics.depth_counts.append(0)
+                metrics.depth_counts[depth] += 1
+                tree._ensure_copied()
+                if tree._subtrees:
+                    for subtree in tree._subtrees:
+                        stack.append((subtree, depth + 1))
+                else:
+                    metrics.leaf_count += 1
+            metrics.max_depth = len(metrics.depth_counts) - 1
+            metrics.node_count = sum(metrics.depth_counts)
+            metrics.data_size = self.data_size
+            self._metrics = metrics
+        return self._metrics
 
     def update_colours(self, step_size: int) -> None:
         """Updates the colours so that the internal tree nodes are
@@ -303,30 +760,33 @@ class TMTree:
         their depth, where the step size determines the shade of grey.
         Leaf nodes should not be updated.
         """
-        if self._subtrees:
-            colour = self._depth * step_size
-            self._colour = (colour, colour, colour)
-            for subtree in self._subtrees:
-                subtree.update_colours(step_size)
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            tree._ensure_copied()
+            if tree._subtrees:
+                colour = tree._depth * step_size
+                tree._colour = (colour, colour, colour)
+                stack.extend(tree._subtrees)
 
     def update_colours_and_depths(self) -> None:
         """This method is called any time the tree is manipulated or right after
         instantiation. Updates the _depth and _colour attributes throughout
         the tree.
         """
-        self.update_depths()
-        self.max_depth()
-
-        step = 0
-        colour = 0
-        while colour < 200:
-            step += 1
-            colour = step * (self.max_depth() - 1)
-
-        if colour > 200:
-            self.update_colours(step - 1)
-        else:
-            self.update_colours(step)
+        # The deepest internal nodes are one level above the deepest leaves,
+        # and get the lightest shade of grey that is at most 200.
+        step = 200 // max(self.max_depth() - 1, 1)
+        stack = [(self, 0)]
+        while stack:
+            tree, depth = stack.pop()
+            tree._depth = depth
+            tree._ensure_copied()
+            if tree._subtrees:
+                colour = depth * step
+                tree._colour = (colour, colour, colour)
+                for subtree in tree._subtrees:
+                    stack.append((subtree, depth + 1))
 
     # **************************************************************************
     # ********* TASK 6: EXPAND, COLLAPSE, EXPAND ALL, COLLAPSE ALL *************
@@ -335,6 +795,7 @@ class TMTree:
     def expand(self) -> None:
         """Sets this tree to be expanded. But not if it is a leaf.
         """
+        self._ensure_subtrees()
         if self._subtrees:
             self._expanded = True
             tree = self
@@ -349,16 +810,26 @@ class TMTree:
         leaf nodes.
         """
         self.expand()
-        for subtree in self._subtrees:
-            subtree.expand_all()
+        stack = list(self._subtrees)
+        while stack:
+            tree = stack.pop()
+            tree._ensure_subtrees()
+            if tree._subtrees:
+                # Its parent is expanded already, so so are its ancestors.
+                tree._expanded = True
+                stack.extend(tree._subtrees)
+            else:
+                tree._expanded = False
 
     def _collapse_helper(self) -> None:
         """Collapses the parent tree of the given tree node and also collapse
         all of its descendants.
         """
-        self._expanded = False
-        for subtree in self._subtrees:
-            subtree._collapse_helper()
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            tree._expanded = False
+            stack.extend(tree._subtrees)
 
     def collapse(self) -> None:
         """Collapses the parent tree of the given tree node and also collapse
@@ -382,38 +853,183 @@ class TMTree:
     def move(self, destination: TMTree) -> None:
         """If this tree is a leaf, and <destination> is not a leaf, moves this
         tree to be the last subtree of <destination>. Otherwise, does nothing.
+        Trees that were removed from the tree are not moved.
         """
-        if not self._subtrees and destination._subtrees:
+        self._ensure_subtrees()
+        destination._ensure_subtrees()
+        if not self._subtrees and destination._subtrees \
+                and self._is_attached() and destination._is_attached():
+            steps = []
             if self.get_parent():
-                orig_parent = self._parent_tree
-                orig_parent._subtrees.remove(self)
-                orig_parent.update_data_sizes()
-            self._parent_tree = destination
-            destination._subtrees.append(self)
-            destination.update_data_sizes()
+                steps.append(self._detach())
+            steps.append(destination._attach(self))
+            destination._record(steps)
 
     def duplicate(self) -> Optional[TMTree]:
         """Duplicates the given tree, if it is a leaf node. It stores
         the new tree with the same parent as the given leaf. Returns the
-        new node. If the given tree is not a leaf, does nothing.
+        new node. If the given tree is not a leaf, or is not in the subtrees
+        of a parent tree, does nothing.
         """
+        self._ensure_subtrees()
         twin = None
-        if not self._subtrees:
-            twin = FileSystemTree(self.get_full_path())
-            twin._parent_tree = self._parent_tree
-            self._parent_tree._subtrees.append(twin)
+        if not self._subtrees and self.get_parent() and self._is_attached():
+            twin = self.clone()
+            self._parent_tree._record([self._parent_tree._attach(twin)])
         return twin
 
     def copy_paste(self, destination: TMTree) -> None:
         """If this tree is a leaf, and <destination> is not a leaf, this method
         copies the given, and moves the copy to the last subtree of
-        <destination>. Otherwise, does nothing.
+        <destination>. Otherwise, does nothing. Nothing is pasted into a tree
+        that was removed from the tree.
+        """
+        self._ensure_subtrees()
+        destination._ensure_subtrees()
+        if not self._subtrees and destination._subtrees \
+                and destination._is_attached():
+            destination._record([destination._attach(self.clone())])
+
+    def find_leaves(self, pattern: str) -> List[TMTree]:
+        """Returns the leaves under this tree whose names match the
+        shell-style <pattern>, such as '*.log'.
+        """
+        leaves = []
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            tree._ensure_subtrees()
+            if tree._subtrees:
+                stack.extend(reversed(tree._subtrees))
+            elif fnmatch(tree._name, pattern):
+                leaves.append(tree)
+        return leaves
+
+    def largest(self, n: int, folders: bool = False) -> List[TMTree]:
+        """Returns the <n> largest leaves under this tree, largest first, or
+        the <n> largest folders under it if <folders> is True.
+
+        The first call builds a size index of the whole tree, reading any
+        folders not read yet, and edits keep it up to date from then on, so
+        later calls only look at the trees at least as large as the ones
+        returned.
+        """
+        root = self
+        while root._parent_tree is not None:
+            root = root._parent_tree
+        if root._size_index is None:
+            root._size_index = SizeIndex(root)
+        return root._size_index.largest(self, n, folders)
+
+    def edit_many(self, delete: Iterable[TMTree] = (),
+                  move: Iterable[Tuple[TMTree, TMTree]] = (),
+                  resize: Iterable[Tuple[TMTree, float]] = ()) -> int:
+        """Makes many edits to the trees under this tree at once, and returns
+        the number of edits made.
+
+        Every (tree, factor) in <resize> is changed in size as change_size
+        does, every (tree, destination) in <move> is moved as move does, and
+        then every tree in <delete> is deleted as delete_self does. Edits
+        those methods would not make are skipped, judging by the trees as
+        they were before the batch. A tree given in more than one move is
+        only moved by the last of them, and a tree given more than once in
+        <delete> is deleted once.
+
+        Subtrees are only marked as removed, so that each changed tree
+        filters its subtrees once, and the sizes of the changed trees and
+        their ancestors are summed once, from the bottom up, instead of
+        after every edit. Lay the tree out once afterwards with
+        update_dirty_rectangles.
+
+        Precondition: every tree given is under this tree.
         """
-        if not self._subtrees and destination._subtrees:
-            twin = FileSystemTree(self.get_full_path())
-            twin._parent_tree = destination
-            destination._subtrees.append(twin)
-        destination.update_data_sizes()
+        resizes = []
+        for tree, factor in resize:
+            tree._ensure_subtrees()
+            if not tree._subtrees:
+                resizes.append((tree, factor))
+        # The destination of every tree moved, so that a tree moved twice
+        # is only attached once
+        destinations: Dict[TMTree, TMTree] = {}
+        for tree, destination in move:
+            tree._ensure_subtrees()
+            destination._ensure_subtrees()
+            if not tree._subtrees and destination._subtrees:
+                destinations[tree] = destination
+        moves = list(destinations.items())
+        deletes = [tree for tree in dict.fromkeys(delete)
+                   if tree._parent_tree is not None]
+
+        changed = [tree for tree, _ in resizes]
+        for tree, destination in moves:
+            changed.extend((tree._parent_tree, destination))
+        changed.extend(tree._parent_tree for tree in deletes)
+        order = _bottom_up(changed)
+        for tree in reversed(order):
+            tree._unshare_subtrees()
+        # What the batch changes, to undo it with in one step
+        states = [(tree, tree._subtrees, tree.data_size, tree._expanded)
+                  for tree in order]
+        parents = [(tree, tree._parent_tree) for tree, _ in moves]
+
+        for tree, factor in resizes:
+            if factor > 0:
+                change = math.ceil(tree.data_size * factor)
+            else:
+                change = math.floor(tree.data_size * factor)
+            tree.data_size = max(tree.data_size + change, 1)
+        # The subtrees each tree loses and gains, the deleted trees, and the
+        # trees that lose subtrees by deletion, which are deleted too if
+        # left empty
+        removed: Dict[TMTree, Set[TMTree]] = {}
+        added: Dict[TMTree, List[TMTree]] = {}
+        deleted = set(deletes)
+        deleted_from = set()
+        for tree, destination in moves:
+            removed.setdefault(tree._parent_tree, set()).add(tree)
+            added.setdefault(destination, []).append(tree)
+            tree._parent_tree = destination
+        for tree in deletes:
+            removed.setdefault(tree._parent_tree, set()).add(tree)
+            deleted_from.add(tree._parent_tree)
+        if moves:
+            TMTree._path_generation += 1
+
+        for tree in order:
+            if tree in removed or tree in added:
+                gone = removed.get(tree, set())
+                had_subtrees = bool(tree._subtrees)
+                tree._subtrees = \
+                    [subtree for subtree in tree._subtrees
+                     if subtree not in gone] \
+                    + [subtree for subtree in added.get(tree, [])
+                       if subtree not in deleted]
+                if not tree._subtrees:
+                    tree.data_size = 0
+                    tree._expanded = False
+                    if had_subtrees and tree in deleted_from \
+                            and tree._parent_tree is not None:
+                        removed.setdefault(tree._parent_tree, set()).add(tree)
+                        deleted.add(tree)
+                        deleted_from.add(tree._parent_tree)
+            if tree._subtrees:
+                tree.data_size = sum(subtree.data_size
+                                     for subtree in tree._subtrees)
+            tree._recount_extensions()
+            tree._dirty = True
+            tree._metrics = None
+
+        index = order[-1]._size_index if order else None
+        if index is not None:
+            for tree in order:
+                index.update_one(tree)
+            for tree in deleted:
+                index.remove(tree)
+
+        count = len(resizes) + len(moves) + len(deletes)
+        if count:
+            self._record([(_restore_trees, states, parents)])
+        return count
 
     # **************************************************************************
     # ************* HELPER FUNCTION FOR TESTING PURPOSES  **********************
@@ -422,14 +1038,15 @@ class TMTree:
         """For testing purposes to see the depth and colour attributes for each
         internal node in the tree. Used for passing test case 5.
         """
-
-        if len(self._subtrees) > 0:
-            output_list = [(self._name, self._depth, self._colour)]
-            for tree in self._subtrees:
-                output_list += tree.tree_traversal()
-            return output_list
-        else:
-            return []
+        output_list = []
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            tree._ensure_copied()
+            if len(tree._subtrees) > 0:
+                output_list.append((tree._name, tree._depth, tree._colour))
+                stack.extend(reversed(tree._subtrees))
+        return output_list
 
     # **************************************************************************
     # *********** METHODS DEFINED FOR STRING REPRESENTATION  *******************
@@ -438,12 +1055,47 @@ class TMTree:
         """Return a string representing the path containing this tree
         and its ancestors, using the separator for this OS between each
         tree's name.
+
+        The path strings of this tree and its parent are kept until any
+        tree is given a new parent, so that the paths of the siblings of
+        this tree only add their names to that of the parent. The paths of
+        the other ancestors are not kept, as the paths of all the trees on
+        a deep chain would take up memory quadratic in its depth.
         """
-        if self._parent_tree is None:
-            return self._name
+        path = self._get_kept_path_string()
+        if path is not None:
+            return path
+        parent = self._parent_tree
+        if parent is None:
+            path = self._name
         else:
-            return self._parent_tree.get_path_string() + \
-                self.get_separator() + self._name
+            parent_path = parent._get_kept_path_string()
+            if parent_path is None:
+                # The names up to the first ancestor with a kept path string
+                names = []
+                tree = parent
+                while tree is not None:
+                    tree_path = tree._get_kept_path_string()
+                    if tree_path is not None:
+                        names.append(tree_path)
+                        break
+                    names.append(tree._name)
+                    tree = tree._parent_tree
+                names.reverse()
+                parent_path = self.get_separator().join(names)
+                parent._path_string = (TMTree._path_generation, parent_path)
+            path = parent_path + self.get_separator() + self._name
+        self._path_string = (TMTree._path_generation, path)
+        return path
+
+    def _get_kept_path_string(self) -> Optional[str]:
+        """Returns the path string kept by this tree, or None if there is
+        none or it was built before a tree was last given a new parent.
+        """
+        kept = self._path_string
+        if kept is None or kept[0] != TMTree._path_generation:
+            return None
+        return kept[1]
 
     def get_separator(self) -> str:
         """Returns the string used to separate names in the string
@@ -466,6 +1118,304 @@ class TMTree:
         raise NotImplementedError
 
 
+class TreeMetrics:
+    """Counts and sizes describing a whole tree, gathered in one traversal
+    by TMTree.get_metrics.
+
+    Depths are counted from the root of the tree the metrics describe, which
+    has a depth of 0.
+
+    === Public Attributes ===
+    max_depth: the maximum length between a leaf node and the root node.
+    node_count: the number of nodes in the tree.
+    leaf_count: the number of leaves in the tree.
+    depth_counts: the number of nodes at each depth, starting with depth 0.
+    data_size: the data_size of the root of the tree.
+    """
+    max_depth: int
+    node_count: int
+    leaf_count: int
+    depth_counts: List[int]
+    data_size: int
+
+    def __init__(self) -> None:
+        """Initializes the metrics of a tree with no nodes counted yet.
+        """
+        self.max_depth = 0
+        self.node_count = 0
+        self.leaf_count = 0
+        self.depth_counts = []
+        self.data_size = 0
+
+
+class EditJournal:
+    """The edits made to a tree, kept so that they can be undone and redone
+    without reading the file system.
+
+    Every edit is kept as the steps that undo it. A step changes one tree
+    and the sizes of its ancestors, so undoing or redoing an edit made by
+    change_size, delete_self, move, duplicate or copy_paste takes O(depth)
+    time, while an edit_many batch is undone in one step over the trees it
+    changed. Undoing an edit keeps it to be redone until a new edit is made.
+
+    The journal counts the bytes taken up by its steps, and drops the oldest
+    edits to stay within its budget. Trees removed by an edit stay in memory
+    while a step refers to them, so the nodes of those trees are counted
+    with the edit as well, up to the budget; an edit that removes more nodes
+    than the budget allows is dropped at once, and cannot be undone.
+
+    === Public Attributes ===
+    budget: the most bytes the kept edits may take up.
+
+    === Private Attributes ===
+    _undo: the edits that can be undone, oldest first, each with the number
+    of bytes it takes up.
+    _redo: the edits that can be redone, the last one undone last, each with
+    the number of bytes it takes up.
+    _bytes: the number of bytes taken up by the edits in _undo and _redo.
+    """
+    budget: int
+    _undo: Deque[Tuple[List[tuple], int]]
+    _redo: Deque[Tuple[List[tuple], int]]
+    _bytes: int
+
+    def __init__(self, budget: int) -> None:
+        """Initializes an empty journal that keeps at most <budget> bytes of
+        edits.
+        """
+        self.budget = budget
+        self._undo = deque()
+        self._redo = deque()
+        self._bytes = 0
+
+    def record(self, steps: List[tuple]) -> None:
+        """Records a new edit as the <steps> that undo it, which are taken in
+        reverse order, and drops the edits that could be redone.
+        """
+        for _, size in self._redo:
+            self._bytes -= size
+        self._redo.clear()
+        self._push(self._undo, steps)
+
+    def undo(self) -> bool:
+        """Undoes the last edit that was not undone, and returns whether there
+        was one.
+        """
+        return self._replay(self._undo, self._redo)
+
+    def redo(self) -> bool:
+        """Makes the last undone edit again, and returns whether there was
+        one.
+        """
+        return self._replay(self._redo, self._undo)
+
+    def clear(self) -> None:
+        """Forgets all edits, for when the tree was changed some other way.
+        """
+        self._undo.clear()
+        self._redo.clear()
+        self._bytes = 0
+
+    def _replay(self, edits: Deque[Tuple[List[tuple], int]],
+                inverses: Deque[Tuple[List[tuple], int]]) -> bool:
+        """Takes the steps of the last edit in <edits>, and adds the steps
+        that undo them to <inverses>. Returns whether there was an edit.
+        """
+        if not edits:
+            return False
+        steps, size = edits.pop()
+        self._bytes -= size
+        self._push(inverses, [step[0](*step[1:]) for step in reversed(steps)])
+        return True
+
+    def _push(self, edits: Deque[Tuple[List[tuple], int]],
+              steps: List[tuple]) -> None:
+        """Adds an edit made of <steps> to <edits>, and drops the oldest
+        edits that can be undone while the journal is over its budget.
+        """
+        size = _count_bytes(steps) + _count_removed(steps, self.budget)
+        edits.append((steps, size))
+        self._bytes += size
+        while self._bytes > self.budget and self._undo:
+            _, size = self._undo.popleft()
+            self._bytes -= size
+
+
+class SizeIndex:
+    """The leaves and folders of a tree ordered by data_size, to find the
+    largest ones under any tree in it without visiting the others.
+
+    Every tree has an entry [-data_size, number, tree, is_folder] in the heap
+    of leaves or of folders, and keeps its current entry in _size_entry. When
+    the size of a tree changes, or a folder loses its last subtree, a new
+    entry is pushed for it and the old one is left in the heap, to be
+    skipped; the heaps are built again once most of their entries are out of
+    date. Removing a subtree only clears the entry of its root, since a tree
+    only counts as under another if every tree in between has a current
+    entry, so putting the subtree back, e.g. by undoing its deletion, brings
+    all of it back at once.
+
+    The subtrees of a clone are indexed once they are copied.
+
+    The heaps hold the trees of the whole tree, so most of the entries
+    walked for a small folder belong to trees outside it. A folder with few
+    trees under it is scanned directly instead, and so is any folder for
+    which walking the heaps gets as slow as scanning a folder of that size.
+
+    === Private Attributes ===
+    _root: the root of the tree that is indexed.
+    _leaves: the heap of the entries of leaves.
+    _folders: the heap of the entries of folders.
+    _first: the number of the first entry pushed since the heaps were last
+    built. Entries numbered lower are out of date.
+    _count: the number of trees indexed when the heaps were last built, plus
+    the number added since.
+    _next: the number of the next entry pushed by any index.
+    """
+    _root: TMTree
+    _leaves: List[list]
+    _folders: List[list]
+    _first: int
+    _count: int
+    _next: int = 0
+
+    def __init__(self, root: TMTree) -> None:
+        """Initializes the index of the tree rooted at <root>, reading any
+        of its folders that were not read yet.
+        """
+        self._root = root
+        self._build()
+
+    def largest(self, tree: TMTree, n: int, folders: bool) -> List[TMTree]:
+        """Returns the <n> largest leaves, or folders if <folders> is True,
+        under <tree>, largest first.
+        """
+        # Every current entry but the root's is under the root, so only the
+        # entries that are out of date are skipped for it.
+        limit = None
+        if tree is not self._root:
+            limit = max(math.isqrt(n * self._count), 64)
+            trees = self._trees_under(tree, limit)
+            if trees is not None:
+                return _largest_of(trees, n, folders)
+
+        found = []
+        for walked, entry in enumerate(
+                _heap_order(self._folders if folders else self._leaves)):
+            if len(found) == n:
+                break
+            if walked == limit:
+                return _largest_of(self._trees_under(tree, None), n,
+                                   folders)
+            subtree = entry[2]
+            if subtree._size_entry is entry and subtree is not tree \
+                    and self._is_under(subtree, tree):
+                found.append(subtree)
+        return found
+
+    def update(self, tree: TMTree) -> None:
+        """Pushes entries for the new sizes of <tree> and its ancestors.
+        """
+        while tree is not None:
+            self._push(tree)
+            tree = tree._parent_tree
+
+    def update_one(self, tree: TMTree) -> None:
+        """Pushes an entry for <tree> only, if its size changed or it turned
+        from a folder into a leaf or back.
+        """
+        entry = tree._size_entry
+        if not self._is_current(entry) or entry[0] != -tree.data_size \
+                or entry[3] != _is_folder(tree):
+            self._push(tree)
+
+    def add(self, tree: TMTree) -> None:
+        """Indexes <tree>, which was put under the root, and the trees under
+        it that have no current entries.
+        """
+        stack = [tree]
+        while stack:
+            tree = stack.pop()
+            if not self._is_current(tree._size_entry):
+                self._count += 1
+                self._push(tree)
+                stack.extend(tree._subtrees)
+
+    def remove(self, tree: TMTree) -> None:
+        """Stops counting <tree> and the trees under it, which were taken out
+        of the tree.
+        """
+        tree._size_entry = None
+
+    def _trees_under(self, tree: TMTree,
+                     limit: Optional[int]) -> Optional[List[TMTree]]:
+        """Returns the trees under <tree>, or None if there are more than
+        <limit> of them.
+
+        The subtrees of clones that are not copied yet are not indexed, so
+        they are not returned either.
+        """
+        trees = []
+        stack = list(tree._subtrees)
+        while stack:
+            if len(trees) == limit:
+                return None
+            subtree = stack.pop()
+            trees.append(subtree)
+            stack.extend(subtree._subtrees)
+        return trees
+
+    def _build(self) -> None:
+        """Builds the heaps from the trees under the root.
+        """
+        self._leaves = []
+        self._folders = []
+        self._first = SizeIndex._next
+        stack = [self._root]
+        while stack:
+            tree = stack.pop()
+            tree._ensure_subtrees()
+            self._new_entry(tree).append(tree._size_entry)
+            stack.extend(tree._subtrees)
+        heapq.heapify(self._leaves)
+        heapq.heapify(self._folders)
+        self._count = len(self._leaves) + len(self._folders)
+
+    def _push(self, tree: TMTree) -> None:
+        """Pushes a new current entry for <tree>, and builds the heaps again if
+        most of their entries are out of date.
+        """
+        heap = self._new_entry(tree)
+        heapq.heappush(heap, tree._size_entry)
+        if len(self._leaves) + len(self._folders) > 2 * self._count + 64:
+            self._build()
+
+    def _new_entry(self, tree: TMTree) -> List[list]:
+        """Gives <tree> a new current entry, and returns the heap of leaves
+        or of folders that it belongs in.
+        """
+        folder = _is_folder(tree)
+        tree._size_entry = [-tree.data_size, SizeIndex._next, tree, folder]
+        SizeIndex._next += 1
+        return self._folders if folder else self._leaves
+
+    def _is_current(self, entry: Optional[list]) -> bool:
+        """Returns whether <entry> was pushed since the heaps were last built.
+        """
+        return entry is not None and entry[1] >= self._first
+
+    def _is_under(self, tree: TMTree, ancestor: TMTree) -> bool:
+        """Returns whether <tree> is under <ancestor>, with a current entry
+        for every tree in between.
+        """
+        tree = tree._parent_tree
+        while tree is not ancestor:
+            if tree is None or not self._is_current(tree._size_entry):
+                return False
+            tree = tree._parent_tree
+        return True
+
+
 class FileSystemTree(TMTree):
     """A tree representation of files and folders in a file system.
 
@@ -480,8 +1430,16 @@ class FileSystemTree(TMTree):
 
     === Private Attributes ===
     _path: the path that was used to instantiate this tree.
+    _stamp: the (inode, modification time in nanoseconds) of this folder when
+    its entries were last read, or None if this tree is a file.
+    _extensions: the total size and number of the files under this folder
+    with each extension, keyed by lowercase extension ('' for files without
+    one), or None if this tree is a file. Edits keep it up to date, so that
+    the totals of any folder are known without visiting its files.
     """
     _path: str
+    _stamp: Optional[Tuple[int, int]]
+    _extensions: Optional[Dict[str, Tuple[int, int]]]
 
     def __init__(self, my_path: str) -> None:
         """Stores the directory given by <my_path> into a tree data structure
@@ -491,18 +1449,208 @@ class FileSystemTree(TMTree):
         """
         self._path = my_path
 
-        if os.path.isdir(my_path):
-            subtrees_lst = []
-            paths = []
-            for file in os.listdir(my_path):
-                paths.append(os.path.join(my_path, file))
-            for path in paths:
-                subtrees_lst.append(FileSystemTree(path))
-
-            TMTree.__init__(self, os.path.basename(my_path), subtrees_lst, 0)
-        else:
+        if not os.path.isdir(my_path):
+            self._stamp = None
+            self._extensions = None
             TMTree.__init__(self, os.path.basename(my_path), [],
                             os.path.getsize(my_path))
+            return
+
+        self._stamp = _get_stamp(os.stat(my_path))
+        self._extensions = {}
+        TMTree.__init__(self, os.path.basename(my_path), [], 0)
+        nodes = [self]
+        folders = [self]
+        while folders:
+            folder = folders.pop()
+            for file in os.listdir(folder._path):
+                path = os.path.join(folder._path, file)
+                if os.path.isdir(path):
+                    subtree = FileSystemTree._make_node(
+                        path, file, 0, _get_stamp(os.stat(path)))
+                    folders.append(subtree)
+                else:
+                    subtree = FileSystemTree._make_node(
+                        path, file, os.path.getsize(path), None)
+                subtree._parent_tree = folder
+                folder._subtrees.append(subtree)
+                nodes.append(subtree)
+
+        # Every subtree comes after its parent, so walking backwards adds each
+        # subtree's final size and extension counts to its parent exactly
+        # once.
+        for tree in reversed(nodes[1:]):
+            parent = tree._parent_tree
+            parent.data_size += tree.data_size
+            if tree._extensions is None:
+                _add_file(parent._extensions, tree._name, tree.data_size)
+            else:
+                _add_counts(parent._extensions, tree._extensions, 1)
+
+    @classmethod
+    def _make_node(cls, my_path: str, name: str, data_size: int,
+                   stamp: Optional[Tuple[int, int]]) -> FileSystemTree:
+        """Returns a new tree node for <my_path> with the given name, size and
+        folder stamp and no subtrees, without reading anything from the file
+        system.
+        """
+        tree = cls.__new__(cls)
+        tree._path = my_path
+        tree._stamp = stamp
+        tree._extensions = None if stamp is None else {}
+        TMTree.__init__(tree, name, [], data_size)
+        return tree
+
+    def clone(self) -> FileSystemTree:
+        """Returns a collapsed copy of this tree with no parent, as
+        TMTree.clone does, with its own copy of the extension counts.
+        """
+        twin = TMTree.clone(self)
+        if self._extensions is not None:
+            twin._extensions = dict(self._extensions)
+        return twin
+
+    def get_extension_totals(self, extension: str) -> Tuple[int, int]:
+        """Returns the total size and number of the files under this tree
+        whose names end in <extension>, such as '.py', or that have no
+        extension if it is ''. Letter case is ignored.
+
+        The totals are kept up to date by every edit, so this takes O(1)
+        time. Files in folders of a LazyFileSystemTree that have not been
+        read yet are not counted.
+        """
+        return self._get_extension_counts().get(extension.lower(), (0, 0))
+
+    def get_extensions(self) -> Dict[str, Tuple[int, int]]:
+        """Returns the total size and number of the files under this tree
+        with each extension, keyed by lowercase extension, as
+        get_extension_totals returns them.
+        """
+        return dict(self._get_extension_counts())
+
+    def _get_extension_counts(self) -> Mapping[str, Tuple[int, int]]:
+        """Returns the total size and number of the files under this tree
+        with each extension: its _extensions if it is a folder, or the size
+        of this one file if it is a file.
+        """
+        if self._extensions is None:
+            return {_get_extension(self._name): (self.data_size, 1)}
+        return self._extensions
+
+    def _count_extensions(self, counts: Mapping[str, Tuple[int, int]],
+                          sign: int) -> None:
+        """Adds <sign> times the <counts> of a subtree, as returned by
+        _get_extension_counts, to the extension counts of this folder and all
+        its ancestors.
+        """
+        tree = self
+        while tree is not None:
+            if tree._extensions is not None:
+                _add_counts(tree._extensions, counts, sign)
+            tree = tree._parent_tree
+
+    def _recount_extensions(self) -> None:
+        """Counts the extensions of the files under this folder again from
+        the counts of its subtrees.
+        """
+        if self._extensions is not None:
+            self._extensions = {}
+            for subtree in self._subtrees:
+                _add_counts(self._extensions,
+                            subtree._get_extension_counts(), 1)
+
+    def _recount_extensions_up(self) -> None:
+        """Counts the extensions of this folder again from its subtrees,
+        after its entries were read, and passes the change on to its
+        ancestors.
+        """
+        old_counts = self._extensions
+        self._recount_extensions()
+        if self._parent_tree is not None:
+            self._parent_tree._count_extensions(old_counts, -1)
+            self._parent_tree._count_extensions(self._extensions, 1)
+
+    def refresh(self) -> int:
+        """Rescans the folders in this tree whose inode or modification time
+        changed since their entries were last read, and returns how many
+        folders were rescanned.
+
+        Entries that are still on disk keep their subtrees, new entries are
+        scanned and removed ones are dropped. The data_size of every changed
+        folder and its ancestors is fixed up afterwards. A folder's
+        modification time only changes when entries are added, removed or
+        renamed, so the sizes of files in unchanged folders are not re-read.
+
+        The journal of this tree, if any, is cleared and the size index of
+        its root dropped when anything was rescanned, since they no longer
+        match the tree.
+        """
+        rescanned = 0
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            if tree._stamp is None:
+                continue
+            try:
+                stamp = _get_stamp(os.stat(tree._path))
+            except FileNotFoundError:
+                continue
+            if stamp != tree._stamp:
+                tree._rescan(stamp)
+                rescanned += 1
+            tree._ensure_copied()
+            for subtree in tree._subtrees:
+                if subtree._stamp is not None:
+                    stack.append(subtree)
+        if rescanned:
+            journal = self._find_journal()
+            if journal is not None:
+                journal.clear()
+            root = self
+            while root._parent_tree is not None:
+                root = root._parent_tree
+            root._size_index = None
+        return rescanned
+
+    def _rescan(self, stamp: Tuple[int, int]) -> None:
+        """Replaces the subtrees of this folder with its entries on disk,
+        keeping the existing subtree of every entry that is still there, and
+        records <stamp> as the folder's new stamp.
+        """
+        self._ensure_subtrees()
+        self._unshare()
+        old_subtrees = {}
+        for subtree in self._subtrees:
+            old_subtrees[subtree._name] = subtree
+
+        subtrees = []
+        for name, size, entry_stamp in _read_directory(self._path):
+            subtree = old_subtrees.get(name)
+            if subtree is None \
+                    or (subtree._stamp is None) != (entry_stamp is None):
+                subtree = self._new_subtree(name, size, entry_stamp)
+                subtree._parent_tree = self
+            elif entry_stamp is None:
+                subtree.data_size = size
+            subtrees.append(subtree)
+
+        self._subtrees = subtrees
+        self._stamp = stamp
+        if not subtrees:
+            self._expanded = False
+        self._update_ancestors(
+            sum(subtree.data_size for subtree in subtrees) - self.data_size)
+        self._recount_extensions_up()
+
+    def _new_subtree(self, name: str, size: int,
+                     stamp: Optional[Tuple[int, int]]) -> FileSystemTree:
+        """Returns a new tree for the entry called <name> in this folder, with
+        the size and stamp read from its directory entry.
+        """
+        path = os.path.join(self._path, name)
+        if stamp is None:
+            return FileSystemTree._make_node(path, name, size, None)
+        return _build_tree(path, *_scan_flat(path))
 
     def get_full_path(self) -> str:
         """Returns the file path for the tree object.
@@ -518,20 +1666,548 @@ class FileSystemTree(TMTree):
         """Returns the final descriptor of this tree.
         """
 
-        def convert_size(data_size: float, suffix: str = 'B') -> str:
-            suffixes = {'B': 'kB', 'kB': 'MB', 'MB': 'GB', 'GB': 'TB'}
-            if data_size < 1024 or suffix == 'TB':
-                return f'{data_size:.2f}{suffix}'
-            return convert_size(data_size / 1024, suffixes[suffix])
+        self._ensure_subtrees()
+        return _describe(len(self._subtrees), self.data_size)
+
+
+def _bottom_up(trees: List[TMTree]) -> List[TMTree]:
+    """Returns <trees> and all of their ancestors, each once, with every
+    tree before its parent.
+    """
+    # The number of subtrees of each tree that are not listed yet
+    waiting: Dict[TMTree, int] = {}
+    for tree in trees:
+        if tree in waiting:
+            continue
+        waiting[tree] = 0
+        parent = tree._parent_tree
+        while parent is not None:
+            known = parent in waiting
+            waiting[parent] = waiting.get(parent, 0) + 1
+            if known:
+                break
+            parent = parent._parent_tree
+
+    order = [tree for tree, count in waiting.items() if count == 0]
+    i = 0
+    while i < len(order):
+        parent = order[i]._parent_tree
+        if parent is not None:
+            waiting[parent] -= 1
+            if waiting[parent] == 0:
+                order.append(parent)
+        i += 1
+    return order
+
+
+def _restore_trees(states: List[Tuple[TMTree, List[TMTree], int, bool]],
+                   parents: List[Tuple[TMTree, Optional[TMTree]]]) -> tuple:
+    """Gives every tree in <states> the subtrees, data_size and expanded
+    state listed with it, and every tree in <parents> the parent tree listed
+    with it, and returns the step that puts back what they had before. This
+    is the step that undoes and redoes TMTree.edit_many.
+
+    Precondition: <states> lists every tree before its parent.
+    """
+    for tree, _, _, _ in reversed(states):
+        tree._unshare_subtrees()
+    undo_states = []
+    for tree, subtrees, data_size, expanded in states:
+        undo_states.append(
+            (tree, tree._subtrees, tree.data_size, tree._expanded))
+        tree._subtrees = subtrees
+        tree.data_size = data_size
+        tree._expanded = expanded
+        tree._recount_extensions()
+        tree._dirty = True
+        tree._metrics = None
+    undo_parents = []
+    for tree, parent in parents:
+        undo_parents.append((tree, tree._parent_tree))
+        tree._parent_tree = parent
+    if parents:
+        TMTree._path_generation += 1
+    index = states[-1][0]._size_index if states else None
+    if index is not None:
+        # Subtrees may have moved between the trees, so only the ones that
+        # are in none of the new subtree lists are removed
+        kept = set()
+        for tree, _, _, _ in states:
+            kept.update(tree._subtrees)
+            index.update_one(tree)
+        for _, subtrees, _, _ in undo_states:
+            for subtree in subtrees:
+                if subtree not in kept:
+                    index.remove(subtree)
+        for subtree in kept:
+            index.add(subtree)
+    return _restore_trees, undo_states, undo_parents
+
+
+def _get_extension(name: str) -> str:
+    """Returns the lowercase extension of the file called <name>, such as
+    '.py', or '' if it has none.
+    """
+    return os.path.splitext(name)[1].lower()
+
+
+def _add_file(totals: Dict[str, Tuple[int, int]], name: str,
+              size: int) -> None:
+    """Adds the file called <name> of <size> bytes to the (size, number of
+    files) <totals> of its extension.
+    """
+    extension = _get_extension(name)
+    old_size, old_files = totals.get(extension, (0, 0))
+    totals[extension] = (old_size + size, old_files + 1)
+
 
-        components = []
-        if len(self._subtrees) == 0:
-            components.append('file')
+def _add_counts(totals: Dict[str, Tuple[int, int]],
+                counts: Mapping[str, Tuple[int, int]], sign: int) -> None:
+    """Adds <sign> times the (size, number of files) <counts> of every
+    extension to its <totals>, dropping the extensions left without files.
+    """
+    for extension, (size, files) in counts.items():
+        old_size, old_files = totals.get(extension, (0, 0))
+        files = old_files + sign * files
+        if files:
+            totals[extension] = (old_size + sign * size, files)
+        else:
+            totals.pop(extension, None)
+
+
+def _is_folder(tree: TMTree) -> bool:
+    """Returns whether <tree> has subtrees, or shares those of a tree it was
+    cloned from.
+    """
+    return bool(tree._subtrees) or tree._clone_source is not None
+
+
+def _heap_order(heap: list) -> Iterator:
+    """Yields the items of the binary <heap> from the smallest up, without
+    changing it. Yielding the first k items takes O(k log k) time.
+    """
+    # The items whose parents in the heap were yielded, by heap position
+    frontier = [(heap[0], 0)] if heap else []
+    while frontier:
+        item, i = heapq.heappop(frontier)
+        yield item
+        for child in (2 * i + 1, 2 * i + 2):
+            if child < len(heap):
+                heapq.heappush(frontier, (heap[child], child))
+
+
+def _largest_of(trees: List[TMTree], n: int, folders: bool) -> List[TMTree]:
+    """Returns the <n> largest leaves, or folders if <folders> is True, among
+    <trees>, largest first.
+    """
+    return heapq.nlargest(n, [tree for tree in trees
+                              if _is_folder(tree) == folders],
+                          key=lambda tree: tree.data_size)
+
+
+def _count_bytes(item: object) -> int:
+    """Returns the number of bytes taken up by <item> and the lists and
+    tuples in it, not counting the trees and numbers they refer to.
+    """
+    size = sys.getsizeof(item)
+    if isinstance(item, (list, tuple)):
+        for part in item:
+            if isinstance(part, (list, tuple)):
+                size += _count_bytes(part)
+    return size
+
+
+def _count_removed(steps: List[tuple], limit: int) -> int:
+    """Returns the number of bytes taken up by the trees that <steps> put
+    back into the tree, and which are only kept in memory by them, counting
+    no further once the count passes <limit>.
+
+    Every node is counted with its attribute dictionary and list of
+    subtrees. The subtrees a clone still shares belong to its source, so
+    they are not counted.
+    """
+    removed = []
+    for step in steps:
+        if step[0] is TMTree._insert_subtree:
+            subtree = step[2]
+            parent = subtree._parent_tree
+            if parent is None or subtree not in parent._subtrees:
+                removed.append(subtree)
+        elif step[0] is _restore_trees:
+            present = {subtree for tree, _, _, _ in step[1]
+                       for subtree in tree._subtrees}
+            removed.extend(subtree for _, subtrees, _, _ in step[1]
+                           for subtree in subtrees if subtree not in present)
+    size = 0
+    while removed and size <= limit:
+        tree = removed.pop()
+        size += sys.getsizeof(tree) + sys.getsizeof(tree.__dict__) \
+            + sys.getsizeof(tree._subtrees)
+        removed.extend(tree._subtrees)
+    return size
+
+
+def _convert_size(data_size: float, suffix: str = 'B') -> str:
+    """Returns <data_size>, given in units of <suffix>, as a string in the
+    largest unit in which it is at least 1 (up to TB).
+    """
+    suffixes = {'B': 'kB', 'kB': 'MB', 'MB': 'GB', 'GB': 'TB'}
+    if data_size < 1024 or suffix == 'TB':
+        return f'{data_size:.2f}{suffix}'
+    return _convert_size(data_size / 1024, suffixes[suffix])
+
+
+def _describe(item_count: int, data_size: int) -> str:
+    """Returns the suffix describing a file (if <item_count> is 0) or a
+    folder with <item_count> items, of the given size.
+    """
+    components = []
+    if item_count == 0:
+        components.append('file')
+    else:
+        components.append('folder')
+        components.append(f'{item_count} items')
+    components.append(_convert_size(data_size))
+    return f' ({", ".join(components)})'
+
+
+class LazyFileSystemTree(FileSystemTree):
+    """A FileSystemTree that reads the entries of a folder only when they are
+    first needed: when the folder is expanded, edited or described.
+
+    Until then a folder is shown as a single rectangle whose data_size comes
+    from a size source, so building the tree only costs the time needed to
+    know the sizes, not to create a node for every file.
+
+    === Private Attributes ===
+    _loaded: whether the entries of this folder have been read into
+    _subtrees. Always True for files.
+    _sizes: the total size of folders, keyed by path. It is shared by the
+    whole tree; folders missing from it are measured when they are read.
+    """
+    _loaded: bool
+    _sizes: Mapping[str, int]
+
+    def __init__(self, my_path: str,
+                 sizes: Optional[Mapping[str, int]] = None,
+                 workers: Optional[int] = None) -> None:
+        """Stores the file or folder given by <my_path> without reading the
+        entries of any folder yet.
+
+        <sizes> maps folder paths to their total size, e.g. from an earlier
+        scan. If it is None, the sizes are computed by one aggregate pass over
+        <my_path> with <workers> threads, which does not create tree nodes.
+
+        Precondition: <my_path> is a valid path for this computer.
+        """
+        self._path = my_path
+        if sizes is None:
+            sizes = _folder_sizes(my_path, workers)
+        self._sizes = sizes
+
+        if os.path.isdir(my_path):
+            self._stamp = _get_stamp(os.stat(my_path))
+            self._extensions = {}
+            self._loaded = False
+            data_size = _get_folder_size(sizes, my_path)
+        else:
+            self._stamp = None
+            self._extensions = None
+            self._loaded = True
+            data_size = os.path.getsize(my_path)
+        TMTree.__init__(self, os.path.basename(my_path), [], data_size)
+
+    def _ensure_subtrees(self) -> None:
+        """Reads the entries of this folder into _subtrees if that has not
+        been done yet. The new subtrees are laid out by the next call to
+        update_rectangles or update_dirty_rectangles.
+        """
+        if self._loaded:
+            # It may still share the subtrees of the tree it was cloned from
+            TMTree._ensure_subtrees(self)
+            return
+        self._loaded = True
+        self._stamp = _get_stamp(os.stat(self._path))
+        for name, size, stamp in _read_directory(self._path):
+            subtree = self._new_subtree(name, size, stamp)
+            subtree._parent_tree = self
+            subtree._depth = self._depth + 1
+            self._subtrees.append(subtree)
+
+        # The folder may have changed on disk since its size was measured.
+        self._update_ancestors(
+            sum(subtree.data_size for subtree in self._subtrees)
+            - self.data_size)
+        self._recount_extensions_up()
+
+    def _rescan(self, stamp: Tuple[int, int]) -> None:
+        """Rescans this folder if its entries have been read. Otherwise only
+        measures its size again, since its entries are read when needed.
+        """
+        if self._loaded:
+            FileSystemTree._rescan(self, stamp)
         else:
-            components.append('folder')
-            components.append(f'{len(self._subtrees)} items')
-        components.append(convert_size(self.data_size))
-        return f' ({", ".join(components)})'
+            self._unshare()
+            self._stamp = stamp
+            self._update_ancestors(
+                _folder_sizes(self._path)[self._path] - self.data_size)
+
+    def _new_subtree(self, name: str, size: int,
+                     stamp: Optional[Tuple[int, int]]) -> FileSystemTree:
+        """Returns a new lazy tree for the entry called <name> in this folder,
+        with the size and stamp read from its directory entry.
+        """
+        path = os.path.join(self._path, name)
+        if stamp is not None:
+            size = _get_folder_size(self._sizes, path)
+        subtree = LazyFileSystemTree._make_node(path, name, size, stamp)
+        subtree._sizes = self._sizes
+        subtree._loaded = stamp is None
+        return subtree
+
+
+# ******************************************************************************
+# ****************** PARALLEL FILE SYSTEM SCANNER ******************************
+# ******************************************************************************
+def _get_stamp(info: os.stat_result) -> Tuple[int, int]:
+    """Returns the (inode, modification time in nanoseconds) stamp recorded
+    for a folder with the stat data <info>.
+    """
+    return info.st_ino, info.st_mtime_ns
+
+
+def _read_directory(my_path: str) \
+        -> List[Tuple[str, int, Optional[Tuple[int, int]]]]:
+    """Returns a (name, size, stamp) tuple for every entry of the folder at
+    <my_path>, in the order os.scandir lists them.
+
+    Folders have a size of 0 and files have a stamp of None. Sizes and stamps
+    come from the stat data of each os.DirEntry, so no path has to be
+    resolved again.
+    """
+    listing = []
+    with os.scandir(my_path) as entries:
+        for entry in entries:
+            # Entries removed since the folder was listed are left out
+            try:
+                if entry.is_dir():
+                    listing.append((entry.name, 0, _get_stamp(entry.stat())))
+                else:
+                    listing.append((entry.name, entry.stat().st_size, None))
+            except OSError:
+                continue
+    return listing
+
+
+def _scan_flat(my_path: str, workers: Optional[int] = None) \
+        -> Tuple[List[str], List[int], List[int],
+                 List[Optional[Tuple[int, int]]]]:
+    """Scans the file or folder at <my_path> and returns the names, parent
+    indices, sizes and folder stamps of every entry in breadth-first order.
+    The root is at index 0 and has a parent index of -1; folders have a size
+    of 0 and files have a stamp of None.
+
+    The folders of each level of the tree are read in parallel by a pool of
+    <workers> threads (the ThreadPoolExecutor default if None).
+    """
+    names = [os.path.basename(my_path)]
+    parents = [-1]
+    if not os.path.isdir(my_path):
+        return names, parents, [os.path.getsize(my_path)], [None]
+
+    sizes = [0]
+    stamps = [_get_stamp(os.stat(my_path))]
+    level = [(0, my_path)]
+    with ThreadPoolExecutor(workers) as pool:
+        while level:
+            next_level = []
+            listings = pool.map(_read_directory, [path for _, path in level])
+            for (index, path), listing in zip(level, listings):
+                for name, size, stamp in listing:
+                    if stamp is not None:
+                        next_level.append((len(names),
+                                           os.path.join(path, name)))
+                    names.append(name)
+                    parents.append(index)
+                    sizes.append(size)
+                    stamps.append(stamp)
+            level = next_level
+    return names, parents, sizes, stamps
+
+
+def _build_tree(my_path: str, names: List[str], parents: List[int],
+                sizes: List[int], stamps: List[Optional[Tuple[int, int]]]) \
+        -> FileSystemTree:
+    """Returns the FileSystemTree rooted at <my_path> described by the
+    breadth-first <names>, <parents>, <sizes> and <stamps> returned by
+    _scan_flat.
+    """
+    nodes = []
+    for i, name in enumerate(names):
+        if i == 0:
+            nodes.append(FileSystemTree._make_node(my_path, name, sizes[0],
+                                                   stamps[0]))
+        else:
+            parent = nodes[parents[i]]
+            node = FileSystemTree._make_node(
+                os.path.join(parent._path, name), name, sizes[i], stamps[i])
+            node._parent_tree = parent
+            parent._subtrees.append(node)
+            nodes.append(node)
+
+    # Children always come after their parent, so walking backwards adds
+    # every subtree's final size and extension counts to its parent exactly
+    # once.
+    for i in range(len(nodes) - 1, 0, -1):
+        parent = nodes[parents[i]]
+        parent.data_size += nodes[i].data_size
+        if stamps[i] is None:
+            _add_file(parent._extensions, names[i], sizes[i])
+        else:
+            _add_counts(parent._extensions, nodes[i]._extensions, 1)
+    return nodes[0]
+
+
+def _folder_sizes(my_path: str,
+                  workers: Optional[int] = None) -> Dict[str, int]:
+    """Returns the total size of the folder at <my_path> and of every folder
+    inside it, keyed by path.
+
+    Only folders are kept in memory and no tree nodes are created. Folders
+    are read in parallel by a pool of <workers> threads, as in _scan_flat.
+    """
+    paths = [my_path]
+    parents = [-1]
+    totals = [0]
+    level = [0]
+    with ThreadPoolExecutor(workers) as pool:
+        while level:
+            next_level = []
+            listings = pool.map(_read_directory, [paths[i] for i in level])
+            for index, listing in zip(level, listings):
+                for name, size, stamp in listing:
+                    if stamp is None:
+                        totals[index] += size
+                    else:
+                        next_level.append(len(paths))
+                        paths.append(os.path.join(paths[index], name))
+                        parents.append(index)
+                        totals.append(0)
+            level = next_level
+
+    for i in range(len(paths) - 1, 0, -1):
+        totals[parents[i]] += totals[i]
+    return dict(zip(paths, totals))
+
+
+def _get_folder_size(sizes: Mapping[str, int], my_path: str) -> int:
+    """Returns the size of the folder at <my_path> recorded in <sizes>, or
+    measures it if it is not there.
+    """
+    size = sizes.get(my_path)
+    if size is None:
+        size = _folder_sizes(my_path)[my_path]
+    return size
+
+
+class ScanProgress:
+    """The progress of a file system scan started by iter_scan.
+
+    === Public Attributes ===
+    tree: the tree built so far. Folders that have not been read yet have
+    no subtrees, but the tree satisfies the TMTree representation invariants.
+    entries: the number of files and folders found so far.
+    data_size: the total size of the files found so far.
+    elapsed: the number of seconds since the scan started.
+    done: whether the scan is complete.
+    """
+    tree: FileSystemTree
+    entries: int
+    data_size: int
+    elapsed: float
+    done: bool
+
+    def __init__(self, tree: FileSystemTree, entries: int, elapsed: float,
+                 done: bool) -> None:
+        """Initializes the progress of a scan that has built <tree> so far.
+        """
+        self.tree = tree
+        self.entries = entries
+        self.data_size = tree.data_size
+        self.elapsed = elapsed
+        self.done = done
+
+    def rate(self) -> float:
+        """Returns the number of entries found per second so far.
+        """
+        return self.entries / self.elapsed if self.elapsed > 0 else 0.0
+
+    def get_text(self) -> str:
+        """Returns a one-line description of this progress.
+        """
+        state = 'Scanned' if self.done else 'Scanning'
+        return f'{state} {self.entries} entries, ' \
+               f'{_convert_size(self.data_size)}, ' \
+               f'{self.rate():.0f} entries/s'
+
+
+def iter_scan(my_path: str, workers: Optional[int] = None,
+              batch_size: int = 256) -> Iterator[ScanProgress]:
+    """Scans the file or folder at <my_path> in breadth-first order, yielding
+    the progress after every batch of <batch_size> folders has been read by
+    a pool of <workers> threads. The last progress yielded is done.
+
+    The tree in every progress is the same object, growing as the scan goes
+    on; when the scan is done it is equal to scan_file_system(<my_path>).
+
+    Precondition: <my_path> is a valid path for this computer.
+    """
+    start = time.monotonic()
+    name = os.path.basename(my_path)
+    if not os.path.isdir(my_path):
+        tree = FileSystemTree._make_node(my_path, name,
+                                         os.path.getsize(my_path), None)
+        yield ScanProgress(tree, 1, time.monotonic() - start, True)
+        return
+
+    tree = FileSystemTree._make_node(my_path, name, 0,
+                                     _get_stamp(os.stat(my_path)))
+    entries = 1
+    folders = deque([tree])
+    with ThreadPoolExecutor(workers) as pool:
+        while folders:
+            batch = [folders.popleft()
+                     for _ in range(min(batch_size, len(folders)))]
+            listings = pool.map(_read_directory,
+                                [folder._path for folder in batch])
+            for folder, listing in zip(batch, listings):
+                files_size = 0
+                counts = {}
+                for name, size, stamp in listing:
+                    subtree = FileSystemTree._make_node(
+                        os.path.join(folder._path, name), name, size, stamp)
+                    subtree._parent_tree = folder
+                    folder._subtrees.append(subtree)
+                    if stamp is None:
+                        files_size += size
+                        _add_file(counts, name, size)
+                    else:
+                        folders.append(subtree)
+                entries += len(listing)
+                folder._update_ancestors(files_size)
+                folder._count_extensions(counts, 1)
+            yield ScanProgress(tree, entries, time.monotonic() - start,
+                               not folders)
+
+
+def scan_file_system(my_path: str,
+                     workers: Optional[int] = None) -> FileSystemTree:
+    """Returns the same tree as FileSystemTree(<my_path>), built with
+    os.scandir and a pool of <workers> threads reading folders in parallel.
+
+    Precondition: <my_path> is a valid path for this computer.
+    """
+    return _build_tree(my_path, *_scan_flat(my_path, workers))
 
 
 if __name__ == '__main__':
@@ -539,6 +2215,8 @@ if __name__ == '__main__':
 
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'python_ta', 'typing', 'math', 'random', 'os', '__future__'
+            'python_ta', 'typing', 'math', 'random', 'os', '__future__',
+            'concurrent.futures', 'collections', 'time', 'tm_layout',
+            'array', 'copy', 'fnmatch', 'sys', 'heapq'
         ]
     })
@@ -21,13 +21,54 @@ and detecting user events like mouse clicks and key presses and responding
 to them.
 """
 
-from os import getcwd
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from sys import platform
-from typing import Optional
+from typing import Callable, Iterator, Optional
 
 import pygame
 
-from tm_trees import TMTree, FileSystemTree
+from tm_duplicates import DuplicateReport, find_duplicates
+from tm_layout import LayoutEngine, SliceAndDiceLayout, SquarifiedLayout
+from tm_shards import scan_sharded
+from tm_snapshot import get_snapshot_root, load_snapshot, save_snapshot
+from tm_store import CompactTree
+from tm_trees import EditJournal, TMTree, FileSystemTree, LazyFileSystemTree, \
+    ScanProgress, _convert_size, iter_scan, scan_file_system
+
+try:
+    from tm_raster import get_rectangle_arrays, render_rectangles
+except ImportError:  # NumPy is not installed: draw one rectangle at a time
+    get_rectangle_arrays = render_rectangles = None
+
+# The keys that edit the tree, which are ignored while a scan is running.
+EDIT_KEYS = {pygame.K_UP, pygame.K_DOWN, pygame.K_DELETE, pygame.K_BACKSPACE,
+             pygame.K_m, pygame.K_v, pygame.K_d, pygame.K_r, pygame.K_f}
+
+# The pixel area below which folders are drawn as one rectangle when the
+# level of detail is reduced with "L".
+LOD_AREA = 64
+
+# The most bytes of edits kept to be undone with "Z" and redone with "Y".
+JOURNAL_BUDGET = 16 * 1024 * 1024
+
+# The number of largest files outlined with "N", and the outline colour.
+HIGHLIGHT_COUNT = 10
+HIGHLIGHT_COLOUR = (255, 64, 64)
+
+# The colours given with "T" to the extensions with the most bytes in the
+# display, largest first, and to the files with any other extension.
+EXTENSION_COLOURS = [(230, 25, 75), (60, 180, 75), (255, 225, 25),
+                     (0, 130, 200), (245, 130, 48), (145, 30, 180),
+                     (70, 240, 240), (240, 50, 230)]
+OTHER_COLOUR = (128, 128, 128)
+
+# The colours given with "H" to trees with no bytes in extra copies of
+# duplicate files, and to trees that are all extra copies.
+COLD_COLOUR = (40, 40, 70)
+HOT_COLOUR = (255, 60, 0)
 
 
 class Visualiser:
@@ -41,6 +82,27 @@ class Visualiser:
     screen: Optional[pygame.Surface]
     hover_node: Optional[TMTree]
     selected_node: Optional[TMTree]
+    scan: Optional[Iterator[ScanProgress]]
+    progress: Optional[ScanProgress]
+    layout: LayoutEngine
+    layout_interval: float
+    filter_text: Optional[str]
+    journal: Optional[EditJournal]
+    highlighted: list[TMTree]
+    extension_colours: Optional[dict[str, tuple[int, int, int]]]
+    duplicates: Optional[DuplicateReport]
+    min_area: int
+    frame_rate: int
+    _last_layout: float
+    _treemap: Optional[pygame.Surface]
+    _damage: list[tuple[int, int, int, int]]
+    _outlines: list[tuple[tuple[int, int, int, int], int, tuple[int, int, int]]]
+    _text: Optional[str]
+    _font: Optional[pygame.font.Font]
+    _text_surface: Optional[tuple[str, pygame.Surface]]
+    _small_items: Optional[tuple[TMTree, tuple[int, int, int, int], int, int]]
+    _largest_extensions: dict[TMTree, str]
+    _relaid: bool
 
     def __init__(self) -> None:
         # You may adjust the height and width as you'd like, depending on your screen resolution
@@ -49,24 +111,94 @@ class Visualiser:
 
         self.font_height = 30
 
+        # How the treemap divides each folder among its files and folders
+        self.layout = SliceAndDiceLayout()
+
+        # Expanded folders covering fewer pixels than this are drawn as one
+        # rectangle; 0 draws every file
+        self.min_area = 0
+
+        # Seconds between re-layouts of the treemap while a scan is running
+        self.layout_interval = 0.5
+
+        # The most times per second the display is drawn again
+        self.frame_rate = 60
+
         self.tree = None
         self.screen = None
         self.hover_node = None
         self.selected_node = None
+        self.scan = None
+        self.progress = None
+        self._last_layout = 0.0
+
+        # The pattern typed after "F", or None when no pattern is typed
+        self.filter_text = None
+
+        # The edits made to the tree, to be undone and redone
+        self.journal = None
+
+        # The largest files, outlined until the tree changes
+        self.highlighted = []
+
+        # The colour of each extension while files are coloured by extension,
+        # or None while they have their own colours
+        self.extension_colours = None
+
+        # The extension with the most bytes under each folder with files of
+        # more than one extension, found while drawing them by extension and
+        # kept until the tree is edited
+        self._largest_extensions = {}
+
+        # The duplicate files found while trees are coloured by how many of
+        # their bytes are extra copies, or None while they are not
+        self.duplicates = None
+
+        # The treemap as last drawn, the parts of it that must be drawn again,
+        # and the outlines and text currently on the screen
+        self._treemap = None
+        self._damage = []
+        self._outlines = []
+        self._text = None
+
+        # Whether the treemap was laid out, or folders in it collapsed, since
+        # the hovered leaf was last looked up
+        self._relaid = False
+
+        # The font of the text, once loaded, and the last text rendered
+        self._font = None
+        self._text_surface = None
+
+        # The culled tree whose small items were last counted, with its
+        # rectangle and min_area at the time, and the count
+        self._small_items = None
 
-    def run_visualisation(self, tree: TMTree) -> None:
+    def run_visualisation(self, tree: TMTree,
+                          scan: Optional[Iterator[ScanProgress]] = None) -> None:
         """Display an interactive graphical display of the given tree's treemap.
+
+        If <scan> is given, <tree> is the tree it is still building: the
+        treemap is drawn from what has been found so far and laid out again
+        periodically until the scan is done.
         """
+        if scan is not None:
+            self.scan = scan
 
         # Setup pygame
         pygame.init()
         self.screen = pygame.display.set_mode((self.width, self.height), pygame.RESIZABLE)
         self.tree = tree
+        if self.journal is None:
+            self.journal = tree.start_journal(JOURNAL_BUDGET)
 
         # Render the initial display of the static treemap.
         self.render_display()
-        tree.update_rectangles((0, 0, self.width, self.height - self.font_height))
-        tree.update_colours_and_depths()
+        tree.update_rectangles((0, 0, self.width, self.height - self.font_height),
+                               self.layout)
+        if self.scan is None:
+            tree.update_colours_and_depths()
+        self._last_layout = time.monotonic()
+        self._treemap = None
 
         # Start an event loop to respond to events.
         self.event_loop()
@@ -76,37 +208,87 @@ class Visualiser:
 
         Use the constants TREEMAP_HEIGHT and FONT_HEIGHT to divide the
         screen vertically into the treemap and text comments.
-        """
-        # First, clear the screen
-        pygame.draw.rect(self.screen, pygame.Color('black'),
-                         (0, 0, self.width, self.height))
 
-        try:
-            subscreen = self.screen.subsurface((0, 0, self.width, self.height - self.font_height))
-        except ValueError:
+        Only the parts of the screen that changed since the last call are
+        drawn again: the damaged areas of the treemap, the outlines of the
+        selected, hovered and highlighted rectangles, and the text. The
+        treemap itself is kept in a separate surface, so that moving an
+        outline only copies the treemap back from there.
+        """
+        treemap_size = (self.width, self.height - self.font_height)
+        if treemap_size[1] <= 0:
             return
-
-        for rect, colour in self.tree.get_rectangles():
-            # Note that the arguments are in the opposite order
-            pygame.draw.rect(subscreen, colour, rect)
+        updates = []
+        if self._treemap is None or self._treemap.get_size() != treemap_size:
+            # First, clear the screen
+            pygame.draw.rect(self.screen, pygame.Color('black'),
+                             (0, 0, self.width, self.height))
+            self._treemap = pygame.Surface(treemap_size)
+            self._damage = [(0, 0) + treemap_size]
+            self._outlines = []
+            self._text = None
+            updates.append(pygame.Rect(0, 0, self.width, self.height))
+
+        colour_of = None
+        if self.extension_colours is not None:
+            colour_of = self._get_extension_colour
+        elif self.duplicates is not None:
+            colour_of = self._get_heat_colour
+        for area in self._damage:
+            area = pygame.Rect(area).clip(self._treemap.get_rect())
+            if area.width > 0 and area.height > 0:
+                _draw_treemap(self._treemap, self.tree, area, self.min_area,
+                              colour_of)
+                self.screen.blit(self._treemap, area, area)
+                updates.append(area)
+        redraw_outlines = bool(self._damage)
+        self._damage = []
 
         # add the hover rectangle
+        outlines = [(node.rect, 2, HIGHLIGHT_COLOUR)
+                    for node in self.highlighted]
         if self.selected_node is not None:
-            pygame.draw.rect(subscreen, (255, 255, 255), self.selected_node.rect, 4)
+            outlines.append((self.selected_node.rect, 4, (255, 255, 255)))
         if self.hover_node is not None:
-            pygame.draw.rect(subscreen, (255, 255, 255), self.hover_node.rect, 2)
-
-        self._render_text()
+            outlines.append((self.hover_node.rect, 2, (255, 255, 255)))
+        if redraw_outlines or outlines != self._outlines:
+            for rect, width, _ in self._outlines:
+                for strip in _outline_strips(rect, width):
+                    strip = strip.clip(self._treemap.get_rect())
+                    self.screen.blit(self._treemap, strip, strip)
+                    updates.append(strip)
+            for rect, width, colour in outlines:
+                pygame.draw.rect(self.screen, colour, rect, width)
+                updates.extend(_outline_strips(rect, width))
+            self._outlines = outlines
+
+        text = self._get_display_text()
+        if text != self._text:
+            self._render_text(text)
+            self._text = text
+            updates.append(pygame.Rect(0, treemap_size[1], self.width,
+                                       self.font_height))
 
         # This must be called *after* all other pygame functions have run.
-        pygame.display.flip()
+        if updates:
+            pygame.display.update(updates)
+
+    def _render_text(self, text: str) -> None:
+        """Render <text> at the bottom of the display.
 
-    def _render_text(self) -> None:
-        """Render text at the bottom of the display.
+        The font is only loaded once, and the surface of the last text
+        rendered is drawn again while the text stays the same.
         """
-        # The font we want to use
-        font = pygame.font.SysFont('Consolas', self.font_height - 8)
-        text_surface = font.render(self._get_display_text(), True, pygame.Color('white'))
+        pygame.draw.rect(self.screen, pygame.Color('black'),
+                         (0, self.height - self.font_height, self.width, self.font_height))
+
+        if self._text_surface is None or self._text_surface[0] != text:
+            # The font we want to use
+            if self._font is None:
+                self._font = pygame.font.SysFont('Consolas', self.font_height - 8)
+            self._text_surface = \
+                (text, self._font.render(text, True, pygame.Color('white')))
+        text_surface = self._text_surface[1]
 
         # Where to render the text_surface
         text_pos = (0, self.height - self.font_height + 4)
@@ -119,98 +301,344 @@ class Visualiser:
         the next event, determines the event's type, and then updates the state
         of the visualisation or the tree itself, updating the display if necessary.
         This loop ends only when the user closes the window.
+
+        While no scan is running, the loop sleeps until the next event arrives
+        instead of polling. All the events waiting in the queue are handled
+        together, so that a burst of mouse motion only looks up the hovered
+        leaf once, and only if the pointer left the rectangle of the leaf it
+        was on or the treemap was laid out again. Events that cannot change
+        the tree or the selection, such as focus changes, are skipped. The
+        display is drawn again only when something on it changed, and at
+        most frame_rate times per second.
         """
         selected_node = self.tree
+        self.selected_node = selected_node
+        self.hover_node = None
+        # Whether the display may differ from what is on the screen
+        pending = True
+        last_frame = 0.0
 
         while True:
-            # Wait for an event
-            event = pygame.event.poll()
-            if event.type == pygame.QUIT:
-                return
-
-            if event.type == pygame.VIDEORESIZE:
-                self.width = int(event.w) if event.w else self.width
-                self.height = int(event.h) if event.h else self.height
-                self.run_visualisation(self.tree)
-                return
-
-            # get the hover position and the corresponding node
-            hover_node = self.tree.get_tree_at_position(pygame.mouse.get_pos())
-
-            if event.type == pygame.MOUSEBUTTONUP:
-                selected_node = \
-                    self._handle_click(event.button, event.pos, selected_node)
-
-            elif event.type == pygame.KEYUP and selected_node is not None:
-                drawable_height = self.height - self.font_height
-                k = event.key
-                if k == pygame.K_UP:
-                    selected_node.change_size(0.01)
-                    self.tree.update_data_sizes()
-                    self.tree.update_rectangles((0, 0, self.width, drawable_height))
-
-                elif k == pygame.K_DOWN:
-                    selected_node.change_size(-0.01)
-                    self.tree.update_data_sizes()
-                    self.tree.update_rectangles((0, 0, self.width, drawable_height))
-
-                elif k == pygame.K_DELETE or platform == 'darwin' and k == pygame.K_BACKSPACE:
-                    if selected_node.delete_self():
-                        self.tree.update_data_sizes()
-                        self.tree.update_rectangles((0, 0, self.width, drawable_height))
-                        selected_node = None
-
-                elif k == pygame.K_m:
-                    selected_node.move(hover_node)
-                    self.tree.update_data_sizes()
-                    self.tree.update_rectangles((0, 0, self.width, drawable_height))
-                    selected_node = hover_node
-
-                elif k == pygame.K_v:
-                    selected_node.copy_paste(hover_node)
-                    self.tree.update_data_sizes()
-                    self.tree.update_rectangles((0, 0, self.width, drawable_height))
-                    selected_node = hover_node
-
-                elif k == pygame.K_e:
-                    selected_node.expand()
-                    selected_node = None
+            # Whether the tree or the selection changed
+            changed = self.scan is not None
+            if changed:
+                self._advance_scan()
+                events = pygame.event.get()
+            elif pending:
+                # Wake up in time to draw the next frame
+                wait = last_frame + 1 / self.frame_rate - time.monotonic()
+                events = [pygame.event.wait(max(int(wait * 1000), 1))]
+                events.extend(pygame.event.get())
+            else:
+                events = [pygame.event.wait()]
+                events.extend(pygame.event.get())
 
-                elif k == pygame.K_a:
-                    selected_node.expand_all()
-                    selected_node = None
+            for event in events:
+                if event.type == pygame.QUIT:
+                    return
 
-                elif k == pygame.K_d:
-                    selected_node.duplicate()
-                    self.tree.update_data_sizes()
-                    self.tree.update_rectangles((0, 0, self.width, drawable_height))
+                if event.type == pygame.VIDEORESIZE:
+                    self.width = int(event.w) if event.w else self.width
+                    self.height = int(event.h) if event.h else self.height
+                    self.run_visualisation(self.tree)
+                    return
 
-                    selected_node = None
+                # Only clicks, released keys and the keys typed into a
+                # pattern change the tree or the selection
+                if event.type not in (pygame.MOUSEBUTTONUP, pygame.KEYUP) \
+                        and not (event.type == pygame.KEYDOWN
+                                 and self.filter_text is not None):
+                    continue
+
+                # get the hover position and the corresponding node, again
+                # if an earlier event laid the treemap out
+                self._update_hover(self._relaid)
+                self._relaid = False
+                hover_node = self.hover_node
+                changed = True
+
+                if self.filter_text is not None:
+                    # Keys only edit the pattern until it is applied
+                    if event.type == pygame.KEYDOWN:
+                        selected_node = self._type_filter(event, selected_node)
+                        self.selected_node = selected_node
+                    continue
+
+                if event.type == pygame.MOUSEBUTTONUP:
+                    selected_node = \
+                        self._handle_click(event.button, event.pos, selected_node)
+
+                elif event.type == pygame.KEYUP and selected_node is not None \
+                        and not (self.scan is not None and event.key in EDIT_KEYS):
+                    k = event.key
+                    if k == pygame.K_UP:
+                        selected_node.change_size(0.01)
+                        self._lay_out_changes()
+
+                    elif k == pygame.K_DOWN:
+                        selected_node.change_size(-0.01)
+                        self._lay_out_changes()
+
+                    elif k == pygame.K_DELETE or platform == 'darwin' and k == pygame.K_BACKSPACE:
+                        if selected_node.delete_self():
+                            self._lay_out_changes()
+                            selected_node = None
+
+                    elif k == pygame.K_m:
+                        selected_node.move(hover_node)
+                        self._lay_out_changes()
+                        selected_node = hover_node
+
+                    elif k == pygame.K_v:
+                        selected_node.copy_paste(hover_node)
+                        self._lay_out_changes()
+                        selected_node = hover_node
+
+                    elif k == pygame.K_e:
+                        selected_node.expand()
+                        # Lay out any folders that were only read just now
+                        self._lay_out_changes()
+                        self._damage.append(selected_node.rect)
+                        selected_node = None
 
-                elif k == pygame.K_c:
-                    selected_node.collapse()
-                    if selected_node is not self.tree:
-                        selected_node = selected_node.get_parent()
+                    elif k == pygame.K_a:
+                        selected_node.expand_all()
+                        # Lay out any folders that were only read just now
+                        self._lay_out_changes()
+                        self._damage.append(selected_node.rect)
+                        selected_node = None
 
-                elif k == pygame.K_x:
-                    selected_node.collapse_all()
-                    selected_node = self.tree
+                    elif k == pygame.K_d:
+                        selected_node.duplicate()
+                        self._lay_out_changes()
 
-                elif k == pygame.K_q and selected_node is not self.tree:
-                    self.run_visualisation(selected_node)
-                    return
+                        selected_node = None
 
-            if event.type == pygame.KEYUP and event.key == pygame.K_b:
-                if self.tree.get_parent():
-                    self.tree.get_parent().collapse_all()
-                    self.run_visualisation(self.tree.get_parent())
-                    return
+                    elif k == pygame.K_f:
+                        self.filter_text = ''
+
+                    elif k == pygame.K_c:
+                        selected_node.collapse()
+                        self._relaid = True
+                        if selected_node is not self.tree:
+                            selected_node = selected_node.get_parent()
+                            self._damage.append(selected_node.rect)
+
+                    elif k == pygame.K_x:
+                        selected_node.collapse_all()
+                        self._relaid = True
+                        selected_node = self.tree
+                        self._damage.append(self.tree.rect)
+
+                    elif k == pygame.K_q and selected_node is not self.tree:
+                        self.run_visualisation(selected_node)
+                        return
+
+                if event.type == pygame.KEYUP and event.key == pygame.K_r \
+                        and self.scan is None and isinstance(self.tree, FileSystemTree):
+                    if self.tree.refresh():
+                        self._lay_out_changes()
+                        # The rescan may have dropped the selected or hovered
+                        # trees
+                        selected_node = self.tree
+                        self._update_hover(True)
+                        self._relaid = False
+                        hover_node = self.hover_node
+
+                if event.type == pygame.KEYUP and event.key == pygame.K_n \
+                        and self.scan is None:
+                    if self.highlighted:
+                        self.highlighted = []
+                    else:
+                        self._highlight_largest(selected_node or self.tree)
+
+                if event.type == pygame.KEYUP and event.key == pygame.K_t \
+                        and self.scan is None and isinstance(self.tree, FileSystemTree):
+                    self._colour_by_extension()
+
+                if event.type == pygame.KEYUP and event.key == pygame.K_h \
+                        and self.scan is None and isinstance(self.tree, FileSystemTree):
+                    self._colour_by_duplicates()
+
+                if event.type == pygame.KEYUP and self.scan is None \
+                        and event.key in (pygame.K_z, pygame.K_y):
+                    if event.key == pygame.K_z:
+                        replayed = self.journal.undo()
+                    else:
+                        replayed = self.journal.redo()
+                    if replayed:
+                        self._lay_out_changes()
+                        selected_node = None
 
-            self.selected_node = selected_node
-            self.hover_node = hover_node
+                if event.type == pygame.KEYUP and event.key == pygame.K_l:
+                    self.min_area = 0 if self.min_area else LOD_AREA
+                    self._relaid = True
+                    self._treemap = None
+
+                if event.type == pygame.KEYUP and event.key == pygame.K_s:
+                    if isinstance(self.layout, SquarifiedLayout):
+                        self.layout = SliceAndDiceLayout()
+                    else:
+                        self.layout = SquarifiedLayout()
+                    self.tree.update_rectangles(
+                        (0, 0, self.width, self.height - self.font_height), self.layout)
+                    self._relaid = True
+                    self._treemap = None
+
+                if event.type == pygame.KEYUP and event.key == pygame.K_b:
+                    if self.tree.get_parent():
+                        self.tree.get_parent().collapse_all()
+                        self.run_visualisation(self.tree.get_parent())
+                        return
+
+                self.selected_node = selected_node
+
+            # The treemap may have changed under a pointer that did not move
+            hover_node = self.hover_node
+            self._update_hover(self._relaid)
+            self._relaid = False
+            if changed or self.hover_node is not hover_node:
+                pending = True
 
             # Update display
-            self.render_display()
+            now = time.monotonic()
+            if pending and now - last_frame >= 1 / self.frame_rate:
+                self.render_display()
+                last_frame = now
+                pending = False
+
+    def _update_hover(self, changed: bool) -> None:
+        """Find the leaf under the mouse pointer again, unless the pointer is
+        still inside the rectangle of the hovered leaf and the treemap has not
+        <changed> since it was found.
+        """
+        pos = pygame.mouse.get_pos()
+        if changed or self.hover_node is None \
+                or not _contains(self.hover_node.rect, pos):
+            self.hover_node = self.tree.get_tree_at_position(pos, self.min_area)
+
+    def _type_filter(self, event: pygame.event.Event,
+                     folder: TMTree) -> Optional[TMTree]:
+        """Add the character typed in the key press <event> to the filter
+        pattern, and return the new selection.
+
+        Enter deletes every file under <folder> whose name matches the
+        pattern in one batch, laid out once, and Escape drops the pattern.
+        """
+        if event.key == pygame.K_ESCAPE:
+            self.filter_text = None
+        elif event.key in (pygame.K_RETURN, pygame.K_KP_ENTER):
+            pattern = self.filter_text
+            self.filter_text = None
+            if pattern and folder.edit_many(delete=folder.find_leaves(pattern)):
+                self._lay_out_changes()
+                return None
+        elif event.key == pygame.K_BACKSPACE:
+            self.filter_text = self.filter_text[:-1]
+        elif event.unicode.isprintable():
+            self.filter_text += event.unicode
+        return folder
+
+    def _highlight_largest(self, folder: TMTree) -> None:
+        """Outline the HIGHLIGHT_COUNT largest files under <folder>, expanding
+        the folders they are in so that they are shown.
+        """
+        leaves = folder.largest(HIGHLIGHT_COUNT)
+        for leaf in leaves:
+            leaf.get_parent().expand()
+        self._lay_out_changes()
+        self._damage.append(self.tree.rect)
+        self.highlighted = leaves
+
+    def _colour_by_extension(self) -> None:
+        """Colour every file by its extension, giving each of the extensions
+        with the most bytes in the display a colour of its own, or give the
+        files their own colours back if they are coloured by extension.
+
+        The extensions are ranked by the extension totals of the displayed
+        tree, so no file is visited.
+        """
+        if self.extension_colours is not None:
+            self.extension_colours = None
+        else:
+            self.duplicates = None
+            self._largest_extensions = {}
+            totals = self.tree.get_extensions()
+            largest = sorted(totals, key=lambda extension: totals[extension][0],
+                             reverse=True)
+            self.extension_colours = dict(zip(largest, EXTENSION_COLOURS))
+        self._treemap = None
+
+    def _colour_by_duplicates(self) -> None:
+        """Find the duplicate files in the display and colour every file and
+        folder by the fraction of its bytes that are extra copies, or give
+        them their own colours back if they are coloured that way.
+        """
+        if self.duplicates is not None:
+            self.duplicates = None
+        else:
+            self.extension_colours = None
+            # The window does not respond while the files are hashed
+            self._render_text('Finding duplicate files...')
+            pygame.display.update(pygame.Rect(
+                0, self.height - self.font_height, self.width,
+                self.font_height))
+            self._text = None
+            self.duplicates = find_duplicates(self.tree)
+        self._treemap = None
+
+    def _get_heat_colour(self, tree: TMTree) -> tuple[int, int, int]:
+        """Return a colour between COLD_COLOUR and HOT_COLOUR for the fraction
+        of the bytes under <tree> that are extra copies of duplicate files.
+        """
+        heat = self.duplicates.get_heat(tree)
+        return tuple(round(cold + (hot - cold) * heat)
+                     for cold, hot in zip(COLD_COLOUR, HOT_COLOUR))
+
+    def _get_extension_colour(self, tree: FileSystemTree) \
+            -> tuple[int, int, int]:
+        """Return the colour of the extension with the most bytes under <tree>,
+        which is its own extension if it is a file.
+        """
+        totals = tree._get_extension_counts()
+        if len(totals) > 1:
+            extension = self._largest_extensions.get(tree)
+            if extension is None:
+                extension = max(totals, key=lambda name: totals[name][0])
+                self._largest_extensions[tree] = extension
+        elif totals:
+            extension = next(iter(totals))
+        else:
+            return OTHER_COLOUR
+        return self.extension_colours.get(extension, OTHER_COLOUR)
+
+    def _advance_scan(self) -> None:
+        """Read the next batch of folders of the running scan, and lay out the
+        treemap again if enough time has passed or the scan is done.
+        """
+        self.progress = next(self.scan)
+        now = time.monotonic()
+        if self.progress.done or now - self._last_layout >= self.layout_interval:
+            self._lay_out_changes()
+            self._last_layout = now
+        if self.progress.done:
+            self.scan = None
+            self.tree.update_colours_and_depths()
+            # Collapsed folders are drawn in their new colours
+            self._treemap = None
+
+    def _lay_out_changes(self) -> None:
+        """Lay out the parts of the treemap that changed since it was last laid
+        out, and remember the areas that must be drawn again. The highlights,
+        the count of small items and the largest extensions of the folders
+        are dropped, since the edits may have changed them.
+        """
+        self.highlighted = []
+        self._small_items = None
+        self._largest_extensions = {}
+        self._relaid = True
+        self._damage.extend(self.tree.update_dirty_rectangles(
+            (0, 0, self.width, self.height - self.font_height), self.layout))
 
     def _handle_click(self, button: int, pos: tuple[int, int],
                       old_selected_leaf: Optional[TMTree]) -> Optional[TMTree]:
@@ -222,7 +650,7 @@ class Visualiser:
 
         # left mouse click
         if button == 1:
-            selected_leaf = self.tree.get_tree_at_position(pos)
+            selected_leaf = self.tree.get_tree_at_position(pos, self.min_area)
             if selected_leaf is None:
                 return old_selected_leaf
             elif selected_leaf is old_selected_leaf:
@@ -234,28 +662,152 @@ class Visualiser:
             return old_selected_leaf
 
     def _get_display_text(self) -> str:
-        """Return the display text of this leaf.
+        """Return the display text of this leaf, or the progress of the scan
+        while one is running. While the display is coloured by duplicates,
+        the summary of the duplicates found is shown instead when the whole
+        display is selected.
         """
+        if self.scan is not None and self.progress is not None:
+            return self.progress.get_text()
+        if self.filter_text is not None:
+            return f'Delete files matching: {self.filter_text}'
 
         leaf = self.selected_node
+        if self.duplicates is not None and leaf in (None, self.tree):
+            reclaimable = self.duplicates.get_reclaimable(self.tree)
+            return f'{len(self.duplicates.groups)} groups of duplicate ' \
+                   f'files, {_convert_size(reclaimable)} in extra copies, ' \
+                   f'{_convert_size(self.duplicates.bytes_read)} read'
         if leaf is None:
             return ''
         else:
-            leaf_path = leaf.get_path_string()
+            if leaf.is_culled(self.min_area):
+                suffix = f' ({self._count_small_items(leaf)} small items)'
+            else:
+                suffix = leaf.get_suffix()
+            leaf_path = _shorten_path(leaf.get_path_string(),
+                                      leaf.get_separator(),
+                                      self.width // 13 - len(suffix))
+            return leaf_path + suffix
+
+
+    def _count_small_items(self, tree: TMTree) -> int:
+        """Return the number of rectangles drawn as the culled <tree>.
+
+        The count walks the whole of <tree>, so it is kept until another
+        tree is counted, <tree> is laid out again or the tree is edited.
+        """
+        key = (tree, tree.rect, self.min_area)
+        if self._small_items is None or self._small_items[:3] != key:
+            count = len(tree.get_rectangle_buffers()[1]) // 3
+            self._small_items = key + (count,)
+        return self._small_items[3]
 
-            while len(leaf_path + leaf.get_suffix()) > self.width // 13:
-                components = leaf_path.split(leaf.get_separator())
-                longest = max(len(s) for s in components)
-                if longest <= 3:
-                    break
-                components = [i[:-3] + '..' if len(i) == longest
-                              else i for i in components]
-                leaf_path = leaf.get_separator().join(components)
-            return leaf_path + leaf.get_suffix()
+
+def _contains(rect: tuple[int, int, int, int], pos: tuple[int, int]) -> bool:
+    """Return whether <pos> is in <rect>, by the same rule as
+    TMTree.get_tree_at_position.
+    """
+    x, y, width, height = rect
+    return x < pos[0] <= x + width and y < pos[1] <= y + height
+
+
+def _draw_treemap(surface: pygame.Surface, tree: TMTree,
+                  area: pygame.Rect, min_area: int = 0,
+                  colour_of: Optional[Callable] = None) -> None:
+    """Draw the leaves of <tree> that overlap <area> into <surface>, clipped
+    to <area>, drawing each subtree smaller than <min_area> pixels as one
+    rectangle. If <colour_of> is given, each leaf is drawn in
+    colour_of(leaf) instead of its own colour.
+    """
+    subscreen = surface.subsurface(area)
+    subscreen.fill(pygame.Color('black'))
+    if render_rectangles is not None:
+        rects, colours = get_rectangle_arrays(tree, tuple(area), min_area,
+                                              colour_of)
+        rects = rects - (area.x, area.y, 0, 0)
+        image = render_rectangles(rects, colours, area.width, area.height)
+        # pygame indexes pixels by column first
+        pygame.surfarray.blit_array(subscreen, image.transpose(1, 0, 2))
+    else:
+        rects, colours = tree.get_rectangle_buffers(tuple(area), min_area,
+                                                    colour_of)
+        for i in range(len(rects) // 4):
+            x, y, width, height = rects[4 * i:4 * i + 4]
+            # Note that the arguments are in the opposite order
+            pygame.draw.rect(subscreen, colours[3 * i:3 * i + 3],
+                             (x - area.x, y - area.y, width, height))
 
 
-def run_treemap_file_system(path: str) -> None:
+def _shorten_path(path: str, separator: str, room: int) -> str:
+    """Return <path> with its longest components cut short and ended with
+    '..' until it is at most <room> characters long, or no component is
+    longer than 3 characters.
+
+    Cutting every longest component by one character at a time until the
+    path fits ends with every component longer than some length cut down to
+    that length, so the length is found first and each component is cut
+    only once.
+    """
+    excess = len(path) - room
+    if excess <= 0:
+        return path
+    components = path.split(separator)
+    lengths = sorted((len(component) for component in components),
+                     reverse=True)
+    level = lengths[0]
+    # The number of components at least <level> characters long
+    longest = 0
+    while excess > 0 and level > 3:
+        while longest < len(lengths) and lengths[longest] >= level:
+            longest += 1
+        level -= 1
+        excess -= longest
+    return separator.join(component[:level - 2] + '..'
+                          if len(component) > level else component
+                          for component in components)
+
+
+def _outline_strips(rect: tuple[int, int, int, int],
+                    width: int) -> list[pygame.Rect]:
+    """Return the four strips covered by an outline of the given width drawn
+    just inside <rect> by pygame.draw.rect.
+    """
+    x, y, w, h = rect
+    return [pygame.Rect(x, y, w, width),
+            pygame.Rect(x, y + h - width, w, width),
+            pygame.Rect(x, y, width, h),
+            pygame.Rect(x + w - width, y, width, h)]
+
+
+def run_treemap_file_system(path: str,
+                            snapshot_path: Optional[str] = None,
+                            lazy: bool = False,
+                            compact: bool = False,
+                            progressive: bool = False,
+                            squarified: bool = False,
+                            sharded: bool = False) -> None:
     """Run a treemap visualisation for the given path's file structure.
+
+    If <snapshot_path> names an existing snapshot file of <path>, the tree is
+    loaded from it instead of scanning <path>. Otherwise, if <lazy> is True, the
+    entries of each folder are only read once the folder is expanded.
+    Otherwise the whole path is scanned and, if <snapshot_path> is given,
+    the tree is saved there so that the next run can load it.
+
+    If <compact> is True, the tree is kept in an array-backed CompactTree
+    instead, loaded from the snapshot if there is one. It uses far less memory
+    but files cannot be moved or copied.
+
+    If <progressive> is True and the tree is scanned, the treemap is shown
+    straight away and fills in while the scan runs.
+
+    If <squarified> is True, the treemap starts with the squarified layout
+    instead of slice-and-dice.
+
+    If <sharded> is True and the tree is scanned in full, every folder
+    directly in <path> is scanned by a separate process.
+
     Precondition: <path> is a valid path to a file or folder.
     """
     instructions = '\n==== Instructions for use ====\n' \
@@ -270,16 +822,104 @@ def run_treemap_file_system(path: str) -> None:
                    '"M" to move a file (while selecting a file and hovering over a folder)\n' \
                    '"Del" to delete a file or folder from the visualization\n' \
                    '"D" to duplicate a file\n' \
+                   '"F" to type a pattern such as *.log, and Enter to delete the matching files in the folder\n' \
                    '"V" to duplicate a copy and paste a file (while selecting a file and hovering over a folder)\n' \
+                   '"R" to rescan the folders that changed on disk\n' \
+                   '"Z" to undo the last edit, and "Y" to redo it\n' \
+                   '"N" to outline the largest files in the folder, or in the display\n' \
+                   '"T" to colour the files by extension, or in their own colours again\n' \
+                   '"H" to colour the files and folders by how much of them is duplicate copies\n' \
+                   '"S" to switch between the slice-and-dice and squarified layouts\n' \
+                   '"L" to draw tiny folders as one rectangle, or every file again\n' \
                    '(Drag window to resize)'
 
-    file_tree = FileSystemTree(path)
+    if squarified:
+        visualizer.layout = SquarifiedLayout()
+
+    # A snapshot of another folder is scanned over, as if there were none
+    has_snapshot = snapshot_path is not None \
+        and os.path.exists(snapshot_path) \
+        and os.path.abspath(get_snapshot_root(snapshot_path)) \
+        == os.path.abspath(path)
+    if compact and has_snapshot:
+        file_tree = CompactTree.from_snapshot(snapshot_path).root()
+    elif compact:
+        file_tree = CompactTree.from_scan(path).root()
+    elif has_snapshot:
+        file_tree = load_snapshot(snapshot_path)
+    elif lazy:
+        file_tree = LazyFileSystemTree(path)
+    elif progressive:
+        scan = iter_scan(path)
+        progress = next(scan)
+        print(instructions)
+        visualizer.run_visualisation(progress.tree,
+                                     None if progress.done else scan)
+        return
+    else:
+        file_tree = scan_sharded(path) if sharded else scan_file_system(path)
+        if snapshot_path is not None:
+            save_snapshot(file_tree, snapshot_path)
     print(instructions)
     visualizer.run_visualisation(file_tree)
 
 
+def export_treemap(path: str, image_path: str,
+                   size: tuple[int, int] = (1200, 700),
+                   squarified: bool = False) -> None:
+    """Scan the given path and save an image of its fully expanded treemap,
+    <size> pixels wide and high, to <image_path>.
+
+    No window is opened: the treemap is drawn into an off-screen surface. The
+    image is saved as a binary PPM file if <image_path> ends in .ppm, and in
+    any other format pygame.image.save supports, such as PNG, otherwise.
+
+    Precondition: <path> is a valid path to a file or folder.
+    """
+    tree = scan_file_system(path)
+    tree.expand_all()
+    layout = SquarifiedLayout() if squarified else SliceAndDiceLayout()
+    tree.update_rectangles((0, 0) + size, layout)
+    tree.update_colours_and_depths()
+    surface = pygame.Surface(size)
+    _draw_treemap(surface, tree, surface.get_rect())
+    if image_path.lower().endswith('.ppm'):
+        with open(image_path, 'wb') as file:
+            file.write(f'P6\n{size[0]} {size[1]}\n255\n'.encode('ascii'))
+            file.write(pygame.image.tobytes(surface, 'RGB'))
+    else:
+        pygame.image.save(surface, image_path)
+
+
+def export_treemaps(paths: list[str], folder: str, image_format: str = 'png',
+                    size: tuple[int, int] = (1200, 700),
+                    squarified: bool = False,
+                    workers: Optional[int] = None) -> list[str]:
+    """Save an image of the treemap of each of the given paths into <folder>
+    with export_treemap, and return the paths of the images.
+
+    The trees are scanned and drawn in a pool of <workers> processes, one per
+    CPU by default. The number of trees exported per minute is printed once
+    all of them are done.
+
+    Precondition: every path in <paths> is a valid path to a file or folder.
+    """
+    image_paths = []
+    for i, path in enumerate(paths):
+        name = os.path.basename(os.path.normpath(path))
+        image_paths.append(os.path.join(folder, f'{i}-{name}.{image_format}'))
+
+    start = time.monotonic()
+    with ProcessPoolExecutor(workers) as executor:
+        # Collect the results so that any error in a worker is raised here
+        list(executor.map(export_treemap, paths, image_paths,
+                          repeat(size), repeat(squarified)))
+    elapsed = time.monotonic() - start
+    print(f'Exported {len(paths)} treemaps in {elapsed:.1f}s, '
+          f'{len(paths) / elapsed * 60:.0f} trees per minute')
+    return image_paths
+
 
-import os
 if __name__ == '__main__':
     visualizer = Visualiser()
     PATH_TO_VISUALISE = os.path.join(os.getcwd(), 'example-directory', 'workshop')